@@ -0,0 +1,186 @@
+# -*- coding: utf-8
+"""
+Throughput benchmarks for wharfee output pipelines. Run from the
+repository root, as "python -m scripts.benchmarks".
+
+Usage:
+    benchmarks.py exec [--size=<mb>] [--chunk=<bytes>] [--container=<name>]
+    benchmarks.py batch [--commands=<n>] [--latency=<ms>] [--concurrent=<n>]
+
+-h --help           Show this help
+--size=<mb>         Megabytes of output to push through [default: 64]
+--chunk=<bytes>     Size of frames in synthetic stream [default: 4093]
+--container=<name>  Also exec in this running container, which needs
+                    "head" and "base64"
+--commands=<n>      Number of commands to run in batch mode [default: 500]
+--latency=<ms>      Fake daemon response time [default: 2]
+--concurrent=<n>    Commands to run at once in concurrent batch [default: 8]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import struct
+
+from docopt import docopt
+from mock import patch, MagicMock
+
+from wharfee.client import DockerClient
+from wharfee.formatter import DemuxStreamWriter, StreamFormatter
+from wharfee.streams import read_frames, STDOUT, STDERR
+
+
+usage = __doc__
+
+
+def synthetic_frames(size, chunk):
+    """
+    Multiplexed stream of mostly stdout with some stderr. Text has
+    multibyte characters, and the odd chunk size splits them between frames.
+    :param size: int: total bytes
+    :param chunk: int: frame size
+    :return: bytes
+    """
+    line = u'строка of log output, with a little unicode: ✓\n'.encode('utf-8')
+    text = line * (size // len(line) + 1)
+    frames = []
+    for i, offset in enumerate(range(0, size, chunk)):
+        data = text[offset:offset + chunk]
+        stream = STDERR if i % 10 == 9 else STDOUT
+        frames.append(struct.pack('>BxxxL', stream, len(data)) + data)
+    return b''.join(frames)
+
+
+def frames_from(data):
+    """
+    Read frames back from the multiplexed stream.
+    :param data: bytes
+    :return: generator of (int, bytes)
+    """
+    view = memoryview(data)
+    position = [0]
+
+    def read(n):
+        chunk = view[position[0]:position[0] + n]
+        position[0] += len(chunk)
+        return chunk.tobytes()
+
+    return read_frames(read)
+
+
+def decode_per_chunk(frames):
+    """
+    How exec output used to be written: every chunk decoded on its own and
+    echoed as a line.
+    """
+    StreamFormatter(
+        chunk.decode('utf-8', errors='replace') for _, chunk in frames
+    ).output()
+
+
+def measure(name, size, func, unit='MB/s'):
+    """
+    Run func with stdout and stderr sent to /dev/null, print throughput.
+    :param size: int: bytes for MB/s, or number of items
+    """
+    with open(os.devnull, 'w') as devnull:
+        with patch('sys.stdout', devnull), patch('sys.stderr', devnull):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+    if unit == 'MB/s':
+        size = size / 1024.0 / 1024
+    print('{0:<32} {1:8.1f} {2}'.format(name, size / elapsed, unit))
+
+
+def benchmark_exec(size, chunk, container=None):
+    """
+    Compare ways to write exec output.
+    """
+    data = synthetic_frames(size, chunk)
+
+    measure('synthetic, decode per chunk', size,
+            lambda: decode_per_chunk(frames_from(data)))
+    measure('synthetic, incremental decode', size,
+            lambda: DemuxStreamWriter(frames_from(data), raw=False).output())
+    measure('synthetic, raw bytes', size,
+            lambda: DemuxStreamWriter(frames_from(data), raw=True).output())
+
+    if container:
+        client = DockerClient(clear_handler=lambda: None,
+                              refresh_handler=lambda: None)
+        command = 'sh -c "head -c {0} /dev/zero | base64"'.format(
+            size * 3 // 4)
+        for name, raw in [('docker exec, incremental decode', False),
+                          ('docker exec, raw bytes', True)]:
+            def run():
+                client.handle_input('exec {0} {1}'.format(container, command))
+                DemuxStreamWriter(client.output, raw=raw).output()
+            measure(name, size, run)
+
+
+def fake_daemon(latency):
+    """
+    API client that answers every listing after a delay.
+    :param latency: float: seconds
+    :return: MagicMock
+    """
+    def respond(result):
+        def call(*_, **__):
+            time.sleep(latency)
+            return result
+        return call
+
+    instance = MagicMock()
+    instance.containers.side_effect = respond([
+        {'Id': '{0:064x}'.format(i), 'Names': ['/c{0}'.format(i)],
+         'Image': 'busybox', 'Command': 'sh', 'Created': 1,
+         'Ports': [], 'Status': 'Up'} for i in range(20)])
+    instance.images.side_effect = respond([
+        {'Id': 'sha256:{0:064x}'.format(i), 'RepoTags': ['img:{0}'.format(i)],
+         'Created': 1, 'Size': 1024} for i in range(20)])
+    instance.volumes.side_effect = respond({'Volumes': [
+        {'Name': 'v{0}'.format(i), 'Driver': 'local'} for i in range(20)]})
+    return instance
+
+
+def benchmark_batch(count, latency, concurrent):
+    """
+    Commands per second in batch mode, against process per command.
+    """
+    from wharfee.main import WharfeeCli
+
+    commands = ['ps', 'images', 'volume ls', 'ps -a'] * (count // 4)
+
+    runs = 10
+    started = time.perf_counter()
+    for _ in range(runs):
+        subprocess.check_call([sys.executable, '-c', 'import wharfee.main'])
+    elapsed = (time.perf_counter() - started) / runs
+    print('{0:<32} {1:8.1f} commands/s'.format(
+        'process per command (import)', 1 / elapsed))
+
+    with tempfile.TemporaryDirectory() as home, \
+            patch.dict(os.environ, {'HOME': home}), \
+            patch('wharfee.client.DockerAPIClient') as api:
+        api.return_value = fake_daemon(latency)
+        cli = WharfeeCli(no_completion=True)
+
+        for name, workers in [('batch', 1),
+                              ('batch, concurrent', concurrent)]:
+            def run():
+                cli.run_batch(commands, workers)
+            measure(name, len(commands), run, 'commands/s')
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    if args['exec']:
+        benchmark_exec(int(args['--size']) * 1024 * 1024,
+                       int(args['--chunk']),
+                       args['--container'])
+    elif args['batch']:
+        benchmark_batch(int(args['--commands']),
+                        float(args['--latency']) / 1000,
+                        int(args['--concurrent']))
@@ -22,7 +22,6 @@ setup(
         'py-pretty>=0.1',
         'configobj>=5.0.6',
         'pexpect>=3.3',
-        'fuzzyfinder>=1.0.0',
         'ruamel.yaml>=0.15.72',
     ],
     extras_require={
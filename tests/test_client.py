@@ -32,3 +32,490 @@ def test_invalid_version(mock_volumes):
         assert mock_instance.volumes.called
         assert result is None
 
+
+def test_stop_parallel_with_errors(client):
+    """
+    Targets are processed concurrently, and failures are summarized.
+    """
+    from docker.errors import APIError
+
+    def stop(container, **_):
+        if container == 'bad':
+            raise APIError('boo', explanation='No such container: bad')
+
+    client.instance.stop = Mock(side_effect=stop)
+    result = list(client.stop('one', 'bad', 'two', parallel=3))
+
+    assert client.instance.stop.call_count == 3
+    assert set(result[:3]) == set(['one', 'two', 'bad: No such container: bad'])
+    assert result[3:] == ['Failed: 1 of 3.', '  bad: No such container: bad']
+    assert client.is_refresh_running
+
+
+def test_rm_parallel_ordered(client):
+    """
+    In ordered mode, output follows the order of the arguments.
+    """
+    from time import sleep
+
+    def remove(container, **_):
+        sleep(0.05 if container == 'first' else 0)
+
+    client.instance.remove_container = Mock(side_effect=remove)
+    result = list(client.rm('first', 'second', parallel=2, ordered=True))
+
+    assert result == ['first', 'second', 'Removed: 2 container(s).']
+
+
+def test_inspect_without_listing(client):
+    """
+    Inspect goes straight to the API, falls back from container to image,
+    and does not list containers or images.
+    """
+    from docker.errors import NotFound
+
+    client.instance.inspect_container = Mock(side_effect=NotFound('boo'))
+    client.instance.inspect_image = Mock(return_value={'Id': 'sha256:abcdef'})
+
+    result = list(client.inspect('ubuntu'))
+
+    assert result == [{'Id': 'sha256:abcdef'}]
+    assert not client.instance.containers.called
+    assert not client.instance.images.called
+
+    # Now that we know it's an image, no need to try a container first.
+    client.instance.inspect_container.reset_mock()
+    list(client.inspect('ubuntu'))
+    assert not client.instance.inspect_container.called
+
+
+def test_inspect_not_found_is_cached(client):
+    """
+    Names that are neither containers nor images are not looked up again
+    right away.
+    """
+    from docker.errors import NotFound
+
+    client.instance.inspect_container = Mock(side_effect=NotFound('boo'))
+    client.instance.inspect_image = Mock(side_effect=NotFound('boo'))
+
+    assert list(client.inspect('nope')) == ['Container or image not found: nope.']
+    assert list(client.inspect('nope')) == ['Container or image not found: nope.']
+    assert client.instance.inspect_container.call_count == 1
+
+
+def test_resolver_id_prefix():
+    """
+    Unique ID prefixes resolve to their kind, ambiguous ones don't.
+    """
+    from wharfee.resolver import ObjectResolver, CONTAINER, IMAGE
+
+    resolver = ObjectResolver()
+    resolver.remember(CONTAINER, ['boo'], ['abc123', 'abd456'])
+    resolver.remember(IMAGE, ['ubuntu:latest'], ['sha256:abe789'])
+
+    assert resolver.kind_of('boo') == CONTAINER
+    assert resolver.kind_of('abc') == CONTAINER
+    assert resolver.kind_of('abe7') == IMAGE
+    assert resolver.kind_of('sha256:abe') == IMAGE
+    assert resolver.kind_of('ab') is None
+
+
+def test_listings_return_records(client):
+    """
+    Containers and images come back as records, one image per repo tag.
+    """
+    client.instance.containers.return_value = [
+        {'Id': 'abc', 'Names': ['/boo'], 'Image': 'busybox',
+         'Created': 1, 'Status': 'Up'}]
+    client.instance.images.return_value = [
+        {'Id': 'sha256:def', 'RepoTags': ['busybox:latest', 'busybox:1'],
+         'Created': 1, 'Size': 1024}]
+
+    containers = client.containers()
+    assert containers[0].names == ['boo']
+    assert containers[0]['Image'] == 'busybox'
+
+    images = client.images()
+    assert [im.repo_tag for im in images] == ['busybox:latest', 'busybox:1']
+    assert images[0].size == '1.0 KB'
+    assert client.resolver.kind_of('busybox:1') == 'image'
+
+
+def test_logs_stream_frames(client):
+    """
+    Logs are requested as a stream and come back as demultiplexed frames.
+    """
+    client.instance.inspect_container.return_value = {'Config': {'Tty': False}}
+    response = MagicMock()
+    response.raw.read.side_effect = [
+        b'\x02\x00\x00\x00\x00\x00\x00\x04', b'err\n', b'']
+    client.instance._get.return_value = response
+
+    result = client.logs('foo', tail='10', follow=True)
+    assert list(result) == [(2, b'err\n')]
+    assert response.close.called
+
+    params = client.instance._get.call_args[1]['params']
+    assert params['tail'] == '10'
+    assert params['follow'] == 1
+    assert client.instance._disable_socket_timeout.call_count == 1
+    assert client.logs('foo', tail='ten') == ['Invalid --tail value: ten.']
+
+    response.raw.read.side_effect = [b'']
+    assert list(client.logs('foo')) == []
+    assert client.instance._disable_socket_timeout.call_count == 1
+
+
+@patch('wharfee.client.RAW_LOGS_VERSIONS', ())
+def test_logs_public_api_fallback(client):
+    """
+    With an untested docker-py version, logs go through the public API.
+    """
+    stream = MagicMock()
+    stream.__iter__.return_value = iter([b'out\n', b'err\n'])
+    client.instance.logs.return_value = stream
+
+    result = client.logs('foo', tail='10', since='1.5', follow=True)
+    assert list(result) == [(1, b'out\n'), (1, b'err\n')]
+    assert stream.close.called
+    assert not client.instance._get.called
+
+    kwargs = client.instance.logs.call_args[1]
+    assert kwargs['tail'] == 10
+    assert kwargs['since'] == 1.5
+    assert kwargs['follow'] is True
+
+
+def test_exec_streams_demultiplexed_output(client):
+    """
+    Exec output comes back as stdout and stderr frames.
+    """
+    client.instance.exec_create.return_value = {'Id': 'exec1'}
+    client.instance.exec_start.return_value = iter([
+        (b'out', None), (None, b'err')])
+
+    result = client.execute('foo', 'ls', detach=False)
+    assert list(result) == [(1, b'out'), (2, b'err')]
+    assert client.instance.exec_start.call_args[1]['demux'] is True
+
+
+def test_listings_fan_out_to_hosts():
+    """
+    With several hosts, listings are merged, and a host that does not
+    respond in time is skipped and reported.
+    """
+    import time
+
+    def create(base_url=None, **_):
+        instance = MagicMock()
+        if base_url == 'tcp://slow':
+            instance.containers.side_effect = lambda **_: time.sleep(2)
+        else:
+            instance.containers.return_value = [
+                {'Id': base_url, 'Names': ['/boo'], 'Created': 1}]
+        return instance
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        mock_api.side_effect = create
+        client = DockerClient(clear_handler=Mock(), refresh_handler=Mock(),
+                              hosts={'one': 'tcp://one', 'two': 'tcp://two',
+                                     'slow': 'tcp://slow'},
+                              host_timeout=0.5)
+
+        started = time.time()
+        client.handle_input('ps')
+        assert time.time() - started < 1.5
+
+    assert [(c.host, c.id) for c in client.output] == [
+        ('one', 'tcp://one'), ('two', 'tcp://two')]
+    assert client.output[0].headers()[0] == 'Host'
+    assert client.after() == ['Host slow did not respond in 0.5 s.']
+    assert client.resolver_for('one').kind_of('boo') == 'container'
+
+
+def test_listings_time_out_on_single_host():
+    """
+    A single configured host is also given up on after host_timeout.
+    """
+    import time
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        mock_api.return_value.containers.side_effect = \
+            lambda **_: time.sleep(2)
+        client = DockerClient(clear_handler=Mock(), refresh_handler=Mock(),
+                              hosts={'slow': 'tcp://slow'},
+                              host_timeout=0.5)
+
+        started = time.time()
+        client.handle_input('ps')
+        assert time.time() - started < 1.5
+
+    assert client.after() == ['Host slow did not respond in 0.5 s.']
+
+
+def test_inspect_fans_out_to_hosts():
+    """
+    Inspect reports hosts that fail or don't respond in time, and doesn't
+    say the object is missing when a host could not be asked.
+    """
+    import time
+    from docker.errors import NotFound
+
+    def create(base_url=None, **_):
+        instance = MagicMock()
+        if base_url == 'tcp://slow':
+            instance.inspect_container.side_effect = \
+                lambda *_: time.sleep(2)
+        elif base_url == 'tcp://down':
+            instance.inspect_container.side_effect = \
+                ConnectionError('refused')
+        else:
+            instance.inspect_container.return_value = {'Id': 'foo1'}
+        instance.inspect_image.side_effect = NotFound('boo')
+        return instance
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        mock_api.side_effect = create
+        client = DockerClient(clear_handler=Mock(), refresh_handler=Mock(),
+                              hosts={'one': 'tcp://one', 'slow': 'tcp://slow'},
+                              host_timeout=0.5)
+        client.handle_input('inspect foo')
+        assert list(client.output) == [{'Host': 'one', 'Id': 'foo1'}]
+        assert client.after() == ['Host slow did not respond in 0.5 s.']
+
+        client = DockerClient(clear_handler=Mock(), refresh_handler=Mock(),
+                              hosts={'down': 'tcp://down'},
+                              host_timeout=0.5)
+        client.handle_input('inspect foo')
+        assert list(client.output) == []
+        assert client.after() == ['Host down: refused']
+
+
+def test_pull_many_merges_progress(client, tmp_path):
+    """
+    Several images are pulled concurrently into one stream, shared layers
+    are shown once.
+    """
+    from io import StringIO
+    from docker.errors import APIError
+    from wharfee.formatter import JsonStreamFormatter
+
+    def layer(layer_id, status, current=None):
+        detail = {'current': current, 'total': 100} if current else {}
+        return {'id': layer_id, 'status': status, 'progressDetail': detail}
+
+    def pull(image, **kwargs):
+        assert kwargs['stream'] and kwargs['decode']
+        if image == 'bad':
+            raise APIError('boo', explanation='pull access denied for bad')
+        return iter([
+            layer('shared', 'Pulling fs layer'),
+            layer('shared', 'Downloading', 100),
+            layer(image, 'Downloading', 100),
+            layer(image, 'Pull complete'),
+            layer('shared', 'Pull complete'),
+            {'status': 'Status: Downloaded newer image for ' + image},
+        ])
+
+    images = tmp_path / 'images.txt'
+    images.write_text(u'# warm up\nredis\n\nnginx\n')
+    client.instance.pull = Mock(side_effect=pull)
+
+    messages = list(client.pull('ubuntu', 'bad', file=str(images),
+                                parallel=4))
+
+    assert client.instance.pull.call_count == 4
+    assert messages[-1]['status'].startswith('Pulled 3 of 4 images in ')
+    assert {'error': 'pull access denied for bad', 'image': 'bad'} in messages
+
+    out = StringIO()
+    JsonStreamFormatter(messages, out, tty=False).output()
+    lines = out.getvalue().splitlines()
+    assert 'bad: pull access denied for bad' in lines
+    assert 'nginx: Status: Downloaded newer image for nginx' in lines
+    assert lines[-1].startswith('4 layers, 400.0 B in ')
+
+
+def test_build_streams_context(client, tmp_path):
+    """
+    Local directory is sent as a streamed context, with a summary first.
+    """
+    (tmp_path / 'Dockerfile').write_text(u'FROM alpine\n')
+    sent = []
+
+    def build(**kwargs):
+        assert kwargs['custom_context'] and 'path' not in kwargs
+        sent.append(b''.join(kwargs['fileobj']))
+        return iter([b'{"stream": "Step 1/1 : FROM alpine\\n"}'])
+
+    client.instance.build = Mock(side_effect=build)
+
+    output = list(client.build(str(tmp_path), rm='true', tag='boo'))
+
+    assert output[0]['stream'].startswith('Sent build context: ')
+    assert output[1] == b'{"stream": "Step 1/1 : FROM alpine\\n"}'
+    assert sent[0].startswith(b'Dockerfile')
+    assert client.instance.build.call_args[1]['tag'] == 'boo'
+
+
+def test_stats_no_stream_is_concurrent(client):
+    """
+    With --no-stream, containers are sampled "parallel" at a time.
+    """
+    import time
+    from docker.errors import APIError
+    from test_stats import make_sample
+
+    def stats(container, stream=True, decode=None):
+        assert not stream
+        time.sleep(0.2)
+        if container == 'gone':
+            raise APIError('boo', explanation='No such container: gone')
+        return make_sample(600, 100, 1048)
+
+    client.instance.stats = Mock(side_effect=stats)
+    client.parallel = 4
+
+    started = time.monotonic()
+    result = client.stats('one', 'two', 'gone', 'three', no_stream=True)
+
+    assert time.monotonic() - started < 0.5
+    assert [r.name for r in result] == ['web', 'web', 'web']
+    assert client.after() == ['gone: No such container: gone']
+
+
+def test_stats_stream(client):
+    """
+    Streams of all containers are read concurrently, and the table is
+    refreshed at most once per interval.
+    """
+    from test_stats import make_sample
+
+    def stats(container, stream=True, decode=None):
+        assert stream and decode
+        for rx in range(1, 4):
+            sample = make_sample(rx=rx)
+            sample['name'] = '/' + container
+            yield sample
+
+    client.instance.stats = Mock(side_effect=stats)
+    client.instance.containers.return_value = [{'Id': 'a'}, {'Id': 'b'}]
+
+    tables = list(client.stats_stream(['a', 'b'], interval=60))
+
+    assert len(tables) == 2
+    assert [(r.name, r.net_rx) for r in tables[-1]] == [
+        ('a', 6.0), ('b', 6.0)]
+    assert client.after() == []
+
+
+def test_ps_watch_follows_events(client):
+    """
+    With --watch, containers are listed again after events, and the list
+    is only yielded when it changed.
+    """
+    import queue
+
+    events = queue.Queue()
+
+    class Events(object):
+        closed = False
+
+        def __iter__(self):
+            return iter(events.get, None)
+
+        def close(self):
+            self.closed = True
+            events.put(None)
+
+    listings = [
+        [{'Id': 'one', 'Names': ['/web']}],
+        [{'Id': 'one', 'Names': ['/web']}],
+        [{'Id': 'one', 'Names': ['/web']}, {'Id': 'two', 'Names': ['/db']}],
+    ]
+
+    def containers(**kwargs):
+        if len(listings) == 2:
+            # Nothing to show yet, but the next event changes things.
+            events.put({'Type': 'container', 'Action': 'start'})
+        return listings.pop(0)
+
+    stream = Events()
+    client.instance.events = Mock(return_value=stream)
+    client.instance.containers.side_effect = containers
+
+    watch = client.containers(watch=True, interval=60, all=True)
+    assert [c.names for c in next(watch)] == [['web']]
+
+    events.put({'Type': 'container', 'Action': 'create'})
+    assert [c.names for c in next(watch)] == [['web'], ['db']]
+    assert client.instance.containers.call_count == 3
+    assert 'watch' not in client.instance.containers.call_args[1]
+
+    watch.close()
+    assert stream.closed
+
+    assert client.containers(interval=60) == [
+        'Cannot use --interval without --watch.']
+    assert client.containers(watch=True, interval=0) == [
+        'Invalid --interval value: 0.']
+    assert client.containers(watch=True, interval=-1.5) == [
+        'Invalid --interval value: -1.5.']
+
+
+def test_top_watch_several_containers(client):
+    """
+    Processes of all containers are listed first, then rows of changes.
+    """
+    from docker.errors import APIError
+    from itertools import islice
+    from test_top import top
+
+    polls = {'web': [top(('1', '00:00:01', 'nginx')),
+                     top(('1', '00:00:01', 'nginx'),
+                         ('8', '00:00:00', 'sh')),
+                     top(('1', '00:00:02', 'nginx'),
+                         ('8', '00:00:00', 'sh'))],
+             'db': [top(('5', '00:00:03', 'mysqld')),
+                    APIError('boo', explanation='db is not running'),
+                    APIError('boo', explanation='db is not running')]}
+
+    def docker_top(container):
+        result = polls[container].pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    client.instance.top = Mock(side_effect=docker_top)
+
+    output = list(islice(client.top('web', 'db', watch=True,
+                                    interval=0.01), 4))
+
+    assert [(p.container, p.pid) for p in output[0]] == [('web', '1'),
+                                                         ('db', '5')]
+    assert output[1] == '! db: db is not running'
+    assert [(r['Change'], r['Container'], r['PID']) for r in output[2]] == [
+        ('-', 'db', '5'), ('+', 'web', '8')]
+    assert [r['Changed'] for r in output[3]] == [
+        {'TIME': ['00:00:01', '00:00:02']}]
+
+    assert client.top('web', interval=1) == [
+        'Cannot use --interval without --watch.']
+    assert client.top('web', watch=True, interval=-1) == [
+        'Invalid --interval value: -1.']
+
+
+def test_output_format_is_not_passed_on(client):
+    """
+    --format is for the CLI, the command doesn't get it.
+    """
+    client.instance.containers.return_value = [{'Id': 'one'}]
+
+    client.handle_input('ps --format ndjson')
+
+    assert client.output_format == 'ndjson'
+    assert 'format' not in client.instance.containers.call_args[1]
+
+    client.handle_input('ps')
+    assert client.output_format is None
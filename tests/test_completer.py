@@ -205,8 +205,8 @@ psm = option_map('ps', True)
 
 @pytest.mark.parametrize("command, expected, expected_pos", [
     ("ps ", sorted(psm.keys()), 0),
-    ("ps h", ['--help'], -1),
-    ("ps i", ['--since', '--size', '--quiet'], -1),
+    ("ps h", ['--help', '--watch'], -1),
+    ("ps i", ['--interval', '--since', '--size', '--quiet'], -1),
     ("ps ze", ['--size'], -2),
 ])
 def test_options_completion_long_fuzzy(completer, complete_event, command, expected, expected_pos):
@@ -280,7 +280,10 @@ def test_options_container_completion(completer, complete_event, command,
 
 @pytest.mark.parametrize("command, expected, expected_pos", [
     ("top ", list(map(
-        lambda x: (x, x), rs1)) + [('--help', '-h/--help')], 0),
+        lambda x: (x, x), rs1)) + [('--help', '-h/--help'),
+                                   ('--format', '--format'),
+                                   ('--interval', '--interval'),
+                                   ('--watch', '-w/--watch')], 0),
     ("top e", list(map(
         lambda x: (x, x), filter(lambda x: x.startswith('e'), rs1))), -1),
 ])
@@ -303,7 +306,8 @@ def test_options_container_running_completion(completer, complete_event,
 
 
 @pytest.mark.parametrize("command, expected, expected_pos", [
-    ("rm ", ['--all', '--all-stopped', ('--force', '-f/--force'), ('--help', '-h/--help')] + cs2, 0),
+    ("rm ", ['--all', '--all-stopped', ('--force', '-f/--force'), ('--help', '-h/--help'),
+             '--ordered', '--parallel'] + cs2, 0),
     ("rm spe", ['--all-stopped', 'desperate_hodgkin', 'desperate_torvalds',
                 'some-percona'], -3),
 ])
@@ -378,8 +382,9 @@ def test_options_image_completion_fuzzy(completer, complete_event, command,
 @pytest.mark.parametrize("command, expected, expected_pos", [
     ('volume create ', [('--name',), ('--help', '-h/--help'),
                         ('--opt', '-o/--opt'), ('--driver', '-d/--driver')], 0),
-    ('volume rm ', [('--help', '-h/--help'), ('abc',), ('def',)], 0),
-    ('volume ls ', [('--help', '-h/--help'), ('--filter',),
+    ('volume rm ', [('--help', '-h/--help'), ('--ordered',), ('--parallel',),
+                    ('abc',), ('def',)], 0),
+    ('volume ls ', [('--help', '-h/--help'), ('--filter',), ('--format',),
                     ('--quiet', '-q/--quiet')], 0),
     ('volume inspect ', [('--help', '-h/--help'), ('abc',), ('def',)], 0),
 ])
@@ -400,3 +405,144 @@ def test_options_volume_completion(completer, complete_event, command,
     expected = expected_completions_set([t[0] for t in expected], expected_pos)
 
     assert result == expected
+
+
+def test_host_shown_next_to_names(completer, complete_event):
+    """
+    With several Docker hosts, completions say which host the name is on.
+    """
+    completer.set_containers(['boo', 'foo'])
+    completer.set_name_hosts('containers', [('boo', 'one'), ('boo', 'two'),
+                                            ('foo', 'one')])
+    result = list(completer.get_completions(
+        Document(u'start b'), complete_event))
+    assert [(c.text, c.display_meta_text) for c in result] == [
+        ('boo', 'one, two')]
+
+
+def test_prefix_index():
+    """
+    Index keeps names sorted through additions and removals.
+    """
+    from wharfee.prefix import PrefixIndex, merge_prefix_matches
+
+    index = PrefixIndex(['tesla', 'newton', 'edison'])
+    index = index.added(['nikola', 'tesla']).removed(['edison'])
+    assert index == set(['tesla', 'newton', 'nikola'])
+    assert index.ordered == ['newton', 'nikola', 'tesla']
+    assert list(index.starting_with('n')) == ['newton', 'nikola']
+    assert list(merge_prefix_matches('n', [index, ['nginx', 'newton']])) == [
+        'newton', 'nginx', 'nikola']
+
+
+def test_completions_are_capped(completer, complete_event):
+    """
+    Huge collections don't produce more than COMPLETION_LIMIT suggestions.
+    """
+    from wharfee.completer import COMPLETION_LIMIT
+
+    completer.set_tagged(['image{0:05}'.format(i) for i in range(20000)])
+    result = list(completer.get_completions(
+        Document(u'rmi image1'), complete_event))
+    assert len(result) == COMPLETION_LIMIT
+    assert result[0].text == 'image10000'
+
+
+def test_fuzzy_matcher():
+    """
+    Fuzzy matches are ranked by match length, then position, then name,
+    and each longer query only rechecks the previous matches.
+    """
+    from wharfee.fuzzy import FuzzyMatcher
+
+    matcher = FuzzyMatcher(['nginx', 'angular', 'ng-nginx', 'NGINX-proxy',
+                            'redis'])
+    assert matcher.match('ng') == [
+        'NGINX-proxy', 'ng-nginx', 'nginx', 'angular']
+    assert matcher.match('ngx') == ['NGINX-proxy', 'nginx', 'ng-nginx']
+    assert [q for q, _ in matcher.survivors] == ['', 'ng', 'ngx']
+
+    assert matcher.match('nz') == []
+    assert [q for q, _ in matcher.survivors] == ['', 'nz']
+    assert matcher.match('ng', limit=2) == ['NGINX-proxy', 'ng-nginx']
+
+
+def test_options_fuzzy_matcher_reused(completer, complete_event):
+    """
+    Option names are fuzzy-matched by the same matcher on every key press,
+    so it only rechecks what matched the key before.
+    """
+    from wharfee.fuzzy import names_matcher
+
+    completer.set_fuzzy_match(True)
+    for text in ['ps s', 'ps si', 'ps siz']:
+        list(completer.get_completions(Document(text), complete_event))
+
+    matcher = names_matcher(psm.keys())
+    assert [q for q, _ in matcher.survivors] == ['', 's', 'si', 'siz']
+
+
+def test_background_completer_budget():
+    """
+    Completions found within the budget are shown, then the worker stops.
+    """
+    import asyncio
+    import time
+    from prompt_toolkit.completion import Completer
+    from wharfee.background import BackgroundCompleter
+
+    produced = []
+
+    class SlowCompleter(Completer):
+        def get_completions(self, document, complete_event):
+            for text in ['fast', 'slow', 'never']:
+                produced.append(text)
+                yield Completion(text)
+                time.sleep(0.3)
+
+    async def collect():
+        completer = BackgroundCompleter(SlowCompleter(), budget=0.1)
+        return [c.text async for c in completer.get_completions_async(
+            Document(u'anything'), None)]
+
+    assert asyncio.run(collect()) == ['fast']
+    time.sleep(0.5)
+    assert produced == ['fast', 'slow']
+
+
+def test_background_completer_cancels_stale(completer, complete_event):
+    """
+    New request stops the previous one, results without budget are complete.
+    """
+    import asyncio
+    from wharfee.background import BackgroundCompleter
+
+    background = BackgroundCompleter(completer)
+
+    async def collect():
+        stale = background.get_completions_async(Document(u'sta'), None)
+        await stale.__anext__()
+        request = background.pending
+        result = [c.text async for c in background.get_completions_async(
+            Document(u'ver'), None)]
+        await stale.aclose()
+        return request.cancelled.is_set(), result
+
+    cancelled, result = asyncio.run(collect())
+    assert cancelled
+    assert result == ['version']
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("volume ", ['create', 'inspect', 'ls', 'rm']),
+    ("volume l", ['ls']),
+    ("volume lsx", []),
+])
+def test_subcommand_completion(completer, complete_event, command, expected):
+    """
+    After a command group, suggest its subcommands.
+    """
+    result = list(completer.get_completions(
+        Document(text=command, cursor_position=len(command)),
+        complete_event))
+    assert [c.text for c in result] == expected
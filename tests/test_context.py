@@ -0,0 +1,150 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+
+import io
+import os
+import tarfile
+
+from wharfee.context import BuildContext, ContextCache, CHUNK_SIZE
+
+
+def make_context(root):
+    (root / 'Dockerfile').write_text('FROM alpine\nCOPY . /app\n')
+    (root / '.dockerignore').write_text('# comment\n*.log\nbuild\n')
+    (root / 'app.py').write_text('print(1)\n')
+    (root / 'debug.log').write_text('boo')
+    (root / 'build').mkdir()
+    (root / 'build' / 'out.bin').write_bytes(b'x' * 1000)
+    (root / 'src').mkdir()
+    (root / 'src' / 'big.bin').write_bytes(os.urandom(300 * 1024))
+    os.symlink('app.py', str(root / 'link.py'))
+
+
+def read_tar(data):
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return dict((m.name, tar.extractfile(m).read() if m.isfile() else
+                     m.linkname) for m in tar.getmembers())
+
+
+def test_build_context_ignores_and_caches(tmp_path):
+    """
+    Context honours .dockerignore, is a valid tar, and unchanged files are
+    taken from the cache on the next build.
+    """
+    root = tmp_path / 'app'
+    root.mkdir()
+    make_context(root)
+    cache_dir = str(tmp_path / 'cache')
+
+    context = BuildContext(str(root), cache_dir=cache_dir)
+    first = b''.join(context.stream())
+    members = read_tar(first)
+
+    assert sorted(members) == ['.dockerignore', 'Dockerfile', 'app.py',
+                               'link.py', 'src', 'src/big.bin']
+    assert members['link.py'] == 'app.py'
+    assert members['src/big.bin'] == (root / 'src' / 'big.bin').read_bytes()
+    assert (context.files, context.cached) == (4, 0)
+    assert context.size == len(first)
+
+    context = BuildContext(str(root), cache_dir=cache_dir)
+    assert b''.join(context.stream()) == first
+    assert (context.files, context.cached) == (4, 4)
+    assert 'from cache' in context.summary()
+
+    (root / 'app.py').write_text('print(2)\n')
+    context = BuildContext(str(root), cache_dir=cache_dir)
+    members = read_tar(b''.join(context.stream()))
+    assert members['app.py'] == b'print(2)\n'
+    assert (context.files, context.cached) == (4, 3)
+
+
+def test_context_cache_reads_in_chunks(tmp_path):
+    """
+    Members are taken out of the cache in chunks, not in one read.
+    """
+    root = tmp_path / 'app'
+    root.mkdir()
+    make_context(root)
+    cache_dir = str(tmp_path / 'cache')
+
+    context = BuildContext(str(root), cache_dir=cache_dir)
+    b''.join(context.stream())
+
+    cache = ContextCache(context.cache_path)
+    st = os.lstat(str(root / 'src' / 'big.bin'))
+    chunks = list(cache.read('src/big.bin', [
+        st.st_size, st.st_mtime_ns, st.st_mode, st.st_uid, st.st_gid,
+        st.st_ino]))
+    cache.close()
+
+    assert len(chunks) == 2
+    assert max(len(chunk) for chunk in chunks) == CHUNK_SIZE
+
+
+def test_build_context_without_cache(tmp_path):
+    """
+    Context can be streamed without a cache.
+    """
+    make_context(tmp_path)
+
+    context = BuildContext(str(tmp_path), cache_dir=None)
+    members = read_tar(b''.join(context.stream()))
+
+    assert members['Dockerfile'] == b'FROM alpine\nCOPY . /app\n'
+    assert context.cached == 0
+
+
+def test_build_context_without_posix_modules(tmp_path, monkeypatch):
+    """
+    Where grp, pwd and fcntl are missing (Windows), context is streamed
+    without names and without the cache.
+    """
+    import wharfee.context as context
+
+    monkeypatch.setattr(context, 'grp', None)
+    monkeypatch.setattr(context, 'pwd', None)
+    monkeypatch.setattr(context, 'fcntl', None)
+    (tmp_path / 'app').mkdir()
+    make_context(tmp_path / 'app')
+
+    build = BuildContext(str(tmp_path / 'app'),
+                         cache_dir=str(tmp_path / 'cache'))
+    members = read_tar(b''.join(build.stream()))
+
+    assert members['app.py'] == b'print(1)\n'
+    assert build.cache_path is None
+    assert not (tmp_path / 'cache').exists()
+
+
+def test_context_cache_limit(tmp_path):
+    """
+    Files that don't fit in the limit are not cached, and caches of other
+    directories are removed, least recently used first.
+    """
+    cache_dir = str(tmp_path / 'cache')
+    limit = 150 * 1024
+
+    def build(root):
+        context = BuildContext(str(root), cache_dir=cache_dir,
+                               cache_limit=limit)
+        b''.join(context.stream())
+        return context
+
+    for name in ['old', 'new']:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'data.bin').write_bytes(b'x' * 100 * 1024)
+    old = build(tmp_path / 'old')
+    os.utime(old.cache_path + '.json', (1, 1))
+    new = build(tmp_path / 'new')
+
+    assert not os.path.exists(old.cache_path)
+    assert os.path.exists(new.cache_path)
+
+    root = tmp_path / 'app'
+    root.mkdir()
+    make_context(root)
+    build(root)
+    context = build(root)
+    # src/big.bin is over the limit by itself.
+    assert (context.files, context.cached) == (4, 3)
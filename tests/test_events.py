@@ -0,0 +1,136 @@
+# -*- coding: utf-8
+import pytest
+
+from mock import Mock
+from wharfee.completer import DockerCompleter
+from wharfee.events import EventWatcher
+
+
+def event(event_type, action, actor_id='', **attributes):
+    return {
+        'Type': event_type,
+        'Action': action,
+        'Actor': {'ID': actor_id, 'Attributes': attributes},
+    }
+
+
+@pytest.fixture
+def completer():
+    return DockerCompleter(
+        containers=['newton', 'tesla'],
+        running=['tesla'],
+        images=['ubuntu', 'nginx'],
+        tagged=['ubuntu:latest', 'ubuntu:14.04', 'nginx:latest'],
+        volumes=['abc'])
+
+
+@pytest.fixture
+def watcher(completer):
+    return EventWatcher(Mock(), completer, Mock())
+
+
+def test_container_lifecycle(watcher, completer):
+    """
+    Containers are added and removed as they are created, started and
+    destroyed.
+    """
+    assert watcher.apply_event(event('container', 'create', name='edison'))
+    assert 'edison' in completer.containers
+    assert 'edison' not in completer.running
+
+    assert watcher.apply_event(event('container', 'start', name='edison'))
+    assert 'edison' in completer.running
+
+    assert watcher.apply_event(event('container', 'die', name='edison'))
+    assert 'edison' not in completer.running
+
+    assert watcher.apply_event(event('container', 'destroy', name='edison'))
+    assert 'edison' not in completer.containers
+
+
+def test_container_rename(watcher, completer):
+    """
+    Renamed container keeps its running state.
+    """
+    watcher.apply_event(event('container', 'rename', name='nikola',
+                              oldName='/tesla'))
+    assert completer.containers == set(['newton', 'nikola'])
+    assert completer.running == set(['nikola'])
+
+
+def test_unknown_container_is_a_gap(watcher, completer):
+    """
+    Destroying a container we never heard of means we are out of sync.
+    """
+    assert not watcher.apply_event(
+        event('container', 'destroy', name='einstein'))
+
+
+def test_image_tag_untag(watcher, completer):
+    """
+    Tags are added and removed, repository goes away with its last tag.
+    """
+    watcher.apply_event(event('image', 'tag', 'sha256:1234', name='boo:1.0'))
+    assert 'boo' in completer.images
+    assert 'boo:1.0' in completer.tagged
+
+    watcher.apply_event(event('image', 'untag', 'sha256:1234',
+                              name='ubuntu:14.04'))
+    assert 'ubuntu:14.04' not in completer.tagged
+    assert 'ubuntu' in completer.images
+
+    watcher.apply_event(event('image', 'untag', 'sha256:1234',
+                              name='ubuntu:latest'))
+    assert 'ubuntu' not in completer.images
+
+
+def test_volume_create_destroy(watcher, completer):
+    watcher.apply_event(event('volume', 'create', 'def', driver='local'))
+    assert completer.volumes == set(['abc', 'def'])
+    watcher.apply_event(event('volume', 'destroy', 'abc', driver='local'))
+    assert completer.volumes == set(['def'])
+
+
+def test_reconnect_resyncs(completer):
+    """
+    Without a "since" timestamp the watcher has to do a full resync after
+    subscribing. A replayed subscription does not.
+    """
+    client = Mock()
+    resync = Mock()
+    watcher = EventWatcher(client, completer, resync)
+
+    def events(since=None):
+        yield event('volume', 'create', 'def')
+        watcher.stopped.set()
+
+    client.events.side_effect = events
+
+    watcher.run(since=12345)
+    assert not resync.called
+    assert 'def' in completer.volumes
+
+    watcher.stopped.clear()
+    watcher.run()
+    assert resync.called
+
+
+def test_failed_subscription_loads_once(completer):
+    """
+    If the daemon can't be subscribed to, completions are read once anyway,
+    not on every retry.
+    """
+    client = Mock()
+    resync = Mock()
+    watcher = EventWatcher(client, completer, resync, retry_delay=0)
+
+    def events(since=None):
+        if client.events.call_count == 3:
+            watcher.stopped.set()
+        raise ConnectionError('refused')
+
+    client.events.side_effect = events
+
+    watcher.run()
+    assert client.events.call_count == 3
+    assert resync.call_count == 1
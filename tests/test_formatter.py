@@ -5,6 +5,7 @@ from wharfee.formatter import format_data
 from wharfee.formatter import format_struct
 from wharfee.formatter import format_top
 from wharfee.formatter import format_port_lines
+from wharfee.formatter import format_table
 from wharfee.formatter import JsonStreamFormatter
 
 
@@ -185,3 +186,220 @@ def test_info_data_formatting():
     print('\n')
     for line in lines:
         print(line)
+
+
+def test_table_formatting_matches_tabulate():
+    """
+    Streamed table looks the same as the one from tabulate.
+    """
+    from tabulate import tabulate
+
+    def rows():
+        return [
+            {'Id': 'b798acf43824', 'Names': 'boo', 'Size': 1024,
+             'Status': 'Up 2 hours'},
+            {'Id': '9e19b1558bbc', 'Names': 'a-much-longer-name',
+             'Size': 7, 'Status': None},
+        ]
+
+    expected = tabulate(rows(), headers='keys').split('\n')
+    assert list(format_table(rows())) == expected
+
+
+def test_table_formatting_is_lazy():
+    """
+    First lines come out before all rows are read.
+    """
+    consumed = []
+
+    def rows():
+        for i in range(100000):
+            consumed.append(i)
+            yield {'Id': str(i), 'Name': 'container-{0}'.format(i)}
+
+    lines = format_table(rows(), sample_size=10)
+    assert next(lines) == 'Id    Name'
+    assert len(consumed) == 10
+    assert sum(1 for _ in lines) == 100001
+
+
+def test_records_formatting():
+    """
+    Records are formatted without going through dicts.
+    """
+    from wharfee.records import Image
+
+    data = [Image('sha256:0123456789abcdef', 'busybox', 'latest', None, 0)]
+    assert list(format_data('images', data)) == [
+        'Repository    Tag     Id           Created    Size',
+        '------------  ------  -----------  ---------  ------',
+        'busybox       latest  0123456789a             0 B',
+    ]
+
+
+def test_demux_stream_writer(capsys):
+    """
+    Frames are decoded incrementally and written to stdout or stderr.
+    """
+    from wharfee.formatter import DemuxStreamWriter
+
+    data = u'привет\n'.encode('utf-8')
+    frames = [(1, data[:3]), (2, b'oops'), (1, data[3:])]
+    assert DemuxStreamWriter(iter(frames), raw=False).output() == 3
+
+    out, err = capsys.readouterr()
+    assert out == u'привет\n'
+    assert err == 'oops'
+
+
+def test_demux_stream_writer_raw(capsysbinary):
+    """
+    Raw bytes are written as they are.
+    """
+    from wharfee.formatter import DemuxStreamWriter
+
+    frames = [(1, b'\xd0'), (1, b'\xbf\n'), (2, b'oops')]
+    DemuxStreamWriter(iter(frames), raw=True).output()
+
+    out, err = capsysbinary.readouterr()
+    assert out == b'\xd0\xbf\n'
+    assert err == b'oops'
+
+
+def pull_messages():
+    """
+    Pull output as the Docker API streams it.
+    """
+    p = os.path.dirname(os.path.realpath(__file__))
+    with open(os.path.join(p, 'data/pull.output')) as f:
+        return [line.strip().encode('utf8') for line in f if line.strip()]
+
+
+def test_pull_progress_not_tty():
+    """
+    Without a terminal, layer progress is summed up at the end.
+    """
+    from io import StringIO
+
+    out = StringIO()
+    JsonStreamFormatter(pull_messages(), out, tty=False).output()
+    lines = out.getvalue().splitlines()
+
+    assert '\x1b' not in out.getvalue()
+    assert lines[0] == 'Pulling from ubuntu 14.04'
+    assert lines[-2] == 'Status: Downloaded newer image for ubuntu:14.04'
+    assert lines[-1].startswith('4 layers, 62.793 MB in ')
+
+
+def test_pull_progress_redraw_rate():
+    """
+    On a terminal, layers are redrawn at most fps times a second, and
+    messages are written above them.
+    """
+    from io import StringIO
+    from wharfee.progress import LayerProgress
+
+    now = [0.0]
+    out = StringIO()
+    progress = LayerProgress(out, tty=True, fps=10, clock=lambda: now[0])
+    for i in range(100):
+        now[0] = i * 0.01
+        progress.update({'id': 'abc', 'status': 'Downloading',
+                         'progressDetail': {'current': i * 1024,
+                                            'total': 200 * 1024}})
+    assert len(progress.lines) == 2
+    assert out.getvalue().count('\x1b[2A') == 9
+
+    progress.write('Digest: sha256:boo')
+    text = out.getvalue()
+    assert text.endswith('Digest: sha256:boo\nabc: Downloading\x1b[K\n'
+                         '0/1 layers  99.0 KB/200.0 KB  100.0 KB/s  '
+                         'ETA 1s\x1b[K\n')
+
+
+def test_table_refresh_writer():
+    """
+    Tables are written over the previous one on a terminal.
+    """
+    from io import StringIO
+    from wharfee.formatter import TableRefreshWriter
+    from wharfee.records import Stats
+
+    tables = [[Stats('a' * 64, 'web', cpu=1.5)],
+              [Stats('a' * 64, 'web', cpu=2.5)]]
+
+    out = StringIO()
+    TableRefreshWriter(iter(tables), out, tty=True).output()
+    text = out.getvalue()
+    assert text.count('\x1b[3A') == 1
+    assert '2.50%' in text.split('\x1b[3A')[1]
+
+    out = StringIO()
+    TableRefreshWriter(iter(tables), out, tty=False).output()
+    assert '\x1b' not in out.getvalue()
+    assert out.getvalue().count('Container') == 2
+
+
+def test_table_refresh_writer_redraws_changes():
+    """
+    Only changed lines are written again, and columns don't get narrower.
+    """
+    from io import StringIO
+    from wharfee.formatter import TableRefreshWriter
+    from wharfee.records import Volume
+
+    tables = [[Volume('data-long-name', 'local'), Volume('db', 'local')],
+              [Volume('data', 'local'), Volume('db', 'local')]]
+
+    out = StringIO()
+    writer = TableRefreshWriter(iter(tables), out, tty=True)
+    writer.output()
+
+    redraw = out.getvalue().split('\x1b[4A')[1]
+    assert redraw == '\n\nlocal     data\x1b[K\n\n'
+    assert writer.lines[-1] == 'local     db'
+    assert writer.lines[1] == '--------  --------------'
+
+
+def test_top_watch_writer():
+    """
+    "top --watch" changes are written as lines after the table.
+    """
+    from io import StringIO
+    from wharfee.formatter import TopWatchWriter
+    from wharfee.records import Process
+
+    process = Process('web', ('PID', 'CMD'), ('1', 'nginx'))
+    changes = [{'Change': '-', 'PID': '1', 'CMD': 'nginx',
+                'Container': 'web'}]
+
+    out = StringIO()
+    TopWatchWriter(iter([[process], changes]), out, tty=False).output()
+    assert out.getvalue().endswith('\n- web 1  nginx\n')
+
+
+def test_quiet_listings():
+    """
+    Quiet listings are written as plain lists.
+    """
+    assert format_data('volume ls', [{'Name': 'data'}]) == ['data']
+    assert format_data('images', [{'Id': 'sha256:a'}]) == ['sha256:a']
+
+
+def test_pull_progress_fits_terminal():
+    """
+    When there are more layers than rows, layers in progress are shown
+    and the rest are counted.
+    """
+    from io import StringIO
+    from wharfee.progress import LayerProgress
+
+    progress = LayerProgress(StringIO(), tty=True)
+    for i in range(10):
+        progress.update({'id': str(i), 'progressDetail': {},
+                         'status': 'Pull complete' if i < 7 else 'Waiting'})
+
+    lines = progress.layer_lines(6)
+    assert lines == ['0: Pull complete', '7: Waiting', '8: Waiting',
+                     '9: Waiting', '... 6 more layers']
+    assert len(progress.layer_lines(20)) == 10
@@ -1,6 +1,7 @@
 import pytest
 from wharfee.helpers import (parse_port_bindings, parse_volume_bindings,
-                             parse_kv_as_dict)
+                             parse_kv_as_dict, parse_timestamp,
+                             list_dir)
 
 
 @pytest.mark.parametrize("ports, expected", [
@@ -49,3 +50,47 @@ def test_kv_parsing_true(kvalues, convert_boolean, expected):
     result = parse_kv_as_dict(kvalues, convert_boolean)
 
     assert result == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('1357133017', 1357133017),
+    ('2013-01-02T13:23:37Z', 1357133017),
+    ('42m', 1357133017 - 42 * 60),
+    ('1h30s', 1357133017 - 3630),
+])
+def test_timestamp_parsing(value, expected):
+    """
+    Parse absolute and relative times for --since and --until.
+    """
+    assert parse_timestamp(value, now=1357133017) == expected
+
+
+def test_list_dir_cache(tmp_path):
+    """
+    Directory is listed once while it doesn't change, and again after.
+    """
+    import os
+    from mock import patch
+    from wharfee.helpers import DirectoryCache
+
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'setup.py').write_text(u'')
+    (tmp_path / '.git').mkdir()
+    cache = DirectoryCache()
+
+    with patch('wharfee.helpers.DIRECTORY_CACHE', cache), \
+            patch('wharfee.helpers.os.scandir', wraps=os.scandir) as scandir:
+        base = str(tmp_path)
+        assert list_dir(base) == ['setup.py', 'src']
+        assert list_dir(os.path.join(base, 'se')) == ['setup.py', 'src']
+        assert list_dir(os.path.join(base, 's'), dirs_only=True) == ['src']
+        assert list_dir(base, include_special=True) == [
+            '.git', 'setup.py', 'src']
+        assert scandir.call_count == 1
+
+        (tmp_path / 'README').write_text(u'')
+        os.utime(base, ns=(0, 0))
+        assert list_dir(base) == ['README', 'setup.py', 'src']
+        assert scandir.call_count == 2
+
+        assert list_dir(os.path.join(base, 'missing', 'x')) == []
@@ -0,0 +1,53 @@
+# -*- coding: utf-8
+import os
+import sys
+import subprocess
+
+from wharfee.profiling import parse_importtime, profile_imports
+
+
+LAZY_MODULES = [
+    'pexpect',
+    'ruamel.yaml',
+    'tabulate',
+    'pygments.lexers.data',
+    'pygments.formatters.terminal',
+]
+
+
+def test_parse_importtime():
+    """
+    Parse output of python -X importtime.
+    """
+    lines = [
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |     wharfee.utils',
+        'import time:       892 |       1534 |   wharfee.options',
+        'import time:      3000 |       4534 | wharfee.main',
+    ]
+    assert parse_importtime(lines) == [
+        ('wharfee.utils', 120, 120, 2),
+        ('wharfee.options', 892, 1534, 1),
+        ('wharfee.main', 3000, 4534, 0),
+    ]
+
+
+def test_heavy_modules_are_imported_lazily():
+    """
+    Modules that are only needed by some commands are not loaded at startup.
+    """
+    code = 'import sys, wharfee.main; print(" ".join(sorted(sys.modules)))'
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     universal_newlines=True)
+    loaded = set(output.split())
+    assert [m for m in LAZY_MODULES if m in loaded] == []
+
+
+def test_import_time_budget():
+    """
+    Cold import of wharfee.main stays within the budget (seconds).
+    """
+    budget = float(os.environ.get('WHARFEE_IMPORT_BUDGET', '1.5'))
+    timings = profile_imports('wharfee.main')
+    total = next(t[2] for t in timings if t[0] == 'wharfee.main')
+    assert total / 1000000.0 < budget
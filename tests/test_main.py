@@ -0,0 +1,100 @@
+# -*- coding: utf-8
+import time
+import pytest
+
+from mock import patch, MagicMock
+
+
+@pytest.fixture
+def home(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    return tmpdir
+
+
+def slow_containers(*_, **__):
+    time.sleep(0.5)
+    return [{'Id': 'abc', 'Names': ['/boo'], 'Created': 1}]
+
+
+def test_startup_does_not_wait_for_completions(home):
+    """
+    Completions are loaded in the background, "loading" is shown meanwhile.
+    """
+    from wharfee.main import WharfeeCli
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        instance = MagicMock()
+        instance.containers.side_effect = slow_containers
+        instance.images.return_value = []
+        mock_api.return_value = instance
+
+        started = time.perf_counter()
+        cli = WharfeeCli()
+        assert time.perf_counter() - started < 0.5
+        assert cli.completer.is_loading()
+
+        # With events enabled, the watcher subscribes and then loads.
+        assert cli.event_watcher is not None
+        for _ in range(50):
+            if not cli.completer.is_loading():
+                break
+            time.sleep(0.1)
+
+        assert not cli.completer.is_loading()
+        assert cli.completer.containers == set(['boo'])
+        cli.event_watcher.stop()
+
+
+@pytest.mark.parametrize('concurrent', [1, 4])
+def test_batch_mode(home, capsys, concurrent):
+    """
+    Commands run one after another, or concurrently, output comes in order.
+    """
+    from wharfee.main import WharfeeCli
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        instance = MagicMock()
+        instance.containers.return_value = [{'Id': 'abc'}]
+        instance.images.return_value = []
+        instance.volumes.return_value = {'Volumes': [{'Name': 'vol'}]}
+        instance.inspect_container.side_effect = RuntimeError('Boom')
+        mock_api.return_value = instance
+
+        cli = WharfeeCli(no_completion=True)
+        with patch.object(cli, 'refresh_completions') as refresh:
+            failed = cli.run_batch(
+                ['# comment', 'ps -q', '', 'volume ls -q', 'images',
+                 'inspect foo'],
+                concurrent=concurrent)
+            assert not refresh.called
+
+    out, err = capsys.readouterr()
+    assert failed == 1
+    assert out.split('\n')[-4:] == [
+        'abc', 'vol', 'There are no images to list.', '']
+    assert 'inspect foo: Boom' in err
+
+
+@pytest.mark.parametrize('concurrent', [1, 4])
+def test_batch_mode_output_format(home, capsys, concurrent):
+    """
+    Session format applies to all listings, --format overrides it.
+    """
+    from wharfee.main import WharfeeCli
+
+    with patch('wharfee.client.DockerAPIClient') as mock_api:
+        instance = MagicMock()
+        instance.volumes.return_value = {'Volumes': [
+            {'Name': 'vol', 'Driver': 'local'}]}
+        mock_api.return_value = instance
+
+        cli = WharfeeCli(no_completion=True, output_format='ndjson')
+        with patch.object(cli, 'refresh_completions'):
+            failed = cli.run_batch(['volume ls', 'volume ls --format tsv'],
+                                   concurrent=concurrent)
+
+    out, _ = capsys.readouterr()
+    assert failed == 0
+    assert out.split('\n') == [
+        '{"Driver": "local", "Name": "vol", "Mountpoint": null}',
+        'Driver\tName\tMountpoint', 'local\tvol\t', '']
@@ -3,7 +3,7 @@ from optparse import OptionError
 from textwrap import dedent
 from wharfee.options import parse_command_options, format_command_help, \
     format_command_line
-from wharfee.utils import shlex_split
+from wharfee.tokenizer import tokenize
 from wharfee.completer import DockerCompleter
 
 
@@ -113,7 +113,7 @@ def test_parse_multiple_args_without_equal():
     :return:
     """
     text = 'run --name boo -e FOO 1 -e BOO 2 ubuntu'
-    tokens = shlex_split(text) if text else ['']
+    tokens = tokenize(text).words
     cmd = tokens[0]
     params = tokens[1:]
 
@@ -137,6 +137,10 @@ def test_help_formatting():
           Non-standard options:
             --all-dangling  Shortcut to remove all dangling images.
             --all           Shortcut to remove all images.
+            --parallel=N    Number of targets to process concurrently (default is
+                            "parallel" setting in ~/.wharfeerc).
+            --ordered       With --parallel, output results in the order targets were
+                            given, rather than as they complete.
     """).strip()
 
     print(output)
@@ -164,7 +168,7 @@ def test_external_command_line(text, is_long, expected):
     Parse and reconstruct the command line.
     """
     cmd, params = text.split(' ', 1)
-    params = shlex_split(params)
+    params = tokenize(params).words
 
     parser, popts, pargs = parse_command_options(cmd, params)
 
@@ -174,3 +178,46 @@ def test_external_command_line(text, is_long, expected):
     expected_words = set(expected.split(' '))
 
     assert result_words == expected_words
+
+
+def test_compiled_command():
+    """
+    Options are compiled once per command and found by any of their names.
+    """
+    from wharfee.options import compiled_command, find_option, \
+        OPTION_HELP, OPTION_CONTAINER_NAME
+
+    compiled = compiled_command('run')
+    assert compiled_command('run') is compiled
+    # Partly typed commands are not compiled again on every key press.
+    assert compiled_command('ru') is compiled_command('ru')
+    assert find_option('run', '--name') is OPTION_CONTAINER_NAME
+    assert find_option('run', 'help') is OPTION_HELP
+    assert find_option('run', '--nope') is None
+    assert find_option('nope', 'help') is None
+
+    names = [x.get_name(True) for x in compiled.named_options(True)]
+    assert names == sorted(names)
+    assert format_command_help('run') is compiled.help
+
+    # Parser is reused without leaking values between runs.
+    _, first, _ = parse_command_options('run', ['-e', 'A=1', 'ubuntu'])
+    _, second, _ = parse_command_options('run', ['ubuntu'])
+    assert first['environment'] == ['A=1']
+    assert second['environment'] is None
+
+
+@pytest.mark.parametrize('tokens, expected', [
+    (['ps', '-a'], ('ps', ['-a'])),
+    (['volume', 'ls', '-q'], ('volume ls', ['-q'])),
+    (['volume', 'lsx'], ('volume', ['lsx'])),
+    (['volume'], ('volume', [])),
+    (['nope', 'ls'], ('nope', ['ls'])),
+    ([], (None, None)),
+])
+def test_split_command_and_args(tokens, expected):
+    """
+    Multi-word commands are matched word by word.
+    """
+    from wharfee.options import split_command_and_args
+    assert split_command_and_args(tokens) == expected
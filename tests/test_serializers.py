@@ -0,0 +1,101 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+
+import csv
+import json
+import pytest
+from io import StringIO
+
+from wharfee.records import Container, Volume
+from wharfee.serializers import write_serialized
+
+
+CONTAINERS = [
+    Container('a' * 64, ['web'], 'nginx:latest',
+              'nginx -g "daemon off;" with a long command line', 1500000000,
+              [{'PrivatePort': 80, 'Type': 'tcp'}], 'running', 'Up 2 hours'),
+    Container('b' * 64, ['db'], 'postgres', 'postgres', 1500000001, [],
+              'exited', 'Exited (0) 2 days ago'),
+]
+
+
+def serialize(output, output_format):
+    out, err = StringIO(), StringIO()
+    count = write_serialized(output, output_format, out, err)
+    return count, out.getvalue(), err.getvalue()
+
+
+def test_json_formats():
+    """
+    Records are written with Docker API keys and values in full.
+    """
+    count, text, _ = serialize(CONTAINERS, 'json')
+    rows = json.loads(text)
+    assert count == 2
+    assert rows[0]['Id'] == 'a' * 64
+    assert rows[0]['Command'] == CONTAINERS[0].command
+    assert rows[0]['Ports'] == [{'PrivatePort': 80, 'Type': 'tcp'}]
+
+    _, text, _ = serialize(iter([CONTAINERS[:1], CONTAINERS[1:]]), 'ndjson')
+    lines = text.splitlines()
+    assert [json.loads(line)['Names'] for line in lines] == [['web'], ['db']]
+
+    assert serialize([], 'json')[1] == '[]\n'
+
+
+def test_json_stream_interrupted():
+    """
+    A stream stopped with Ctrl+C still leaves a valid JSON array.
+    """
+    def stream():
+        yield CONTAINERS
+        raise KeyboardInterrupt()
+
+    out = StringIO()
+    with pytest.raises(KeyboardInterrupt):
+        write_serialized(stream(), 'json', out, StringIO())
+    assert len(json.loads(out.getvalue())) == 2
+
+
+def test_csv_formats():
+    """
+    Header comes from the first row, lists are written as JSON.
+    """
+    _, text, _ = serialize(CONTAINERS, 'csv')
+    rows = list(csv.DictReader(StringIO(text)))
+    assert rows[0]['Command'] == CONTAINERS[0].command
+    assert rows[1]['Names'] == '["db"]'
+
+    _, text, _ = serialize([Volume('data', 'local')], 'tsv')
+    assert text.splitlines()[1].split('\t')[:2] == ['local', 'data']
+
+
+def test_top_and_messages():
+    """
+    "top" output is a row per process, messages go to stderr.
+    """
+    top = {'Titles': ['PID', 'CMD'],
+           'Processes': [['1', 'nginx'], ['7', 'sh']]}
+    count, text, err = serialize(top, 'ndjson')
+    assert count == 2
+    assert json.loads(text.splitlines()[1]) == {'PID': '7', 'CMD': 'sh'}
+
+    count, text, err = serialize(['There are no containers to list.'],
+                                 'csv')
+    assert (count, text) == (0, '')
+    assert err == 'There are no containers to list.\n'
+
+
+def test_quiet_listings_and_changes():
+    """
+    Quiet listings and "top --watch" changes are rows, not messages.
+    """
+    count, text, err = serialize([{'Name': 'data'}, {'Name': 'logs'}],
+                                 'json')
+    assert (count, err) == (2, '')
+    assert json.loads(text) == [{'Name': 'data'}, {'Name': 'logs'}]
+
+    changes = [{'Change': '+', 'PID': '9', 'CMD': 'sh', 'Container': 'web'}]
+    count, text, err = serialize(iter([changes]), 'ndjson')
+    assert (count, err) == (1, '')
+    assert json.loads(text)['Change'] == '+'
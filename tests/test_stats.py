@@ -0,0 +1,81 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+
+from wharfee.stats import SampleRing, ContainerStats, parse_sample
+
+
+def make_sample(total_usage=0, precpu_usage=0, mem=0, rx=0):
+    return {
+        'id': 'abc123',
+        'name': '/web',
+        'cpu_stats': {
+            'cpu_usage': {'total_usage': total_usage},
+            'system_cpu_usage': 2000,
+            'online_cpus': 2,
+        },
+        'precpu_stats': {
+            'cpu_usage': {'total_usage': precpu_usage},
+            'system_cpu_usage': 1000,
+        },
+        'memory_stats': {
+            'usage': mem,
+            'limit': 4096,
+            'stats': {'inactive_file': 24},
+        },
+        'networks': {
+            'eth0': {'rx_bytes': rx, 'tx_bytes': 5},
+            'eth1': {'rx_bytes': rx, 'tx_bytes': 5},
+        },
+        'blkio_stats': {
+            'io_service_bytes_recursive': [
+                {'op': 'Read', 'value': 7},
+                {'op': 'write', 'value': 9},
+                {'op': 'Total', 'value': 16},
+            ],
+        },
+        'pids_stats': {'current': 3},
+    }
+
+
+def test_parse_sample():
+    """
+    Numbers are taken out of a stats sample the way docker stats does.
+    """
+    assert parse_sample(make_sample(600, 100, 1048, 10)) == \
+        (100.0, 1024.0, 4096.0, 20.0, 10.0, 7.0, 9.0, 3.0)
+    assert parse_sample({}) == (0.0,) * 8
+
+
+def test_sample_ring_wraps():
+    """
+    Ring keeps the last samples only, in order.
+    """
+    ring = SampleRing(size=3, width=2)
+    assert ring.last() is None
+    for i in range(5):
+        ring.append((i, i * 10))
+
+    assert len(ring) == 3
+    assert ring.last() == (4.0, 40.0)
+    assert ring.column(1) == [20.0, 30.0, 40.0]
+
+
+def test_container_stats_record():
+    """
+    Latest sample is shown as a record, with CPU averaged over the history.
+    """
+    stats = ContainerStats('web', size=2)
+    assert stats.record() is None
+    for rx in (10, 20, 30):
+        stats.add(make_sample(600, 100, 1048, rx))
+
+    record = stats.record()
+    assert (record.id, record.name, record.pids) == ('abc123', 'web', 3)
+    assert record.mem_percent == 25.0
+    assert record.values()[2:6] == ('100.00%', '100.00%', '1.0 KB / 4.0 KB',
+                                    '25.00%')
+    assert record.as_dict()['NetInput'] == 60.0
+    assert stats.history('net_rx') == [40.0, 60.0]
+
+    stats.add(make_sample(350, 100, 1048, 40))
+    assert (stats.record().cpu, stats.record().cpu_avg) == (50.0, 75.0)
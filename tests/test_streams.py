@@ -0,0 +1,42 @@
+# -*- coding: utf-8
+import io
+import struct
+
+from wharfee.streams import read_frames, StreamDecoder, STDOUT, STDERR
+
+
+def frame(stream, data):
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+def test_read_frames_demultiplexes():
+    """
+    Multiplexed frames are split by stream, even if read in small pieces.
+    """
+    raw = io.BytesIO(b''.join([
+        frame(STDOUT, b'out\n'), frame(STDERR, b'err\n'), frame(STDOUT, b'')]))
+
+    def read(n):
+        return raw.read(min(n, 3))
+
+    assert list(read_frames(read)) == [(STDOUT, b'out\n'), (STDERR, b'err\n')]
+
+
+def test_read_frames_tty():
+    """
+    TTY stream is not multiplexed, it is all stdout.
+    """
+    raw = io.BytesIO(b'hello')
+    assert list(read_frames(raw.read, tty=True, chunk_size=2)) == [
+        (STDOUT, b'he'), (STDOUT, b'll'), (STDOUT, b'o')]
+
+
+def test_decoder_keeps_split_characters():
+    """
+    Multibyte character split between frames is decoded whole.
+    """
+    data = u'привет'.encode('utf-8')
+    decoder = StreamDecoder()
+    text = decoder.decode(STDOUT, data[:3]) + decoder.decode(STDOUT, data[3:])
+    assert text == u'привет'
+    assert decoder.flush() == []
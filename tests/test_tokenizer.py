@@ -0,0 +1,83 @@
+# -*- coding: utf-8
+import shlex
+import pytest
+
+from wharfee.tokenizer import tokenize, Tokenizer
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    '   ',
+    'ps -a',
+    'run --name boo ubuntu "top -b"',
+    "run -e 'A=1 2' -e B=\"x\\\"y\" img",
+    'exec boo sh -c "echo \\$HOME\\n"',
+    'rm a\\ b  ""  c',
+    'build "./dir with spaces/"x',
+])
+def test_split_like_shlex(text):
+    """
+    Tokens are the same as from shlex.split.
+    """
+    assert tokenize(text).split() == shlex.split(text)
+
+
+@pytest.mark.parametrize('text, quote, error', [
+    ('run -c "while', '"', 'No closing quotation'),
+    ("run 'a", "'", 'No closing quotation'),
+    ('rm boo\\', None, 'No escaped character'),
+])
+def test_unfinished(text, quote, error):
+    """
+    Unfinished input is still tokenized, and fails on split like shlex.
+    """
+    tokens = tokenize(text)
+    assert tokens.quote == quote
+    assert tokens.error == error
+    assert tokens.words[0] == text.split()[0]
+    with pytest.raises(ValueError):
+        tokens.split()
+
+
+def test_resumes_from_previous_text():
+    """
+    Typing one character at a time gives the same tokens as all at once.
+    """
+    text = 'volume create --name "my vol" -d local'
+    for i in range(len(text) + 1):
+        tokenizer = Tokenizer()
+        tokenizer.feed(text[:i])
+        expected = tokenizer.result(text[:i])
+        tokens = tokenize(text[:i])
+        assert tokens.words == expected.words
+        assert tokens.spans == expected.spans
+    assert tokenize(text) is tokenize(text)
+
+
+def test_command_and_cursor_word():
+    """
+    Command, word being typed and the one before it.
+    """
+    tokens = tokenize('volume create --na')
+    assert tokens.command == 'volume create'
+    assert tokens.word_before_cursor == '--na'
+    assert tokens.previous_word == 'create'
+
+    tokens = tokenize('run --name "a b" ')
+    assert tokens.word_before_cursor == ''
+    assert tokens.previous_word == 'a b'
+
+
+def test_lexer():
+    """
+    Command and option names are highlighted, the rest is not.
+    """
+    from wharfee.lexer import CommandLexer, COMMAND_STYLE, OPTION_STYLE
+
+    fragments = CommandLexer().lex_line('ps --all=true "-q" boo')
+    assert fragments == [
+        (COMMAND_STYLE, 'ps'),
+        ('', ' '),
+        (OPTION_STYLE, '--all'),
+        ('', '=true "-q" boo'),
+    ]
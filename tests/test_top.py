@@ -0,0 +1,57 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+
+from wharfee.top import processes_from_api, by_key, diff_processes, \
+    change_rows, format_changes
+from wharfee.formatter import format_data
+
+
+TITLES = ['UID', 'PID', 'PPID', 'C', 'STIME', 'TTY', 'TIME', 'CMD']
+
+
+def top(*processes):
+    return {'Titles': TITLES, 'Processes': [
+        ['root', pid, '0', '0', '10:00', '?', time, cmd]
+        for pid, time, cmd in processes]}
+
+
+def test_diff_processes():
+    """
+    Processes are matched by PID: started, exited and changed ones are
+    found and shown one per line.
+    """
+    before = by_key(processes_from_api('web', top(
+        ('1', '00:00:01', 'nginx'), ('7', '00:00:00', 'sleep 1'))))
+    after = by_key(processes_from_api('web', top(
+        ('1', '00:00:02', 'nginx'), ('9', '00:00:00', 'sh'))))
+
+    started, exited, changed = diff_processes(before, after)
+
+    assert [p.pid for p in started] == ['9']
+    assert [p.pid for p in exited] == ['7']
+    assert [(p.pid, fields) for p, fields in changed] == [
+        ('1', [('TIME', '00:00:01', '00:00:02')])]
+    rows = change_rows(started, exited, changed)
+    assert [(r['Change'], r['PID']) for r in rows] == [
+        ('-', '7'), ('+', '9'), ('~', '1')]
+    assert rows[2]['Changed'] == {'TIME': ['00:00:01', '00:00:02']}
+    assert format_changes(rows) == [
+        '- web 7  sleep 1',
+        '+ web 9  root  9  0  0  10:00  ?  00:00:00  sh',
+        '~ web 1  TIME: 00:00:01 -> 00:00:02',
+    ]
+    assert diff_processes(after, after) == ([], [], [])
+
+
+def test_processes_table():
+    """
+    Processes of several containers are listed in one table.
+    """
+    processes = processes_from_api('web', top(('1', '00:00:01', 'nginx')))
+    processes += processes_from_api('db', top(('5', '00:00:03', 'mysqld')))
+
+    lines = list(format_data('top', processes))
+
+    assert lines[0].split() == ['Container'] + TITLES
+    assert lines[3].split()[:2] == ['db', 'root']
+    assert processes[1].as_dict()['CMD'] == 'mysqld'
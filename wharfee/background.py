@@ -0,0 +1,141 @@
+# -*- coding: utf-8
+"""
+Completion in a background thread, so that slow sources (directories on
+network filesystems, huge name lists) don't block typing.
+"""
+import asyncio
+import threading
+
+from prompt_toolkit.completion import Completer
+
+
+class CompletionRequest(object):
+    """
+    Completions produced by a worker thread and taken by the event loop.
+    The worker hands them over in batches and wakes the loop up only when
+    the previous batch was taken.
+    """
+
+    def __init__(self, loop):
+        """
+        :param loop: asyncio event loop that takes completions
+        """
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.items = []
+        self.done = False
+        self.error = None
+        self.signalled = False
+
+    def produce(self, get_completions, *args):
+        """
+        Run in the worker thread: iterate completions until they run out or
+        the request is cancelled.
+        :param get_completions: function that returns iterable of Completion
+        :param args: arguments for it
+        """
+        try:
+            for completion in get_completions(*args):
+                if self.cancelled.is_set():
+                    return
+                self.put(completion)
+        except Exception as ex:
+            self.error = ex
+        finally:
+            self.put(None, done=True)
+
+    def put(self, completion, done=False):
+        """
+        Add completion and wake up the loop if it's not yet woken up.
+        :param completion: Completion or None
+        :param done: boolean: no more completions will come
+        """
+        with self.lock:
+            if completion is not None:
+                self.items.append(completion)
+            self.done = self.done or done
+            wake = not self.signalled
+            self.signalled = True
+        if wake:
+            try:
+                self.loop.call_soon_threadsafe(self.ready.set)
+            except RuntimeError:
+                # Loop is closed, nobody is waiting anymore.
+                self.cancelled.set()
+
+    async def take(self, timeout=None):
+        """
+        Wait for the next batch of completions.
+        :param timeout: float: seconds, or None to wait as long as needed
+        :return: tuple (list of Completion, boolean: no more will come)
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return [], False
+        with self.lock:
+            items, self.items = self.items, []
+            self.signalled = False
+            self.ready.clear()
+            done = self.done
+        if done and self.error is not None:
+            raise self.error
+        return items, done
+
+
+class BackgroundCompleter(Completer):
+    """
+    Run the wrapped completer in a worker thread. Completions are shown as
+    they come, until the budget runs out: then whatever was found is kept
+    and the worker is told to stop. A request is also stopped when the
+    document changes and prompt_toolkit asks for new completions.
+    """
+
+    def __init__(self, completer, budget=None):
+        """
+        :param completer: Completer
+        :param budget: float: seconds to wait for completions, or None
+        """
+        self.completer = completer
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.pending = None
+
+    def get_completions(self, document, complete_event):
+        return self.completer.get_completions(document, complete_event)
+
+    async def get_completions_async(self, document, complete_event):
+        loop = asyncio.get_running_loop()
+        request = CompletionRequest(loop)
+        with self.lock:
+            if self.pending is not None:
+                self.pending.cancelled.set()
+            self.pending = request
+
+        threading.Thread(
+            target=request.produce,
+            args=(self.completer.get_completions, document, complete_event),
+            name='completion',
+            daemon=True).start()
+
+        deadline = loop.time() + self.budget if self.budget else None
+        try:
+            done = False
+            while not done:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                items, done = await request.take(timeout)
+                if not items and not done:
+                    break
+                for completion in items:
+                    yield completion
+        finally:
+            request.cancelled.set()
+            with self.lock:
+                if self.pending is request:
+                    self.pending = None
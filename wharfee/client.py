@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8
+import os
 import sys
-import pretty
+import time
+import queue
+import threading
 import re
-import pexpect
 
+from concurrent import futures
+from docker import __version__ as docker_py_version
 from docker import APIClient as DockerAPIClient
 from docker.utils import kwargs_from_env
 from docker.errors import APIError
@@ -14,12 +18,33 @@ from requests.packages.urllib3 import disable_warnings
 from .options import allowed_args
 from .options import parse_command_options
 from .options import format_command_help, format_command_line
-from .options import COMMAND_NAMES, split_command_and_args
+from .options import COMMAND_NAMES
 from .options import OptionError
-from .helpers import filesize, parse_port_bindings, parse_volume_bindings, \
-    parse_exposed_ports, parse_kv_as_dict
-from .utils import shlex_split
+from .helpers import parse_port_bindings, parse_volume_bindings, \
+    parse_exposed_ports, parse_kv_as_dict, parse_timestamp, read_image_list
+from .tokenizer import tokenize
 from .decorators import if_exception_return
+from .parallel import execute_parallel
+from .resolver import ObjectResolver, CONTAINER, IMAGE
+from .records import Container, Image, Volume
+from .context import BuildContext
+from .stats import ContainerStats
+from .top import processes_from_api, by_key, diff_processes, change_rows
+from .streams import read_response, from_demux, from_chunks
+
+# Seconds between refreshes of "top --watch", and of "ps --watch" when
+# there are no events to go by.
+WATCH_INTERVAL = 2.0
+# Seconds between refreshes of "ps --watch" with events.
+WATCH_REFRESH = 30.0
+# Seconds to wait for more events before reading the listing again.
+WATCH_SETTLE = 0.1
+
+# docker-py versions whose private request helpers are used to read logs
+# with stream types, see DockerClient.logs_response.
+RAW_LOGS_VERSIONS = (7,)
+RAW_LOGS_METHODS = ('_get', '_url', '_raise_for_status',
+                    '_get_raw_response_socket', '_disable_socket_timeout')
 
 
 class DockerClient(object):
@@ -31,19 +56,28 @@ class DockerClient(object):
     is named "limit", some parameters are not implemented at all, etc.
     """
 
-    def __init__(self, timeout=None, clear_handler=None, refresh_handler=None, logger=None):
+    def __init__(self, timeout=None, clear_handler=None, refresh_handler=None, logger=None,
+                 parallel=1, hosts=None, host_timeout=None, instance=None):
         """
         Initialize the Docker wrapper.
         :param timeout: int
         :param clear_handler: callable
         :param refresh_handler: callable
         :param logger: logger
+        :param parallel: int: default number of concurrent API calls for
+        commands that take multiple targets
+        :param hosts: dict: host name to daemon URL. If given, listings and
+        inspect go to all of these hosts instead of the default one
+        :param host_timeout: int: how long to wait for each of the hosts
+        :param instance: DockerAPIClient to use instead of creating one, for
+        several clients that share the connection
         """
 
         assert callable(clear_handler)
         assert callable(refresh_handler)
 
         self.logger = logger
+        self.parallel = parallel
         self.exception = None
 
         self.handlers = {
@@ -84,6 +118,8 @@ class DockerClient(object):
             'start': (self.start, "Restart a stopped container."),
             'stop': (self.stop, "Stop a running container."),
             'tag': (self.tag, "Tag an image into a repository."),
+            'stats': (self.stats, ("Display a live stream of container(s) "
+                                   "resource usage statistics.")),
             'top': (self.top, "Display the running processes of a container."),
             'unpause': (self.unpause, ("Unpause all processes within a "
                                        "container.")),
@@ -96,6 +132,7 @@ class DockerClient(object):
         }
 
         self.output = None
+        self.output_format = None
         self.after = None
         self.command = None
         self.log = None
@@ -105,8 +142,27 @@ class DockerClient(object):
         self.is_refresh_images = False
         self.is_refresh_volumes = False
 
+        self.timeout = timeout
+        self.events_instance = None
+        self.resolver = ObjectResolver()
+
+        self.hosts = dict(hosts) if hosts else {}
+        self.host_timeout = host_timeout or timeout
+        self.host_instances = {}
+        self.host_resolvers = dict((h, ObjectResolver()) for h in self.hosts)
+        self.hosts_lock = threading.Lock()
+        self.local = threading.local()
+
         disable_warnings()
 
+        self.instance = instance or self.create_instance(timeout)
+
+    def create_instance(self, timeout=None):
+        """
+        Create the docker-py API client from the environment.
+        :param timeout: int
+        :return: DockerAPIClient
+        """
         if sys.platform.startswith('darwin') \
                 or sys.platform.startswith('win32'):
             try:
@@ -118,7 +174,7 @@ class DockerClient(object):
                 if 'tls' in kwargs:
                     kwargs['tls'].assert_hostname = False
                 kwargs['timeout'] = timeout
-                self.instance = DockerAPIClient(**kwargs)
+                return DockerAPIClient(**kwargs)
 
             except DockerException as x:
                 if 'CERTIFICATE_VERIFY_FAILED' in str(x):
@@ -131,7 +187,101 @@ class DockerClient(object):
             # unix-based
             kwargs = kwargs_from_env()
             kwargs['timeout'] = timeout
-            self.instance = DockerAPIClient(**kwargs)
+            return DockerAPIClient(**kwargs)
+
+    def events(self, since=None, filters=None):
+        """
+        Subscribe to the daemon events stream. The stream can stay idle
+        for a long time, so it gets its own connection without a read
+        timeout.
+        :param since: int: timestamp to replay events from
+        :param filters: dict
+        :return: cancellable iterable of event dicts
+        """
+        if self.events_instance is None:
+            self.events_instance = self.create_instance(None)
+        return self.events_instance.events(
+            since=since, filters=filters, decode=True)
+
+    def host_instance(self, host):
+        """
+        API client for one of the configured hosts. Created on first use,
+        which connects to the daemon, so it happens on a worker thread.
+        :param host: string
+        :return: DockerAPIClient
+        """
+        with self.hosts_lock:
+            instance = self.host_instances.get(host)
+        if instance is None:
+            instance = DockerAPIClient(base_url=self.hosts[host],
+                                       timeout=self.host_timeout)
+            with self.hosts_lock:
+                instance = self.host_instances.setdefault(host, instance)
+        return instance
+
+    def resolver_for(self, host):
+        """
+        Names and IDs are only unique within a host.
+        :param host: string or None for the default host
+        :return: ObjectResolver
+        """
+        return self.resolver if host is None else self.host_resolvers[host]
+
+    def list_hosts(self, func, errors=None):
+        """
+        Call func(instance, host) on all configured hosts concurrently, and
+        merge the resulting lists in the order of host names. Hosts that
+        fail or don't respond within host_timeout are skipped and reported
+        after the command output. Without configured hosts, this is just
+        func(self.instance, None).
+        :param func: callable returning a list
+        :param errors: list to add host errors to, for callers that run
+        on worker threads or after the command has returned
+        :return: list
+        """
+        if not self.hosts:
+            return func(self.instance, None)
+
+        def call(host):
+            return func(self.host_instance(host), host)
+
+        hosts = sorted(self.hosts)
+        failed = []
+        merged = []
+        for host, result, ex in execute_parallel(
+                call, hosts, len(hosts), ordered=True,
+                timeout=self.host_timeout):
+            if isinstance(ex, futures.TimeoutError):
+                failed.append('Host {0} did not respond in {1} s.'.format(
+                    host, self.host_timeout))
+            elif isinstance(ex, APIError):
+                failed.append('Host {0}: {1}'.format(host, ex.explanation))
+            elif ex is not None:
+                failed.append('Host {0}: {1}'.format(host, ex))
+            elif result:
+                merged.extend(result)
+
+        for error in failed:
+            self.debug(error)
+
+        if errors is None:
+            # Only report to the command being run, not to background loads.
+            errors = getattr(self.local, 'host_errors', None)
+        if errors is not None:
+            errors.extend(failed)
+
+        return merged
+
+    def interact(self, command):
+        """
+        Run the official CLI command and hand the terminal over to it.
+        :param command: string
+        """
+        # Only needed for a handful of commands, so don't import on start.
+        import pexpect
+
+        process = pexpect.spawnu(command)
+        process.interact()
 
     def debug(self, message):
         """Log a debug message if logger is passed in."""
@@ -161,9 +311,16 @@ class DockerClient(object):
             self.after = None
             self.log = None
             self.exception = None
+            self.output_format = None
+
+        tokens = tokenize(text)
+        words = tokens.split()
+        cmd, params = tokens.command, tokens.args
 
-        tokens = shlex_split(text) if text else ['']
-        cmd, params = split_command_and_args(tokens)
+        if self.is_refresh_containers or self.is_refresh_images:
+            # Previous command created something we may have failed to
+            # inspect before.
+            self.resolver.forget_missing()
 
         reset_output()
 
@@ -173,15 +330,19 @@ class DockerClient(object):
 
             if params:
                 try:
-                    if '-h' in tokens or '--help' in tokens:
+                    if '-h' in words or '--help' in words:
                         self.output = [format_command_help(cmd)]
                     else:
                         parser, popts, pargs = parse_command_options(
                             cmd, params)
                         if 'help' in popts:
                             del popts['help']
+                        # Output format is for the CLI, not for the command.
+                        self.output_format = popts.pop('format', None)
 
+                        self.local.host_errors = []
                         self.output = handler(*pargs, **popts)
+                        self.report_host_errors()
 
                 except APIError as ex:
                     reset_output()
@@ -195,10 +356,21 @@ class DockerClient(object):
                     reset_output()
                     self.output = [ex.__repr__()]
             else:
+                self.local.host_errors = []
                 self.output = handler()
+                self.report_host_errors()
         elif cmd:
             self.output = self.help()
 
+    def report_host_errors(self):
+        """
+        Show hosts that could not be listed after the command output.
+        """
+        errors = self.local.host_errors
+        self.local.host_errors = None
+        if errors and not self.after:
+            self.after = lambda: errors
+
     def attach(self, *args, **kwargs):
         """
         Attach to a running container.
@@ -218,8 +390,7 @@ class DockerClient(object):
         self.after = on_after
 
         command = format_command_line('attach', False, args, kwargs)
-        process = pexpect.spawnu(command)
-        process.interact()
+        self.interact(command)
 
     def help(self, *_):
         """
@@ -261,70 +432,145 @@ class DockerClient(object):
     def inspect(self, *args, **_):
         """
         Return image or container info. Equivalent of docker inspect.
-        :return: dict
+        :return: iterable of dicts
         """
 
         if not args or len(args) == 0:
-            yield 'Container or image ID is required.'
-
-        cids, cnames, imids, imnames = set(), set(), set(), set()
-
-        cs = self.containers(all=True)
-        if cs and len(cs) > 0 and isinstance(cs[0], dict):
-            cids = set([c['Id'] for c in cs])
-            cnames = set([name for c in cs for name in c['Names']])
-
-        ims = self.images(all=True)
-        if ims and len(ims) > 0 and isinstance(ims[0], dict):
-            imids = set([i['Id'] for i in ims])
-            imnames = set([i['Repository'] for i in ims])
+            return ['Container or image ID is required.']
+
+        # Names are inspected lazily on worker threads, so host errors
+        # can't go through self.local, and are only known once the output
+        # has been read.
+        errors = []
+        if self.hosts:
+            self.after = lambda: errors
+
+        def inspect_one(name):
+            def inspect_on_host(instance, host):
+                info = self.resolver_for(host).inspect(name, instance)
+                if info is None:
+                    return []
+                if host is None:
+                    return [info]
+                # With several hosts, say which one this came from.
+                return [dict(Host=host, **info)]
+            failed = []
+            return self.list_hosts(inspect_on_host, failed), failed
+
+        def inspect_all():
+            for name, result, ex in execute_parallel(
+                    inspect_one, args, self.parallel, ordered=True):
+                if isinstance(ex, APIError):
+                    yield '{0}: {1}'.format(name, ex.explanation)
+                    continue
+                elif ex is not None:
+                    raise ex
+                infos, failed = result
+                for error in failed:
+                    if error not in errors:
+                        errors.append(error)
+                if infos:
+                    for info in infos:
+                        yield info
+                elif not failed:
+                    # If a host failed, it may have been there.
+                    yield 'Container or image not found: {0}.'.format(name)
 
-        for name in args:
-            if name in cids or name in cnames:
-                info = self.instance.inspect_container(name)
-            elif name in imids or name in imnames:
-                info = self.instance.inspect_image(name)
-            else:
-                info = 'Container or image ID is required.'
-            yield info
+        return inspect_all()
 
-    def containers(self, *_, **kwargs):
+    def containers(self, *args, **kwargs):
         """
         Return the list of containers. Equivalent of docker ps.
-        :return: list of dicts
+        :return: list of dicts, or with --watch, iterable of lists
         """
+        watch = kwargs.pop('watch', None)
+        interval = kwargs.pop('interval', None)
 
         # Truncate by default.
         if 'trunc' in kwargs and kwargs['trunc'] is None:
             kwargs['trunc'] = True
 
-        def format_names(names):
-            """
-            Container names start with /.
-            Let's strip this for readability.
-            """
-            if isinstance(names, list):
-                formatted = []
-                for name in names:
-                    if isinstance(name, str):
-                        formatted.append(name.lstrip('/'))
-                    else:
-                        formatted.append(name)
-                return formatted
-            return names
-
-        csdict = self.instance.containers(**kwargs)
-        if len(csdict) > 0:
-
-            if 'quiet' not in kwargs or not kwargs['quiet']:
-                for i in range(len(csdict)):
-                    csdict[i]['Names'] = format_names(csdict[i]['Names'])
-                    csdict[i]['Created'] = pretty.date(csdict[i]['Created'])
+        def list_containers(instance, host):
+            result = instance.containers(**kwargs)
+            if kwargs.get('quiet'):
+                return result
+            result = [Container.from_api(c, host) for c in result]
+            resolver = self.resolver_for(host)
+            for c in result:
+                resolver.remember(CONTAINER, c.names, [c.id])
+            return result
 
-            return csdict
+        if watch:
+            if kwargs.get('quiet'):
+                return ['Cannot use --quiet with --watch.']
+            if interval is not None and interval <= 0:
+                return ['Invalid --interval value: {0}.'.format(interval)]
+            return self.watch_listing(
+                lambda: self.list_hosts(list_containers), 'container',
+                WATCH_INTERVAL if interval is None else interval)
+        elif interval is not None:
+            return ['Cannot use --interval without --watch.']
+
+        result = self.list_hosts(list_containers)
+        if len(result) > 0:
+            return result
         else:
             return ['There are no containers to list.']
 
+    def watch_listing(self, listing, event_type, interval):
+        """
+        Yield the listing again whenever it changes. It is read again after
+        events of event_type from the daemon, or every "interval" seconds
+        if there are no events to go by: with several hosts, or when the
+        events stream is not available.
+        :param listing: callable returning a list of records
+        :param event_type: string: "container", "image" or "volume"
+        :param interval: float: seconds
+        :return: iterable of lists of records
+        """
+        wake = threading.Event()
+        stopped = threading.Event()
+        listening = []
+
+        def listen():
+            try:
+                stream = self.instance.events(
+                    decode=True, filters={'type': event_type})
+                listening.append(stream)
+                for _ in stream:
+                    if stopped.is_set():
+                        return
+                    wake.set()
+            except Exception as ex:
+                self.debug('Events stream error: {0!r}.'.format(ex))
+            finally:
+                del listening[:]
+                # Back to polling.
+                wake.set()
+
+        if not self.hosts:
+            threading.Thread(target=listen, name='watch', daemon=True).start()
+
+        previous = None
+        try:
+            while True:
+                wake.clear()
+                records = listing()
+                rows = [r.row() for r in records]
+                if rows != previous:
+                    previous = rows
+                    yield records
+
+                # Even with events, relative times ("Up 5 minutes") need
+                # to be brought up to date now and then.
+                if wake.wait(WATCH_REFRESH if listening else interval):
+                    # A burst of events (compose up) is read once.
+                    stopped.wait(WATCH_SETTLE)
+        finally:
+            stopped.set()
+            for stream in listening:
+                stream.close()
+
     def pause(self, *args, **kwargs):
         """
         Pause all processes in a container. Equivalent of docker pause.
@@ -405,21 +651,20 @@ class DockerClient(object):
         else:
             containers = args
 
+        parallel, ordered = self._pop_parallel(kwargs)
         kwargs = allowed_args('rm', **kwargs)
 
+        def remove(container):
+            self.instance.remove_container(container, **kwargs)
+            self.is_refresh_containers = True
+            self.is_refresh_running = True
+
         def stream():
-            for container in containers:
-                try:
-                    self.instance.remove_container(container, **kwargs)
-                    self.is_refresh_containers = True
-                    self.is_refresh_running = True
-                    if truncate_output:
-                        yield "{0:.25}".format(container)
-                    else:
-                        yield container
-                except APIError as ex:
-                    yield '{0:.25}: {1}'.format(container, ex.explanation)
-            yield 'Removed: {0} container(s).'.format(len(containers) if containers else 0)
+            failed = []
+            for line in self.stream_targets(containers, remove, parallel, ordered,
+                                            truncate_output, failed=failed):
+                yield line
+            yield 'Removed: {0} container(s).'.format(len(containers) - len(failed))
 
         return stream()
 
@@ -462,21 +707,15 @@ class DockerClient(object):
         else:
             images = args
 
+        parallel, ordered = self._pop_parallel(kwargs)
         kwargs = allowed_args('rmi', **kwargs)
 
-        def stream():
-            for image in images:
-                try:
-                    self.instance.remove_image(image, **kwargs)
-                    self.is_refresh_images = True
-                    if truncate_output:
-                        yield "{:.25}".format(image)
-                    else:
-                        yield image
-                except APIError as ex:
-                    yield '{0:.25}: {1}'.format(image, ex.explanation)
+        def remove(image):
+            self.instance.remove_image(image, **kwargs)
+            self.is_refresh_images = True
 
-        return stream()
+        return self.stream_targets(images, remove, parallel, ordered,
+                                   truncate_output)
 
     def run(self, *args, **kwargs):
         """
@@ -576,12 +815,13 @@ class DockerClient(object):
         if not args:
             return ['Container name is required.']
 
-        def stream():
-            for container in args:
-                self.instance.restart(container, **kwargs)
-                yield container
+        parallel, ordered = self._pop_parallel(kwargs)
 
-        return stream()
+        def restart(container):
+            self.instance.restart(container, **kwargs)
+            self.is_refresh_running = True
+
+        return self.stream_targets(args, restart, parallel, ordered)
 
     @if_exception_return(InvalidVersion, None)
     def volume_create(self, *args, **kwargs):
@@ -612,12 +852,14 @@ class DockerClient(object):
 
         kwargs = self._add_filters(kwargs)
 
-        vdict = self.instance.volumes(**kwargs)
-        result = vdict.get('Volumes', None)
+        def list_volumes(instance, host):
+            result = instance.volumes(**kwargs).get('Volumes', None) or []
+            if quiet:
+                return [{'Name': volume['Name']} for volume in result]
+            return [Volume.from_api(volume, host) for volume in result]
 
+        result = self.list_hosts(list_volumes)
         if result:
-            if quiet:
-                result = [volume['Name'] for volume in result]
             return result
         else:
             return ['There are no volumes to list.']
@@ -632,18 +874,15 @@ class DockerClient(object):
         if not args:
             return ['Volume name is required.']
 
-        def stream():
-            for volume in args:
-                try:
-                    self.instance.remove_volume(volume)
-                    self.is_refresh_volumes = True
-                    yield volume
-                except APIError as x:
-                    yield 'Could not remove volume {0}: {1}.'.format(
-                        volume,
-                        x.explanation)
+        parallel, ordered = self._pop_parallel(kwargs)
 
-        return stream()
+        def remove(volume):
+            self.instance.remove_volume(volume)
+            self.is_refresh_volumes = True
+
+        return self.stream_targets(
+            args, remove, parallel, ordered,
+            error_format='Could not remove volume {0}: {1}.')
 
     @if_exception_return(InvalidVersion, None)
     def volume_inspect(self, *args, **_):
@@ -655,7 +894,8 @@ class DockerClient(object):
         if not args or len(args) == 0:
             yield 'Volume name is required.'
 
-        vnames = self.volume_ls(quiet=True)
+        vnames = [v['Name'] for v in self.volume_ls(quiet=True)
+                  if isinstance(v, dict)]
 
         for vname in args:
             if vname in vnames:
@@ -687,6 +927,49 @@ class DockerClient(object):
         else:
             return ['Error tagging {0} into {1}.'.format(*args)]
 
+    def _pop_parallel(self, params):
+        """
+        Remove parallel execution options from kwargs.
+        :param params: dict
+        :return: tuple of (int, boolean)
+        """
+        parallel = params.pop('parallel', None)
+        ordered = params.pop('ordered', None)
+        if parallel is None:
+            parallel = self.parallel
+        return parallel, bool(ordered)
+
+    def stream_targets(self, targets, action, parallel=1, ordered=False,
+                       truncate_output=False, error_format='{0:.25}: {1}',
+                       failed=None):
+        """
+        Call action for every target, up to "parallel" at a time, and stream
+        the results as they complete. If anything failed, finish with a
+        summary of errors per target.
+        :param targets: list of container, image or volume names
+        :param action: callable taking a single target
+        :param parallel: int
+        :param ordered: boolean: output in the order targets were given
+        :param truncate_output: boolean: shorten target names (IDs)
+        :param error_format: string to format target and error message
+        :param failed: list to collect (target, message) of failures into
+        :return: iterable
+        """
+        failed = [] if failed is None else failed
+
+        for target, _, ex in execute_parallel(action, targets, parallel, ordered):
+            if ex is None:
+                yield "{0:.25}".format(target) if truncate_output else target
+            else:
+                message = ex.explanation if isinstance(ex, APIError) else str(ex)
+                failed.append((target, message))
+                yield error_format.format(target, message)
+
+        if failed and len(targets) > 1:
+            yield 'Failed: {0} of {1}.'.format(len(failed), len(targets))
+            for target, message in failed:
+                yield '  {0:.25}: {1}'.format(target, message)
+
     def _add_filters(self, params):
         """
         Update kwargs if filters are present.
@@ -852,18 +1135,15 @@ class DockerClient(object):
             result = self.instance.exec_create(**exec_args)
 
             if result and 'Id' in result:
+                if is_detach:
+                    self.instance.exec_start(result['Id'], detach=True)
+                    return [kwargs['container']]
+
                 output = self.instance.exec_start(
                     result['Id'],
-                    detach=is_detach,
-                    stream=True)
-                # Decode bytes to string for Python 3 compatibility
-                def decode_output(stream):
-                    for chunk in stream:
-                        if isinstance(chunk, bytes):
-                            yield chunk.decode('utf-8', errors='replace')
-                        else:
-                            yield chunk
-                return decode_output(output)
+                    stream=True,
+                    demux=True)
+                return from_demux(output)
 
             return ['There was a problem executing the command.']
 
@@ -876,12 +1156,27 @@ class DockerClient(object):
         if not args:
             return ['Directory path or URL is required.']
 
-        kwargs['path'] = args[0]
+        path = args[0]
         kwargs['rm'] = bool(kwargs['rm'])
 
         self.is_refresh_images = True
 
-        return self.instance.build(**kwargs)
+        if not os.path.isdir(path):
+            # URL or git repository: the daemon fetches it.
+            return self.instance.build(path=path, **kwargs)
+
+        # The context is sent while it's being archived, so by the time
+        # build returns, it's all sent.
+        context = BuildContext(path)
+        output = self.instance.build(fileobj=context.stream(),
+                                     custom_context=True, **kwargs)
+
+        def stream():
+            yield {'stream': context.summary() + '\n'}
+            for line in output:
+                yield line
+
+        return stream()
 
     def shell(self, *args, **_):
         """
@@ -902,8 +1197,7 @@ class DockerClient(object):
         self.after = lambda: ['\rShell to {0} is closed.'.format(container)]
 
         command = 'docker exec -it {0} {1}'.format(container, shellcmd)
-        process = pexpect.spawnu(command)
-        process.interact()
+        self.interact(command)
 
     def start(self, *args, **kwargs):
         """
@@ -982,68 +1276,107 @@ class DockerClient(object):
         self.after = lambda: ['\r']
 
         command = format_command_line('login', False, args, kwargs)
-        process = pexpect.spawnu(command)
-        process.interact()
+        self.interact(command)
 
     def logs(self, *args, **kwargs):
         """
         Retrieve container logs. Equivalent of docker logs.
+        Logs are always streamed, to keep memory use flat however large
+        they are.
         :param kwargs:
-        :return: Iterable output
+        :return: Iterable of (stream, bytes) frames
         """
         if not args:
             return ['Container ID/name is required.']
 
-        kwargs['container'] = args[0]
+        container = args[0]
 
-        result = self.instance.logs(**kwargs)
-        if isinstance(result, bytes):
-            result = result.decode()
-        if not kwargs['stream']:
-            result = [result]
-        return result
+        params = {
+            'stdout': 1,
+            'stderr': 1,
+            'follow': 1 if kwargs.get('follow') else 0,
+            'timestamps': 1 if kwargs.get('timestamps') else 0,
+            'tail': kwargs.get('tail') or 'all',
+        }
+
+        if params['tail'] != 'all' and not params['tail'].isdigit():
+            return ['Invalid --tail value: {0}.'.format(params['tail'])]
+
+        for key in ['since', 'until']:
+            if kwargs.get(key):
+                try:
+                    params[key] = '{0:.9f}'.format(
+                        parse_timestamp(kwargs[key]))
+                except ValueError:
+                    return ['Invalid --{0} value: {1}.'.format(
+                        key, kwargs[key])]
+
+        return self.logs_response(container, params)
+
+    def logs_response(self, container, params):
+        """
+        Stream the logs of a container. The public APIClient.logs strips
+        the frame headers, so stderr can't be told from stdout, and always
+        disables the read timeout. Where docker-py is known to have them,
+        its request helpers are used to read the frames instead. Otherwise,
+        everything is shown as stdout.
+        :param container: string
+        :param params: dict: query parameters of the logs endpoint
+        :return: iterable of (stream, bytes) frames
+        """
+        instance = self.instance
+        major = int(docker_py_version.split('.')[0])
+        if major not in RAW_LOGS_VERSIONS or \
+                not all(hasattr(instance, m) for m in RAW_LOGS_METHODS):
+            kwargs = dict(
+                (key, float(params[key])) for key in ['since', 'until']
+                if key in params)
+            tail = params['tail']
+            return from_chunks(instance.logs(
+                container, stream=True, follow=bool(params['follow']),
+                timestamps=bool(params['timestamps']),
+                tail=int(tail) if tail != 'all' else tail, **kwargs))
+
+        # Frames are only multiplexed if the container has no TTY.
+        info = instance.inspect_container(container)
+        tty = info.get('Config', {}).get('Tty', False)
+
+        response = instance._get(
+            instance._url('/containers/{0}/logs', container),
+            params=params, stream=True)
+        instance._raise_for_status(response)
+
+        # With --follow the stream can stay idle for a long time. Without
+        # it, the timeout still applies to a daemon that stops answering.
+        if params['follow']:
+            instance._disable_socket_timeout(
+                instance._get_raw_response_socket(response))
+
+        return read_response(response, tty)
 
     def images(self, *_, **kwargs):
         """
         Return the list of images. Equivalent of docker images.
         :return: list of dicts
         """
-        result = self.instance.images(**kwargs)
-        re_digits = re.compile('^[0-9]+$', re.UNICODE)
-
-        def convert_image_dict(a):
-            """
-            Drop some keys and change some values to pretty-print image dict.
-            """
-            b = {}
-            for k, v in a.items():
-                if k not in ['RepoTags', 'RepoDigests', 'Labels', 'Size']:
-                    b[k] = v
-                if k == 'Created' and v and re_digits.search(str(v)):
-                    b[k] = pretty.date(v)
-                if k == 'VirtualSize':
-                    b[k] = filesize(v)
-
-            # If we have more than one repo tag, return as many dicts
-
-            if a.get('RepoTags', None) is None:
-                a['RepoTags'] = ['<none>:<none>']
-
-            for rt in a['RepoTags']:
-                repo, tag = rt.rsplit(':', 1)
-                c = {}
-                c.update(b)
-                c['Repository'] = repo
-                c['Tag'] = tag
-                yield c
-
+        def list_images(instance, host):
+            result = instance.images(**kwargs)
+            if kwargs.get('quiet'):
+                return [{'Id': x} for x in result]
+            converted = []
+            resolver = self.resolver_for(host)
+            for x in result:
+                images = list(Image.from_api(x, host))
+                resolver.remember(
+                    IMAGE,
+                    [im.repo_tag for im in images
+                     if im.repo_tag != '<none>:<none>'],
+                    [x['Id']])
+                converted.extend(images)
+            return converted
+
+        result = self.list_hosts(list_images)
         if len(result) > 0:
-            if isinstance(result[0], dict):
-                converted = []
-                for x in result:
-                    for y in convert_image_dict(x):
-                        converted.append(y)
-                return converted
             return result
         else:
             return ['There are no images to list.']
@@ -1080,16 +1413,13 @@ class DockerClient(object):
         if not args:
             return ['Container name is required.']
 
-        def stream():
-            for container in args:
-                try:
-                    self.instance.stop(container, **kwargs)
-                    self.is_refresh_running = True
-                    yield container
-                except APIError as ex:
-                    yield '{0:.25}: {1}'.format(container, ex.explanation)
+        parallel, ordered = self._pop_parallel(kwargs)
 
-        return stream()
+        def stop(container):
+            self.instance.stop(container, **kwargs)
+            self.is_refresh_running = True
+
+        return self.stream_targets(args, stop, parallel, ordered)
 
     def kill(self, *args, **kwargs):
         """
@@ -1100,29 +1430,228 @@ class DockerClient(object):
         if not args:
             return ['Container name is required.']
 
-        def stream():
-            for container in args:
-                try:
-                    self.instance.kill(container, **kwargs)
-                    self.is_refresh_running = True
-                    yield container
-                except APIError as ex:
-                    yield '{0:.25}: {1}'.format(container, ex.explanation)
+        parallel, ordered = self._pop_parallel(kwargs)
 
-        return stream()
+        def kill(container):
+            self.instance.kill(container, **kwargs)
+            self.is_refresh_running = True
+
+        return self.stream_targets(args, kill, parallel, ordered)
 
     def top(self, *args, **kwargs):
         """
-        Show top processes in a container. Equivalent of docker rm.
+        Show top processes in containers. Equivalent of docker top, for
+        several containers at once.
         :param kwargs:
-        :return: Container ID or iterable output.
+        :return: dict for a single container, list of Process for several,
+        with --watch iterable output.
         """
         if not args:
             return ['Container name is required.']
 
-        container = args[0]
-        result = self.instance.top(container, **kwargs)
-        return result
+        watch = kwargs.pop('watch', None)
+        interval = kwargs.pop('interval', None)
+        containers = list(args)
+
+        if watch:
+            if interval is not None and interval <= 0:
+                return ['Invalid --interval value: {0}.'.format(interval)]
+            return self.watch_top(
+                containers, WATCH_INTERVAL if interval is None else interval,
+                **kwargs)
+        elif interval is not None:
+            return ['Cannot use --interval without --watch.']
+
+        if len(containers) == 1:
+            return self.instance.top(containers[0], **kwargs)
+
+        processes, failed = self.top_all(containers, **kwargs)
+        if failed:
+            self.report_failed(failed)
+        return processes or ['There are no processes to list.']
+
+    def top_all(self, containers, **kwargs):
+        """
+        Processes of all containers, asked for "parallel" at a time.
+        :param containers: list of container IDs or names
+        :return: tuple of (list of Process, list of (container, message))
+        """
+        def top_one(container):
+            return self.instance.top(container, **kwargs)
+
+        processes, failed = [], []
+        for container, data, ex in execute_parallel(
+                top_one, containers, self.parallel, ordered=True):
+            if ex is None:
+                processes.extend(processes_from_api(container, data))
+            else:
+                failed.append((container, ex.explanation
+                               if isinstance(ex, APIError) else str(ex)))
+        return processes, failed
+
+    def watch_top(self, containers, interval, **kwargs):
+        """
+        Look at processes of all containers every "interval" seconds. The
+        first time, all of them are listed, after that only processes
+        that started, exited or changed.
+        :param containers: list of container IDs or names
+        :param interval: float: seconds
+        :return: iterable: list of Process, then lists of dicts from
+        change_rows, and strings for errors
+        """
+        before = None
+        errors = {}
+        next_poll = time.monotonic()
+        while True:
+            processes, failed = self.top_all(containers, **kwargs)
+
+            # Errors are shown when they first happen.
+            for container, message in failed:
+                if errors.get(container) != message:
+                    yield '! {0:.25}: {1}'.format(container, message)
+            errors = dict(failed)
+
+            after = by_key(processes)
+            if before is None:
+                yield processes
+            else:
+                rows = change_rows(*diff_processes(before, after))
+                if rows:
+                    yield rows
+            before = after
+
+            # After a slow poll, start again from now instead of polling
+            # back to back to catch up.
+            next_poll = max(next_poll + interval, time.monotonic())
+            time.sleep(max(0.0, next_poll - time.monotonic()))
+
+    def stats(self, *args, **kwargs):
+        """
+        Show resource usage of containers. Equivalent of docker stats.
+        :param kwargs:
+        :return: list of Stats with --no-stream, otherwise iterable of
+        lists of Stats, one list per refresh.
+        """
+        containers = list(args)
+        if not containers:
+            containers = [c['Id'] for c in self.instance.containers(
+                all=bool(kwargs.get('all')))]
+        if not containers:
+            return ['There are no containers to show.']
+
+        if kwargs.get('no_stream'):
+            return self.stats_snapshot(containers)
+        return self.stats_stream(containers)
+
+    def report_failed(self, failed):
+        """
+        Report containers that could not be read, after the output.
+        :param failed: list of (container, message)
+        """
+        def on_after():
+            return ['{0:.25}: {1}'.format(container, message)
+                    for container, message in failed]
+
+        self.after = on_after
+
+    def stats_snapshot(self, containers):
+        """
+        One sample of every container, "parallel" requested at a time: the
+        daemon takes about a second to answer each of them.
+        :param containers: list of container IDs or names
+        :return: list of Stats
+        """
+        def sample(container):
+            stats = ContainerStats(container)
+            stats.add(self.instance.stats(container, stream=False))
+            return stats.record()
+
+        result, failed = [], []
+        for container, record, ex in execute_parallel(
+                sample, containers, self.parallel, ordered=True):
+            if ex is None:
+                result.append(record)
+            else:
+                failed.append((container, ex.explanation
+                               if isinstance(ex, APIError) else str(ex)))
+
+        if failed:
+            self.report_failed(failed)
+        return result or ['Could not read stats of any container.']
+
+    def stats_stream(self, containers, interval=1.0):
+        """
+        Read stats streams of all containers, each on its own thread, and
+        yield the latest sample of all of them at most every "interval"
+        seconds.
+        :param containers: list of container IDs or names
+        :param interval: float: seconds
+        :return: iterable of lists of Stats
+        """
+        stats = [ContainerStats(c) for c in containers]
+        updates = queue.Queue()
+        stopped = threading.Event()
+        failed = []
+
+        def read_one(index):
+            stream = self.instance.stats(containers[index], decode=True,
+                                         stream=True)
+            try:
+                for data in stream:
+                    if stopped.is_set():
+                        return
+                    stats[index].add(data)
+                    updates.put(index)
+            finally:
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+
+        def read_all():
+            try:
+                # Not bound by "parallel": a stream only ends when it's
+                # closed, so every container needs a thread of its own to
+                # be read at all.
+                for index, _, ex in execute_parallel(
+                        read_one, range(len(containers)), len(containers)):
+                    if ex is not None:
+                        failed.append((containers[index], ex.explanation
+                                       if isinstance(ex, APIError)
+                                       else str(ex)))
+            finally:
+                updates.put(None)
+
+        self.report_failed(failed)
+        threading.Thread(target=read_all, name='stats', daemon=True).start()
+
+        try:
+            # First table as soon as every container has a sample.
+            waiting = set(range(len(containers)))
+            next_draw = time.monotonic() + interval
+            changed = done = False
+            while not done:
+                timeout = None
+                if changed:
+                    timeout = max(0.0, next_draw - time.monotonic())
+                try:
+                    index = updates.get(timeout=timeout)
+                    if index is None:
+                        done = True
+                    else:
+                        changed = True
+                        if waiting is not None:
+                            waiting.discard(index)
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                if changed and (done or now >= next_draw or waiting == set()):
+                    yield [s.record() for s in stats if len(s.samples)]
+                    changed = False
+                    next_draw = now + interval
+                    waiting = None
+        finally:
+            stopped.set()
 
     def pull(self, *args, **kwargs):
         """
@@ -1131,16 +1660,85 @@ class DockerClient(object):
         :return: Container ID or iterable output.
         """
 
-        if not args:
+        parallel, _ = self._pop_parallel(kwargs)
+        images = list(args)
+
+        path = kwargs.pop('file', None)
+        if path:
+            try:
+                images.extend(read_image_list(path))
+            except IOError as ex:
+                return ['Cannot read {0}: {1}.'.format(path, ex.strerror)]
+
+        if not images:
             return ['Image name is required.']
 
-        image = args[0]
+        if len(images) > 1:
+            self.is_refresh_images = True
+            return self.pull_many(images, parallel, **kwargs)
+
         kwargs['stream'] = True
-        result = self.instance.pull(image, **kwargs)
+        result = self.instance.pull(images[0], **kwargs)
         self.is_refresh_images = True
 
         return result
 
+    def pull_many(self, images, parallel, **kwargs):
+        """
+        Pull images, up to "parallel" at a time, and stream their progress
+        messages merged together. Messages that are not about a layer are
+        tagged with the image, so they can be told apart. Finish with the
+        total time and failures, if any.
+        :param images: list of image names
+        :param parallel: int
+        :param kwargs: pull arguments
+        :return: iterable of dicts
+        """
+        started = time.monotonic()
+        messages = queue.Queue()
+        stopped = threading.Event()
+        failed = []
+
+        def pull_one(image):
+            stream = self.instance.pull(image, stream=True, decode=True,
+                                        **kwargs)
+            try:
+                for data in stream:
+                    if stopped.is_set():
+                        return
+                    if 'progressDetail' not in data:
+                        data['image'] = image
+                    messages.put(data)
+            finally:
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+
+        def pull_all():
+            try:
+                for image, _, ex in execute_parallel(
+                        pull_one, images, parallel):
+                    if ex is not None:
+                        message = ex.explanation \
+                            if isinstance(ex, APIError) else str(ex)
+                        failed.append((image, message))
+                        messages.put({'error': message, 'image': image})
+            finally:
+                messages.put(None)
+
+        threading.Thread(target=pull_all, name='pull', daemon=True).start()
+        try:
+            data = messages.get()
+            while data is not None:
+                yield data
+                data = messages.get()
+        finally:
+            stopped.set()
+
+        yield {'status': 'Pulled {0} of {1} images in {2:.1f} s.'.format(
+            len(images) - len(failed), len(images),
+            time.monotonic() - started)}
+
     def push(self, *args, **kwargs):
         """
         Push an image into repository. Equivalent of docker push.
@@ -1165,8 +1763,7 @@ class DockerClient(object):
         # requests.packages.urllib3.exceptions.ReadTimeoutError:
         # HTTPSConnectionPool(host='192.168.59.103', port=2376): Read timed out.
         command = format_command_line('push', False, args, kwargs)
-        process = pexpect.spawnu(command)
-        process.interact()
+        self.interact(command)
 
     def unpause(self, *args, **kwargs):
         """
@@ -1203,8 +1800,7 @@ class DockerClient(object):
             Call the official cli
             """
             command = format_command_line(cmd, False, args, kwargs)
-            process = pexpect.spawnu(command)
-            process.interact()
+            self.interact(command)
 
         def on_after_interactive():
             # \r is to make sure when there is some error output,
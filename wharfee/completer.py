@@ -1,12 +1,17 @@
 # -*- coding: utf-8
-import fuzzyfinder
-
-from itertools import chain
+from itertools import chain, islice
 from prompt_toolkit.completion import Completer, Completion
-from .options import COMMAND_OPTIONS, COMMAND_NAMES, all_options, find_option, \
-    split_command_and_args
+from .options import COMMAND_OPTIONS, COMMAND_NAMES, COMMAND_TRIE, \
+    find_option, compiled_command
 from .helpers import list_dir, parse_path, complete_path
-from .utils import shlex_split, shlex_first_token
+from .tokenizer import tokenize
+from .prefix import PrefixIndex, merge_prefix_matches
+from .fuzzy import names_matcher, merge_fuzzy_matches
+
+
+# Most names to suggest from a collection at once. Nobody scrolls through
+# more, and they all have to be rendered.
+COMPLETION_LIMIT = 1000
 
 
 class DockerCompleter(Completer):
@@ -20,15 +25,18 @@ class DockerCompleter(Completer):
         Initialize the completer
         :return:
         """
-        self.all_completions = set(COMMAND_NAMES)
-        self.containers = set(containers) if containers else set()
-        self.running = set(running) if running else set()
-        self.images = set(images) if images else set()
-        self.tagged = set(tagged) if tagged else set()
-        self.volumes = set(volumes) if volumes else set()
+        self.all_completions = PrefixIndex(COMMAND_NAMES)
+        self.containers = PrefixIndex(containers or ())
+        self.running = PrefixIndex(running or ())
+        self.images = PrefixIndex(images or ())
+        self.tagged = PrefixIndex(tagged or ())
+        self.volumes = PrefixIndex(volumes or ())
         self.long_option_mode = long_option_names
         self.fuzzy = fuzzy
         self.enabled = True
+        self.loading = False
+        self.name_hosts = {}
+        self.host_meta = {}
 
     def set_enabled(self, enabled):
         """
@@ -37,40 +45,99 @@ class DockerCompleter(Completer):
         """
         self.enabled = enabled
 
+    def set_loading(self, loading):
+        """
+        Setter for the flag that container, image and volume names are
+        being loaded. Commands and options complete in the meantime.
+        :param loading: boolean
+        """
+        self.loading = loading
+
+    def is_loading(self):
+        """
+        Getter for loading flag.
+        :return: boolean
+        """
+        return self.loading
+
     def set_volumes(self, volumes):
         """
         Setter for list of available volumes.
         :param volumes: list
         """
-        self.volumes = set(volumes) if volumes else set()
+        self.volumes = PrefixIndex(volumes or ())
 
     def set_containers(self, containers):
         """
         Setter for list of available containers.
         :param containers: list
         """
-        self.containers = set(containers) if containers else set()
+        self.containers = PrefixIndex(containers or ())
 
     def set_running(self, containers):
         """
         Setter for list of running containers.
         :param containers: list
         """
-        self.running = set(containers) if containers else set()
+        self.running = PrefixIndex(containers or ())
 
     def set_images(self, images):
         """
         Setter for list of available images.
         :param images: list
         """
-        self.images = set(images) if images else set()
+        self.images = PrefixIndex(images or ())
 
     def set_tagged(self, images):
         """
         Setter for list of tagged images.
         :param images: list
         """
-        self.tagged = set(images) if images else set()
+        self.tagged = PrefixIndex(images or ())
+
+    def add_names(self, category, names):
+        """
+        Add names to one of the collections ("containers", "running",
+        "images", "tagged" or "volumes"). The collection is replaced rather
+        than updated in place, so it can be called from a background thread
+        while completions are being generated.
+        :param category: string
+        :param names: iterable
+        """
+        setattr(self, category, getattr(self, category).added(names))
+
+    def remove_names(self, category, names):
+        """
+        Remove names from one of the collections.
+        :param category: string
+        :param names: iterable
+        """
+        setattr(self, category, getattr(self, category).removed(names))
+
+    def set_name_hosts(self, category, pairs):
+        """
+        Remember which Docker hosts the names in one of the collections
+        are on, to show next to completions. Names from the default host
+        (None) are not shown with a host.
+        :param category: string: "containers", "images" or "volumes"
+        :param pairs: iterable of (name, host)
+        """
+        hosts = {}
+        for name, host in pairs:
+            if host:
+                hosts.setdefault(name, set()).add(host)
+
+        name_hosts = dict(self.name_hosts)
+        name_hosts[category] = hosts
+
+        meta = {}
+        for names in name_hosts.values():
+            for name, on in names.items():
+                meta[name] = meta.get(name, set()) | on
+
+        self.name_hosts = name_hosts
+        self.host_meta = dict(
+            (name, ', '.join(sorted(on))) for name, on in meta.items())
 
     def set_long_options(self, is_long):
         """
@@ -108,33 +175,23 @@ class DockerCompleter(Completer):
         if not self.enabled:
             return []
 
-        if DockerCompleter.in_quoted_string(document.text):
+        tokens = tokenize(document.text_before_cursor)
+        if tokens.quote:
             return []
 
-        word_before_cursor = document.get_word_before_cursor(WORD=True)
-        words = DockerCompleter.get_tokens(document.text)
-        command_name = split_command_and_args(words)[0]
+        word_before_cursor = tokens.word_before_cursor
+        words = tokens.words
+        command_name = tokens.command
 
         in_command = (len(words) > 1) or \
                      ((not word_before_cursor) and command_name)
 
         if in_command:
-            previous_word = ''
-            previous_start = document.find_start_of_previous_word(WORD=True)
-
-            if previous_start == -len(word_before_cursor):
-                previous_start = document.find_start_of_previous_word(
-                    WORD=True, count=2)
-
-            if previous_start:
-                previous_word = document.text_before_cursor[previous_start:]
-                previous_word = previous_word.strip().split()[0]
-
             params = words[1:] if (len(words) > 1) else []
             completions = DockerCompleter.find_command_matches(
                 command_name,
                 word_before_cursor,
-                previous_word,
+                tokens.previous_word,
                 params,
                 self.containers,
                 self.running,
@@ -142,20 +199,28 @@ class DockerCompleter(Completer):
                 self.tagged,
                 self.volumes,
                 self.long_option_mode,
-                self.fuzzy)
+                self.fuzzy,
+                self.host_meta)
         else:
             completions = DockerCompleter.find_matches(
                 word_before_cursor,
                 self.all_completions,
                 self.fuzzy)
 
+        # Words that continue a command group, like "ls" after "volume".
+        typed = words[:-1] if word_before_cursor else words
+        subcommands = COMMAND_TRIE.subcommands(typed)
+        if subcommands:
+            completions = chain(DockerCompleter.find_collection_matches(
+                word_before_cursor, subcommands, self.fuzzy), completions)
+
         return completions
 
     @staticmethod
     def find_command_matches(command, word='', prev='', params=None,
                              containers=None, running=None, images=None,
                              tagged=None, volumes=None, long_options=True,
-                             fuzzy=False):
+                             fuzzy=False, meta=None):
         """
         Find all matches in context of the given command.
         :param command: string: command keyword (such as "ps", "images")
@@ -169,6 +234,7 @@ class DockerCompleter(Completer):
         :param volumes: list of volumes
         :param long_options: boolean
         :param fuzzy: boolean
+        :param meta: dict: name to text shown next to it, such as the host
         :return: iterable
         """
 
@@ -198,8 +264,8 @@ class DockerCompleter(Completer):
                 elif current_opt.is_type_filepath():
                     add_filepath = True
 
-                for m in DockerCompleter.find_collection_matches(
-                        word, opt_suggestions, fuzzy):
+                for m in DockerCompleter.find_collections_matches(
+                        word, [opt_suggestions], fuzzy, meta):
                     yield m
 
             if not opt_suggestions:
@@ -215,16 +281,14 @@ class DockerCompleter(Completer):
                 def is_current(o):
                     return word in o.names
 
-                def get_opt_name(t):
-                    return t.get_name(long_options)
+                def is_possible(o):
+                    return is_unused(o) or is_current(o) or o.is_multiple
 
+                compiled = compiled_command(command)
                 positionals = []
-                possible_options = [x for x in all_options(command) if is_unused(x)
-                                    or is_current(x)
-                                    or x.is_multiple]
-                named_options = sorted([x for x in possible_options if x.name.startswith('-')],
-                                       key=get_opt_name)
-                positional_options = [x for x in possible_options if not x.name.startswith('-')]
+                named_options = [x for x in compiled.named_options(long_options)
+                                 if is_possible(x)]
+                positional_options = [x for x in compiled.positional if is_possible(x)]
 
                 named_option_map = {}
 
@@ -239,17 +303,17 @@ class DockerCompleter(Completer):
 
                 for opt in positional_options:
                     if opt.is_type_container():
-                        positionals = chain(positionals, containers)
+                        positionals.append(containers)
                     elif opt.is_type_image():
-                        positionals = chain(positionals, images)
+                        positionals.append(images)
                     elif opt.is_type_running():
-                        positionals = chain(positionals, running)
+                        positionals.append(running)
                     elif opt.is_type_tagged():
-                        positionals = chain(positionals, tagged)
+                        positionals.append(tagged)
                     elif opt.is_type_volume():
-                        positionals = chain(positionals, volumes)
+                        positionals.append(volumes)
                     elif opt.is_type_choice():
-                        positionals = chain(positionals, opt.choices)
+                        positionals.append(opt.choices)
                     elif opt.is_type_dirname():
                         add_directory = True
                     elif opt.is_type_filepath():
@@ -257,8 +321,8 @@ class DockerCompleter(Completer):
 
                 # Also return completions for positional options (images,
                 # containers, etc.)
-                for m in DockerCompleter.find_collection_matches(
-                        word, positionals, fuzzy):
+                for m in DockerCompleter.find_collections_matches(
+                        word, positionals, fuzzy, meta):
                     yield m
 
         # Special handling for path completion
@@ -308,7 +372,7 @@ class DockerCompleter(Completer):
         """
 
         if fuzzy:
-            for suggestion in fuzzyfinder.fuzzyfinder(word, dic.keys()):
+            for suggestion in names_matcher(dic).match(word):
                 yield Completion(suggestion, -len(word), dic[suggestion])
         else:
             for name in sorted(dic.keys()):
@@ -316,22 +380,41 @@ class DockerCompleter(Completer):
                     yield Completion(name, -len(word), dic[name])
 
     @staticmethod
-    def find_collection_matches(word, lst, fuzzy):
+    def find_collection_matches(word, lst, fuzzy, meta=None):
         """
         Yield all matching names in list
         :param lst: collection
         :param word: string user typed
         :param fuzzy: boolean
+        :param meta: dict: name to text shown next to it
         :return: iterable
         """
+        return DockerCompleter.find_collections_matches(
+            word, [lst], fuzzy, meta)
+
+    @staticmethod
+    def find_collections_matches(word, collections, fuzzy, meta=None):
+        """
+        Yield matching names from several collections, up to
+        COMPLETION_LIMIT of them. Without fuzzy matching, PrefixIndex
+        collections are searched without going through all the names. With
+        fuzzy matching, every collection keeps the names that matched the
+        previous key press and only checks those.
+        :param word: string user typed
+        :param collections: list of PrefixIndex or other iterables
+        :param fuzzy: boolean
+        :param meta: dict: name to text shown next to it
+        :return: iterable
+        """
+        meta = meta or {}
 
         if fuzzy:
-            for suggestion in fuzzyfinder.fuzzyfinder(word, lst):
-                yield Completion(suggestion, -len(word))
+            names = merge_fuzzy_matches(word, collections, COMPLETION_LIMIT)
         else:
-            for name in sorted(lst):
-                if name.startswith(word) or not word:
-                    yield Completion(name, -len(word))
+            names = merge_prefix_matches(word, collections)
+
+        for name in islice(names, COMPLETION_LIMIT):
+            yield Completion(name, -len(word), display_meta=meta.get(name))
 
     @staticmethod
     def find_matches(text, collection, fuzzy):
@@ -348,19 +431,6 @@ class DockerCompleter(Completer):
                 text, collection, fuzzy):
             yield suggestion
 
-    @staticmethod
-    def get_tokens(text):
-        """
-        Parse out all tokens.
-        :param text:
-        :return: list
-        """
-        if text is not None:
-            text = text.strip()
-            words = DockerCompleter.safe_split(text)
-            return words
-        return []
-
     @staticmethod
     def first_token(text):
         """
@@ -368,17 +438,8 @@ class DockerCompleter(Completer):
         :param text:
         :return:
         """
-        if text is not None:
-            text = text.strip()
-            if len(text) > 0:
-                try:
-                    word = shlex_first_token(text)
-                    word = word.strip()
-                    return word
-                except:
-                    # no error, just do not complete
-                    pass
-        return ''
+        words = tokenize(text).words
+        return words[0] if words else ''
 
     @staticmethod
     def last_token(text):
@@ -387,41 +448,5 @@ class DockerCompleter(Completer):
         :param text:
         :return:
         """
-        if text is not None:
-            text = text.strip()
-            if len(text) > 0:
-                word = DockerCompleter.safe_split(text)[-1]
-                word = word.strip()
-                return word
-        return ''
-
-    @staticmethod
-    def safe_split(text):
-        """
-        Shlex can't always split. For example, "\" crashes the completer.
-        """
-        try:
-            words = shlex_split(text)
-            return words
-        except:
-            return text
-
-    @staticmethod
-    def in_quoted_string(text):
-        """
-        Find last word in a sentence
-        :param text:
-        :return:
-        """
-        if text is not None:
-            text = text.strip()
-            if len(text) > 0 and ('"' in text or "'" in text):
-                stack = []
-                for char in text:
-                    if char in ['"', "'"]:
-                        if len(stack) > 0 and stack[-1] == char:
-                            stack = stack[:-1]
-                        else:
-                            stack.append(char)
-                return len(stack) > 0
-        return False
+        words = tokenize(text).words
+        return words[-1] if words else ''
@@ -0,0 +1,426 @@
+# -*- coding: utf-8
+"""
+Build context for "build": files of the build directory that .dockerignore
+doesn't exclude, as an uncompressed tar stream. The stream is sent to the
+daemon while it is being produced, instead of writing the whole archive
+to a temporary file first.
+
+Tar members of regular files are also appended to a cache file, with a
+manifest of the stat signature they were made from. The next build of the
+same directory copies members of unchanged files out of the cache,
+reading one file sequentially instead of opening every file in the
+context again.
+
+Files are told unchanged by their stat signature, not by a hash of their
+content: hashing would read every file again, which is what the cache is
+there to avoid, and the walk has to lstat every file anyway to apply
+.dockerignore and build the headers. Caches are kept under CACHE_LIMIT
+bytes, caches of other directories are removed least recently used first.
+"""
+import os
+import json
+import stat
+import time
+import hashlib
+import tarfile
+
+try:
+    import grp
+    import pwd
+    import fcntl
+except ImportError:
+    # Windows: no user and group names, and no cache, since it can't be
+    # locked against another build using it.
+    grp = pwd = fcntl = None
+
+from docker.utils.build import exclude_paths
+
+from .helpers import filesize
+
+CACHE_DIR = '~/.cache/wharfee/context'
+BLOCK_SIZE = tarfile.BLOCKSIZE
+CHUNK_SIZE = 256 * 1024
+CACHE_LIMIT = 256 * 1024 * 1024
+
+
+def read_dockerignore(root):
+    """
+    Patterns from .dockerignore, the same way docker-py reads them.
+    :param root: string: build directory
+    :return: list of strings
+    """
+    path = os.path.join(root, '.dockerignore')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = [line.strip() for line in f.read().splitlines()]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def padding(size):
+    """
+    Zero bytes that pad tar member data of this size to a full block.
+    :param size: int
+    :return: bytes
+    """
+    remainder = size % BLOCK_SIZE
+    return b'\0' * (BLOCK_SIZE - remainder) if remainder else b''
+
+
+class BuildContext(object):
+    """
+    Tar stream of a build directory, with a cache of tar members.
+    """
+
+    def __init__(self, root, cache_dir=CACHE_DIR, cache_limit=CACHE_LIMIT):
+        """
+        :param root: string: build directory
+        :param cache_dir: string: where to keep cached members, or None.
+                          Not used where files can't be locked (Windows).
+        :param cache_limit: int: bytes all caches in cache_dir may take
+        """
+        self.root = os.path.abspath(root)
+        self.cache_limit = cache_limit
+        self.cache_path = None
+        if cache_dir and fcntl is not None:
+            key = hashlib.sha1(self.root.encode('utf8')).hexdigest()
+            self.cache_path = os.path.join(
+                os.path.expanduser(cache_dir), key + '.tar')
+
+        # Filled in while streaming.
+        self.files = 0
+        self.cached = 0
+        self.size = 0
+        self.elapsed = 0.0
+
+        self.users = {}
+        self.groups = {}
+        self.tar = tarfile.TarFile(fileobj=NullFile(), mode='w')
+
+    def paths(self):
+        """
+        Paths in the context, relative to root, sorted.
+        :return: list of strings
+        """
+        return sorted(exclude_paths(self.root, read_dockerignore(self.root)))
+
+    def stream(self):
+        """
+        Produce the tar archive, in chunks of about CHUNK_SIZE.
+        :return: generator of bytes
+        """
+        started = time.monotonic()
+        cache = ContextCache(self.cache_path, self.cache_limit) \
+            if self.cache_path else None
+        chunk, chunk_size = [], 0
+        try:
+            for path in self.paths():
+                for data in self.member(path, cache):
+                    chunk.append(data)
+                    chunk_size += len(data)
+                    self.size += len(data)
+                    if chunk_size >= CHUNK_SIZE:
+                        yield b''.join(chunk)
+                        chunk, chunk_size = [], 0
+
+            end = b'\0' * (BLOCK_SIZE * 2)
+            self.size += len(end)
+            chunk.append(end)
+            yield b''.join(chunk)
+
+            if cache:
+                cache.save()
+        finally:
+            if cache:
+                cache.close()
+            self.elapsed = time.monotonic() - started
+
+    def member(self, path, cache):
+        """
+        Tar member for the path: header, data and padding.
+        :param path: string: relative to root
+        :param cache: ContextCache or None
+        :return: iterable of bytes
+        """
+        full_path = os.path.join(self.root, path)
+        st = os.lstat(full_path)
+
+        if not stat.S_ISREG(st.st_mode):
+            info = self.tarinfo(path, full_path, st)
+            if info is not None:
+                yield info.tobuf(self.tar.format, self.tar.encoding,
+                                 self.tar.errors)
+            return
+
+        self.files += 1
+        signature = [st.st_size, st.st_mtime_ns, st.st_mode, st.st_uid,
+                     st.st_gid, st.st_ino]
+        if cache:
+            cached = cache.read(path, signature)
+            if cached is not None:
+                self.cached += 1
+                for data in cached:
+                    yield data
+                return
+
+        info = self.tarinfo(path, full_path, st)
+        data = info.tobuf(self.tar.format, self.tar.encoding,
+                          self.tar.errors)
+
+        # Chunks go to the cache as they are produced, and the member is
+        # added to the manifest once it's complete.
+        if cache and not cache.fits(
+                len(data) + info.size + len(padding(info.size))):
+            cache = None
+        start = cache.end if cache else None
+        if cache:
+            cache.append(data)
+        yield data
+        try:
+            with open(full_path, 'rb') as f:
+                remaining = info.size
+                while remaining > 0:
+                    data = f.read(min(remaining, CHUNK_SIZE))
+                    if not data:
+                        raise OSError('File changed while reading')
+                    remaining -= len(data)
+                    if cache:
+                        cache.append(data)
+                    yield data
+        except OSError as ex:
+            raise OSError('Can not read file in context: {0}'.format(
+                full_path)) from ex
+        data = padding(info.size)
+        if cache:
+            cache.append(data)
+            cache.add(path, signature, start)
+        yield data
+
+    def tarinfo(self, path, full_path, st):
+        """
+        Tar header fields from stat, same as TarFile.gettarinfo gives,
+        except that hard links are stored as regular files and mtime is
+        rounded down to seconds.
+        :param path: string: name in the archive
+        :param full_path: string
+        :param st: os.stat_result
+        :return: TarInfo or None, for sockets
+        """
+        if stat.S_ISREG(st.st_mode):
+            info = tarfile.TarInfo(path)
+            info.type = tarfile.REGTYPE
+            info.size = st.st_size
+        elif stat.S_ISDIR(st.st_mode):
+            info = tarfile.TarInfo(path)
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(st.st_mode):
+            info = tarfile.TarInfo(path)
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(full_path)
+        else:
+            return self.tar.gettarinfo(full_path, arcname=path)
+
+        info.mode = st.st_mode
+        info.uid = st.st_uid
+        info.gid = st.st_gid
+        # Whole seconds, like the docker CLI sends: a fractional mtime
+        # needs an extra pax header block for every file.
+        info.mtime = int(st.st_mtime)
+        info.uname = self.user_name(st.st_uid)
+        info.gname = self.group_name(st.st_gid)
+        return info
+
+    def user_name(self, uid):
+        if pwd is None:
+            return ''
+        if uid not in self.users:
+            try:
+                self.users[uid] = pwd.getpwuid(uid)[0]
+            except KeyError:
+                self.users[uid] = ''
+        return self.users[uid]
+
+    def group_name(self, gid):
+        if grp is None:
+            return ''
+        if gid not in self.groups:
+            try:
+                self.groups[gid] = grp.getgrgid(gid)[0]
+            except KeyError:
+                self.groups[gid] = ''
+        return self.groups[gid]
+
+    def summary(self):
+        """
+        :return: string: what was sent and how long it took to prepare
+        """
+        return 'Sent build context: {0}, {1} files ({2} from cache) ' \
+               'in {3:.2f} s.'.format(filesize(self.size), self.files,
+                                      self.cached, self.elapsed)
+
+
+class NullFile(object):
+    """
+    TarFile needs a file even if it only creates headers.
+    """
+
+    def write(self, data):
+        pass
+
+    def tell(self):
+        return 0
+
+
+class ContextCache(object):
+    """
+    Tar members of files from previous builds, in one file that's only
+    appended to, and a manifest of path -> [signature, offset, length].
+    When over half of the file is no longer referenced, it is started
+    over. If another build of the same directory is using the cache, this
+    one goes without it.
+    """
+
+    def __init__(self, path, limit=CACHE_LIMIT):
+        """
+        :param path: string: cache file
+        :param limit: int: bytes this and other caches in the same
+                      directory may take
+        """
+        self.path = path
+        self.limit = limit
+        self.manifest_path = path + '.json'
+        self.manifest = {}
+        self.entries = {}
+        self.file = None
+        self.end = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            self.file = open(path, 'a+b')
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.close()
+            return
+
+        self.end = self.file.seek(0, os.SEEK_END)
+        try:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+        live = sum(entry[2] for entry in self.manifest.values())
+        if self.end > 2 * live or any(
+                entry[1] + entry[2] > self.end
+                for entry in self.manifest.values()):
+            self.file.truncate(0)
+            self.manifest = {}
+            self.end = 0
+
+    def __bool__(self):
+        return self.file is not None
+
+    def read(self, path, signature):
+        """
+        Cached member, if the file didn't change.
+        :param path: string
+        :param signature: list: stat values the member was made from
+        :return: generator of bytes, in chunks of CHUNK_SIZE, or None
+        """
+        entry = self.manifest.get(path)
+        if entry is None or entry[0] != signature:
+            return None
+        self.entries[path] = entry
+        return self.chunks(entry[1], entry[2])
+
+    def chunks(self, offset, length):
+        """
+        :param offset: int
+        :param length: int
+        :return: generator of bytes
+        """
+        end = offset + length
+        while offset < end:
+            self.file.seek(offset)
+            data = self.file.read(min(end - offset, CHUNK_SIZE))
+            if not data:
+                raise OSError('Context cache is truncated: {0}'.format(
+                    self.path))
+            offset += len(data)
+            yield data
+
+    def fits(self, size):
+        """
+        Whether a member of this size can be added within the limit.
+        :param size: int
+        :return: boolean
+        """
+        return self.end + size <= self.limit
+
+    def append(self, data):
+        """
+        Append a chunk of a member to the cache.
+        :param data: bytes
+        """
+        self.file.write(data)
+        self.end += len(data)
+
+    def add(self, path, signature, start):
+        """
+        Add the member appended since start to the manifest.
+        :param path: string
+        :param signature: list
+        :param start: int: offset of the first chunk
+        """
+        self.entries[path] = [signature, start, self.end - start]
+
+    def save(self):
+        """
+        Keep entries of this build for the next one.
+        """
+        self.file.flush()
+        temp = self.manifest_path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp, self.manifest_path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove caches of other build directories, least recently used
+        first, until all of them fit in the limit together with this one.
+        """
+        others = []
+        total = self.end
+        for entry in os.scandir(os.path.dirname(self.path)):
+            if not entry.name.endswith('.tar') or entry.path == self.path:
+                continue
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            try:
+                # The manifest is written on every build, the cache file
+                # only when something changed.
+                mtime = os.stat(entry.path + '.json').st_mtime
+            except OSError:
+                mtime = 0
+            others.append((mtime, size, entry.path))
+            total += size
+
+        for _, size, path in sorted(others):
+            if total <= self.limit:
+                break
+            # A build using it keeps its open file, and the next one
+            # starts over, since the manifest is past the end.
+            for name in [path, path + '.json']:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            total -= size
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,224 @@
+# -*- coding: utf-8
+"""
+Keep autocompletion data up to date from the Docker events stream.
+"""
+import threading
+
+from .helpers import parse_image_name, format_tagged
+
+
+class EventWatcher(object):
+    """
+    Subscribes to the daemon's events API in a background thread and
+    applies container, image and volume events to the completer, so
+    there is no need to re-list everything after each command.
+
+    A full resync is only done when the stream has to be reconnected,
+    or when an event shows that our view has drifted from the daemon.
+    """
+
+    def __init__(self, client, completer, resync, logger=None,
+                 retry_delay=5):
+        """
+        Initialize the watcher.
+        :param client: DockerClient
+        :param completer: DockerCompleter
+        :param resync: callable to re-read all completions
+        :param logger: logger
+        :param retry_delay: seconds to wait before reconnecting
+        """
+        assert callable(resync)
+
+        self.client = client
+        self.completer = completer
+        self.resync = resync
+        self.logger = logger
+        self.retry_delay = retry_delay
+        self.synced = False
+        self.stream = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def is_synced(self):
+        """
+        If the completer is being kept up to date by the events stream.
+        :return: boolean
+        """
+        return self.synced and not self.stopped.is_set()
+
+    def debug(self, message, *args):
+        """Log a debug message if logger is passed in."""
+        if self.logger is not None:
+            self.logger.debug(message, *args)
+
+    def start(self, since=None):
+        """
+        Start listening in a background thread.
+        :param since: int: timestamp of the last full sync. If passed,
+        events are replayed from this point instead of doing a resync.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, args=(since,), name='events', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop listening and close the stream.
+        """
+        self.stopped.set()
+        self.synced = False
+        if self.stream is not None:
+            try:
+                self.stream.close()
+            except Exception as ex:
+                self.debug('Error closing events stream: %r.', ex)
+
+    def run(self, since=None):
+        """
+        Thread body: (re)connect, resync if needed and apply events.
+        If the first subscription fails, completions are read once anyway,
+        so that they don't wait for the stream (and the toolbar doesn't say
+        they are loading all along).
+        :param since: int: timestamp to replay events from
+        """
+        loaded = since is not None
+        while not self.stopped.is_set():
+            try:
+                self.stream = self.client.events(since=since)
+            except Exception as ex:
+                self.debug('Events subscription error: %r.', ex)
+                if not loaded:
+                    loaded = True
+                    self.resync()
+                since = None
+                self.stopped.wait(self.retry_delay)
+                continue
+
+            try:
+                if since is None:
+                    # Subscribe first, list second: whatever happens in
+                    # between is in the stream and applying it twice
+                    # does no harm.
+                    loaded = True
+                    self.resync()
+                self.synced = True
+                for event in self.stream:
+                    if self.stopped.is_set():
+                        break
+                    if not self.apply_event(event):
+                        self.debug('Gap detected on %r, resyncing.', event)
+                        self.resync()
+            except Exception as ex:
+                self.debug('Events stream error: %r.', ex)
+
+            self.synced = False
+            self.stream = None
+            since = None
+            self.stopped.wait(self.retry_delay)
+
+    def apply_event(self, event):
+        """
+        Update completer with a single event.
+        :param event: dict
+        :return: boolean: False if the event does not match what we know
+        """
+        event_type = event.get('Type')
+        action = event.get('Action', '')
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+
+        # Actions like "exec_start: bash" carry the details after a colon.
+        action = action.split(':', 1)[0]
+
+        if event_type == 'container':
+            return self.apply_container_event(
+                action, attributes.get('name'), attributes)
+        elif event_type == 'image':
+            return self.apply_image_event(
+                action, actor.get('ID', ''), attributes.get('name'))
+        elif event_type == 'volume':
+            return self.apply_volume_event(action, actor.get('ID'))
+        return True
+
+    def apply_container_event(self, action, name, attributes):
+        """
+        Update containers and running containers.
+        :param action: string
+        :param name: string container name
+        :param attributes: dict
+        :return: boolean
+        """
+        if not name:
+            return True
+
+        c = self.completer
+
+        if action == 'create':
+            c.add_names('containers', [name])
+        elif action == 'destroy':
+            if name not in c.containers:
+                return False
+            c.remove_names('containers', [name])
+            c.remove_names('running', [name])
+        elif action in ('start', 'restart', 'unpause'):
+            c.add_names('containers', [name])
+            c.add_names('running', [name])
+        elif action == 'die':
+            if name not in c.containers:
+                return False
+            c.remove_names('running', [name])
+        elif action == 'rename':
+            old_name = attributes.get('oldName', '').lstrip('/')
+            was_running = old_name in c.running
+            c.remove_names('containers', [old_name])
+            c.remove_names('running', [old_name])
+            c.add_names('containers', [name])
+            if was_running:
+                c.add_names('running', [name])
+        return True
+
+    def apply_image_event(self, action, image_id, name):
+        """
+        Update images and tagged images.
+        :param action: string
+        :param image_id: string
+        :param name: string "repo:tag" or image ID
+        :return: boolean
+        """
+        c = self.completer
+        is_tag = name and ':' in name and not name.startswith('sha256:')
+
+        if action in ('tag', 'pull', 'load', 'import'):
+            if is_tag:
+                c.add_names('images', [parse_image_name(name, image_id)])
+                c.add_names('tagged', [format_tagged(name, image_id)])
+        elif action == 'untag':
+            if not is_tag:
+                # Daemon did not tell us which tag is gone.
+                return False
+            repo = parse_image_name(name, image_id)
+            c.remove_names('tagged', [name])
+            if not any(t.startswith(repo + ':') for t in c.tagged):
+                c.remove_names('images', [repo])
+        elif action == 'delete':
+            short_id = format_tagged('<none>:<none>', image_id)
+            c.remove_names('images', [short_id])
+            c.remove_names('tagged', [short_id])
+        return True
+
+    def apply_volume_event(self, action, name):
+        """
+        Update volumes.
+        :param action: string
+        :param name: string volume name
+        :return: boolean
+        """
+        if not name:
+            return True
+        if action == 'create':
+            self.completer.add_names('volumes', [name])
+        elif action == 'destroy':
+            self.completer.remove_names('volumes', [name])
+        return True
@@ -2,14 +2,21 @@
 """
 Helper functions to format output for CLI.
 """
+import sys
 import json
 import click
 from io import StringIO
-from tabulate import tabulate
-from pygments import highlight
-from pygments.lexers.data import JsonLexer
-from pygments.formatters.terminal import TerminalFormatter
-from ruamel.yaml import YAML
+from itertools import chain, islice
+from .records import Record
+from .streams import StreamDecoder, STDERR
+from .progress import LayerProgress, redraw
+from .top import format_changes
+
+# tabulate, pygments and ruamel.yaml are only imported when some output
+# needs them, to keep startup fast.
+
+# How many rows to look at to figure out column widths in a table.
+TABLE_SAMPLE_SIZE = 1000
 
 
 class StreamFormatter(object):
@@ -36,8 +43,8 @@ class StreamFormatter(object):
 
 class JsonStreamDumper(StreamFormatter):
 
-    lexer = JsonLexer()
-    term = TerminalFormatter()
+    lexer = None
+    term = None
 
     def output(self):
         """
@@ -56,19 +63,102 @@ class JsonStreamDumper(StreamFormatter):
         return self.counter
 
     def colorize(self, text):
+        from pygments import highlight
+
+        if self.lexer is None:
+            from pygments.lexers.data import JsonLexer
+            from pygments.formatters.terminal import TerminalFormatter
+            JsonStreamDumper.lexer = JsonLexer()
+            JsonStreamDumper.term = TerminalFormatter()
+
         return highlight(text, self.lexer, self.term).rstrip('\r\n')
 
 
-class JsonStreamFormatter(StreamFormatter):
+class DemuxStreamWriter(StreamFormatter):
 
-    progress = False
+    def __init__(self, data, raw=None):
+        """
+        Initialize the formatter passing in the stream.
+        :param data: generator of (stream, bytes) frames
+        :param raw: boolean: write bytes as they are, without decoding.
+                    By default, when stdout is not a terminal.
+        """
+        StreamFormatter.__init__(self, data)
+        self.raw = raw
 
-    def __init__(self, data):
+    def output(self):
+        """
+        Write frames to stdout or stderr as they come, without adding
+        newlines.
+        :return: int
+        """
+        raw = self.raw
+        if raw is None:
+            raw = not sys.stdout.isatty()
+        return self.output_raw() if raw else self.output_decoded()
+
+    def output_decoded(self):
+        """
+        Text is decoded incrementally, so that characters split between
+        frames come out right.
+        :return: int
+        """
+        out, err = sys.stdout, sys.stderr
+
+        decoder = StreamDecoder()
+        text = '\n'
+        for stream, data in self.stream:
+            self.counter += 1
+            decoded = decoder.decode(stream, data)
+            if decoded:
+                text = decoded
+                (err if stream == STDERR else out).write(text)
+        for stream, decoded in decoder.flush():
+            text = decoded
+            (err if stream == STDERR else out).write(text)
+
+        out.flush()
+        err.flush()
+        if not text.endswith('\n'):
+            # Don't leave the prompt hanging at the end of the last line.
+            click.echo()
+        return self.counter
+
+    def output_raw(self):
+        """
+        Bytes go to the binary streams untouched, nothing is decoded or
+        copied on the way.
+        :return: int
+        """
+        # Whatever was echoed before should come out first.
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        err = getattr(sys.stderr, 'buffer', sys.stderr)
+
+        for stream, data in self.stream:
+            self.counter += 1
+            (err if stream == STDERR else out).write(data)
+
+        out.flush()
+        err.flush()
+        return self.counter
+
+
+class JsonStreamFormatter(StreamFormatter):
+
+    def __init__(self, data, out=None, tty=None):
         """
         Initialize the formatter passing in the stream.
         :param data: generator
+        :param out: file to write to, stdout by default
+        :param tty: boolean: show progress in place. By default, if out is
+                    a terminal.
         """
         StreamFormatter.__init__(self, data)
+        self.out = out or sys.stdout
+        self.progress = LayerProgress(self.out, tty)
 
     def output(self):
         """
@@ -87,26 +177,30 @@ class JsonStreamFormatter(StreamFormatter):
             "id":"e9e06b06e14c"
         }
 
+        Layers are shown by LayerProgress, other messages as they come.
         """
         for line in self.stream:
             self.counter += 1
-            parts = line.strip().decode('utf8').split('\r\n')
-            for part in parts:
-                data = json.loads(part)
-                if self.is_progress(data):
-                    self.show_progress_line(data)
-                else:
-                    self.show_progress_end()
+            for data in self.parse(line):
+                if data and not self.progress.update(data):
                     self.show_line(data)
 
+        self.progress.finish()
         return self.counter
 
-    def is_progress(self, data):
+    @staticmethod
+    def parse(line):
         """
-        If the JSON data contains progress bar information.
-        :param data: json
+        Messages in a line of the stream. Lines can also be dicts already.
+        :param line: bytes, string or dict
+        :return: list of dicts
         """
-        return 'progress' in data and data['progress']
+        if isinstance(line, dict):
+            return [line]
+        if isinstance(line, bytes):
+            line = line.decode('utf8')
+        return [json.loads(part) for part in line.strip().split('\r\n')
+                if part]
 
     def show_line(self, data):
         """
@@ -129,33 +223,95 @@ class JsonStreamFormatter(StreamFormatter):
 
         if line:
             line = line.rstrip()
+        if data.get('image'):
+            # Merged output of several pulls.
+            line = '{0}: {1}'.format(data['image'], line)
+
+        self.progress.write(line)
 
-        click.echo(line)
 
-    def show_progress_end(self):
+class TableRefreshWriter(StreamFormatter):
+
+    def __init__(self, data, out=None, tty=None):
         """
-        If we were just showing progress bar, enter a newline and unset
-        the progress flag.
+        Initialize the formatter passing in the stream.
+        :param data: generator of lists of records, one list per refresh
+        :param out: file to write to, stdout by default
+        :param tty: boolean: redraw the table in place. By default, if out
+                    is a terminal.
         """
-        if self.progress:
-            click.echo()
-        self.progress = False
+        StreamFormatter.__init__(self, data)
+        self.out = out or sys.stdout
+        self.tty = self.out.isatty() if tty is None else tty
+        self.lines = []
+        self.headers = None
+        self.widths = None
 
-    def show_progress_line(self, data):
+    def output(self):
         """
-        Output a carriage return and new progress.
-        :param data: json
+        Write every table over the previous one on a terminal, otherwise
+        one after another. Strings in the stream are written as messages.
+        :return: int
         """
-        click.echo(b'\x0d', nl=False)
+        for item in self.stream:
+            self.counter += 1
+            messages = self.messages(item)
+            if messages is not None:
+                self.lines = []
+                for message in messages:
+                    self.out.write(message + '\n')
+            else:
+                self.draw(self.format(item))
+            self.out.flush()
+        return self.counter
 
-        self.progress = True
+    def messages(self, item):
+        """
+        Lines to write after the table, instead of drawing it.
+        :param item: string or list of records
+        :return: list of strings, or None for a table
+        """
+        return [item] if isinstance(item, str) else None
 
-        line = "{0} {1}: {2}".format(
-            data['status'],
-            data['id'],
-            data['progress'])
+    def format(self, records):
+        """
+        Table lines. Columns only get wider from one table to the next, so
+        that they don't jump around.
+        :param records: list of Record
+        :return: list of strings
+        """
+        if not records:
+            return []
+        headers = records[0].headers()
+        if headers != self.headers:
+            self.headers = headers
+            self.widths = None
+        lines = list(format_records(records, widths=self.widths))
+        self.widths = [len(x) for x in lines[1].split('  ')]
+        return lines
+
+    def draw(self, lines):
+        """
+        On a terminal, only lines that are different from the last table
+        are written, the cursor goes past the others.
+        :param lines: list of strings
+        """
+        if not self.tty:
+            self.out.write('\n'.join(lines) + '\n\n')
+            return
+        text, self.lines = redraw(lines, self.lines)
+        self.out.write(text)
+
+
+class TopWatchWriter(TableRefreshWriter):
+    """
+    "top --watch": the table of processes, then a line per change.
+    """
 
-        click.echo(line, nl=False)
+    def messages(self, item):
+        if item and isinstance(item, list) and isinstance(item[0], dict):
+            return format_changes(item)
+        return TableRefreshWriter.messages(self, item)
 
 
 def format_data(command, data):
@@ -163,31 +319,33 @@ def format_data(command, data):
     Uses tabulate to format the iterable.
     :return: string (multiline)
     """
+    from tabulate import tabulate
+
     if command and command in DATA_FORMATTERS:
         f = DATA_FORMATTERS[command]
         assert callable(f)
         return f(data)
 
-    if command and command in DATA_FILTERS:
-        data = DATA_FILTERS[command](data)
-
     if isinstance(data, dict):
         return format_struct(data)
     if isinstance(data, list) and len(data) > 0:
-        if isinstance(data[0], tuple):
+        if isinstance(data[0], Record):
+            return format_records(data)
+        elif isinstance(data[0], tuple):
             text = tabulate(data)
             return text.split('\n')
         elif isinstance(data[0], dict):
-            if data[0].keys() == ['Id']:
+            if list(data[0]) in (['Id'], ['Name']):
                 # Sometimes our 'quiet' output is a list of dicts but
-                # there's only a single "Id" key in each dict. Let's simplify
-                # those into plain string lists.
-                return [d['Id'] for d in data]
+                # there's only a single "Id" or "Name" key in each dict.
+                # Let's simplify those into plain string lists.
+                return [list(d.values())[0] for d in data]
             else:
+                # Rows are flattened and truncated one at a time, as the
+                # table is being written out.
                 data = flatten_rows(data)
                 data = truncate_rows(data)
-                text = tabulate(data, headers='keys')
-                return text.split('\n')
+                return format_table(data)
         elif isinstance(data[0], str):
             if len(data) == 1:
                 return data
@@ -201,6 +359,8 @@ def format_data(command, data):
 
 
 def format_struct(data, indent=4):
+    from ruamel.yaml import YAML
+
     output = StringIO()
     yaml = YAML()
     yaml.default_flow_style = False
@@ -321,66 +481,207 @@ def format_ports(ports):
     return ', '.join(format_port(x) for x in ports)
 
 
-def flatten_rows(rows):
+def flatten_row(row):
     """
     Transform all list or dict values in a dict into comma-separated strings.
-    :param rows: iterable of dictionaries
-    :return:
+    :param row: dict
+    :return: dict
     """
+    for k in row.keys():
+        if k in ROW_FORMATTERS:
+            row[k] = ROW_FORMATTERS[k](row[k])
+        elif isinstance(row[k], list):
+            row[k] = flatten_list(row[k])
+        elif isinstance(row[k], dict):
+            row[k] = flatten_dict(row[k])
+    return row
 
+
+def flatten_rows(rows):
+    """
+    Flatten every row, lazily.
+    :param rows: iterable of dictionaries
+    :return: generator
+    """
     for row in rows:
-        for k in row.keys():
-            if k in ROW_FORMATTERS:
-                row[k] = ROW_FORMATTERS[k](row[k])
-            elif isinstance(row[k], list):
-                row[k] = flatten_list(row[k])
-            elif isinstance(row[k], dict):
-                row[k] = flatten_dict(row[k])
-    return rows
+        yield flatten_row(row)
 
 
-def truncate_rows(rows, length=30, length_id=10):
+def trimto(s, l):
+    """
+    Trim string to length.
+    :param s: string to trim
+    :param l: length
+    """
+    if isinstance(s, str):
+        return s[:l + 1]
+    return s
+
+
+def truncate_row(row, length=30, length_id=10):
     """
     Truncate every string value in a dictionary up to a certain length.
-    :param rows: iterable of dictionaries
+    :param row: dict or string
     :param length: int
     :param length_id: length for dict keys that end with "Id"
-    :return:
+    :return: dict or string
     """
+    if isinstance(row, dict):
+        updated = {}
+        for k, v in row.items():
+            if k.endswith('Id'):
+                updated[k] = trimto(v, length_id)
+            else:
+                updated[k] = trimto(v, length)
+        return updated
+    elif isinstance(row, str):
+        return trimto(row, length)
+    return row
 
-    def trimto(s, l):
-        """
-        Trim string to length.
-        :param s: string to trim
-        :param l: length
-        """
-        if isinstance(s, str):
-            return s[:l + 1]
-        return s
 
-    result = []
+def truncate_rows(rows, length=30, length_id=10):
+    """
+    Truncate every row, lazily.
+    :param rows: iterable of dictionaries
+    :param length: int
+    :param length_id: length for dict keys that end with "Id"
+    :return: generator
+    """
     for row in rows:
-        if isinstance(row, dict):
-            updated = {}
-            for k, v in row.items():
-                if k.endswith('Id'):
-                    updated[k] = trimto(v, length_id)
-                else:
-                    updated[k] = trimto(v, length)
-            result.append(updated)
-        elif isinstance(row, str):
-            result.append(trimto(row, length))
-        else:
-            result.append(row)
-    return result
+        yield truncate_row(row, length, length_id)
+
+
+def is_number(value):
+    """
+    Numbers are right-aligned in tables, like tabulate does it.
+    :param value: anything
+    :return: boolean
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_cell(value):
+    """
+    Format table cell value.
+    :param value: anything
+    :return: string
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return '{0:g}'.format(value)
+    return '{0}'.format(value)
+
+
+def format_value(key, value, length=30, length_id=10):
+    """
+    Flatten and truncate a single value, like flatten_row and truncate_row
+    do it for the whole row.
+    :param key: string: column name
+    :param value: anything
+    :param length: int
+    :param length_id: length for keys that end with "Id"
+    :return: formatted value
+    """
+    if key in ROW_FORMATTERS:
+        value = ROW_FORMATTERS[key](value)
+    elif isinstance(value, list):
+        value = flatten_list(value)
+    elif isinstance(value, dict):
+        value = flatten_dict(value)
+    return trimto(value, length_id if key.endswith('Id') else length)
+
+
+def format_records(records, sample_size=TABLE_SAMPLE_SIZE, widths=None):
+    """
+    Format list of records as a table.
+    :param records: list of Record
+    :param sample_size: int
+    :param widths: list of int: smallest column widths
+    :return: generator of strings
+    """
+    headers = records[0].headers()
+    rows = ([format_value(h, v) for h, v in zip(headers, r.row())]
+            for r in records)
+    return format_rows(headers, rows, sample_size, widths)
+
+
+def format_table(rows, sample_size=TABLE_SAMPLE_SIZE):
+    """
+    Format list of dicts as a table. Columns are all the keys seen in the
+    first sample_size rows.
+    :param rows: iterable of dicts
+    :param sample_size: int
+    :return: generator of strings
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+
+    headers = []
+    for row in sample:
+        for k in row:
+            if k not in headers:
+                headers.append(k)
+
+    return format_rows(
+        headers,
+        ([row.get(h) for h in headers] for row in chain(sample, rows)),
+        sample_size)
+
+
+def format_rows(headers, rows, sample_size=TABLE_SAMPLE_SIZE, widths=None):
+    """
+    Format rows as a table, in the "simple" tabulate style, one line at a
+    time. Column widths and alignment are figured out from the first
+    sample_size rows only, so the first lines come out before the rest of
+    the rows are even looked at. Values further down that are wider than
+    the column push the rest of their line out.
+    :param headers: list of strings
+    :param rows: iterable of lists, matching headers
+    :param sample_size: int
+    :param widths: list of int: smallest column widths, such as the ones
+                   of a previous table
+    :return: generator of strings
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+    if not sample:
+        return
+
+    widths = [max(len(h) + 2, w) for h, w in
+              zip(headers, widths or [0] * len(headers))]
+    # Only columns that have numbers and nothing else are numeric.
+    numeric = [None] * len(headers)
+    for row in sample:
+        for i, value in enumerate(row):
+            if value is None:
+                continue
+            if numeric[i] is not False:
+                numeric[i] = is_number(value)
+            widths[i] = max(widths[i], len(format_cell(value)))
+
+    def format_line(cells):
+        return '  '.join(
+            c.rjust(w) if num else c.ljust(w)
+            for c, w, num in zip(cells, widths, numeric)).rstrip()
+
+    yield format_line(headers)
+    yield '  '.join('-' * w for w in widths)
+    for row in chain(sample, rows):
+        yield format_line([format_cell(v) for v in row])
 
 
 def format_top(data):
     """
     Format "top" output
-    :param data: dict
+    :param data: dict, or list of Process for several containers
     :return: list
     """
+    from tabulate import tabulate
+
+    if isinstance(data, list):
+        return format_data(None, data)
+
     result = []
     if data:
         if 'Titles' in data:
@@ -392,42 +693,6 @@ def format_top(data):
     return result
 
 
-def filter_dict(data, display_keys):
-    """
-    Strip out some of the dictionary fields.
-    :param display_keys: set
-    :param data: dict
-    :return: dict
-    """
-    if data and isinstance(data, list) and isinstance(data[0], dict):
-        result = []
-        for item in data:
-            filtered = {}
-            for k, v in item.items():
-                if k.lower() in display_keys:
-                    filtered[k] = v
-            result.append(filtered)
-        return result
-    return data
-
-
-def filter_ps(data):
-    display_keys = set([
-        'status', 'created', 'image', 'id', 'command', 'names', 'ports'])
-    return filter_dict(data, display_keys)
-
-
-def filter_volume_ls(data):
-    display_keys = set(['driver', 'name'])
-    return filter_dict(data, display_keys)
-
-
-DATA_FILTERS = {
-    'ps': filter_ps,
-    'volume ls': filter_volume_ls,
-}
-
-
 DATA_FORMATTERS = {
     'top': format_top,
     'port': format_port_lines
@@ -442,7 +707,12 @@ STREAM_FORMATTERS = {
     'push': JsonStreamFormatter,
     'build': JsonStreamFormatter,
     'inspect': JsonStreamDumper,
+    'logs': DemuxStreamWriter,
+    'exec': DemuxStreamWriter,
     'volume inspect': JsonStreamDumper,
+    'stats': TableRefreshWriter,
+    'ps': TableRefreshWriter,
+    'top': TopWatchWriter,
 }
 
 
@@ -465,6 +735,8 @@ def output_stream(command, stream, logs):
         # Something nasty has happened and we got an empty
         # output stream. But we have logs. Let's show those.
         lines = logs()
+        if isinstance(lines, bytes):
+            lines = lines.decode('utf-8', errors='replace')
         if lines:
             lines = lines.split('\n')
             for line in lines:
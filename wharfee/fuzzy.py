@@ -0,0 +1,183 @@
+# -*- coding: utf-8
+"""
+Fuzzy matching for completion. Ranks the same way as fuzzyfinder does:
+shortest match first, then earliest match, then alphabetically.
+"""
+import re
+import threading
+
+from collections import OrderedDict
+from heapq import merge, nsmallest
+
+
+def char_mask(text):
+    """
+    Bit mask of characters in lowercased text. If a name's mask is missing
+    any bits of the query's mask, the name can't match.
+    :param text: string
+    :return: int
+    """
+    mask = 0
+    for c in set(text):
+        mask |= 1 << (ord(c) & 63)
+    return mask
+
+
+def is_subsequence(query, text):
+    """
+    If all characters of query appear in text, in the same order.
+    :param query: string
+    :param text: string
+    :return: boolean
+    """
+    position = 0
+    for c in query:
+        position = text.find(c, position) + 1
+        if not position:
+            return False
+    return True
+
+
+class FuzzyMatcher(object):
+    """
+    Fuzzy matcher over a fixed list of names. Names that match the query
+    are remembered, so that when the query grows by a character (as it does
+    while typing), only those are checked again.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: iterable of strings
+        """
+        self.names = list(names)
+        self.lowered = [name.lower() for name in self.names]
+        self.masks = [char_mask(name) for name in self.lowered]
+        # Stack of (query, indexes of matching names), every query in it
+        # starts with the previous one.
+        self.survivors = [('', range(len(self.names)))]
+        self.lock = threading.Lock()
+
+    def filter(self, query):
+        """
+        Find names that contain all characters of the query in order.
+        :param query: string, lowercase
+        :return: list of indexes in self.names
+        """
+        with self.lock:
+            while not query.startswith(self.survivors[-1][0]):
+                self.survivors.pop()
+            previous, candidates = self.survivors[-1]
+            if previous == query:
+                return candidates
+
+            mask = char_mask(query)
+            masks, lowered = self.masks, self.lowered
+            result = [i for i in candidates
+                      if not mask & ~masks[i]
+                      if is_subsequence(query, lowered[i])]
+            self.survivors.append((query, result))
+            return result
+
+    def scored(self, word, limit=None):
+        """
+        Matching names with their rank, best first.
+        :param word: string user typed
+        :param limit: int: only this many best matches
+        :return: sorted list of (match length, match start, name)
+        """
+        query = word.lower()
+        indexes = self.filter(query)
+        names = self.names
+
+        def best(ranked):
+            if limit is None:
+                return sorted(ranked)
+            return nsmallest(limit, ranked)
+
+        if len(query) < 2:
+            # Single character: the first occurrence is the best match.
+            lowered = self.lowered
+            return best((len(query), lowered[i].find(query), names[i])
+                        for i in indexes)
+
+        # Same pattern as fuzzyfinder: lookahead for overlapping matches,
+        # the shortest one wins.
+        regex = re.compile(
+            '(?=({0}))'.format('.*?'.join(map(re.escape, word))),
+            re.IGNORECASE)
+        result = []
+        for i in indexes:
+            found = min(regex.finditer(names[i]),
+                        key=lambda m: len(m.group(1)), default=None)
+            if found is not None:
+                result.append((len(found.group(1)), found.start(), names[i]))
+        return best(result)
+
+    def match(self, word, limit=None):
+        """
+        Matching names, best first.
+        :param word: string user typed
+        :param limit: int: only this many best matches
+        :return: list of strings
+        """
+        return [name for _, _, name in self.scored(word, limit)]
+
+
+def fuzzy_matcher(collection):
+    """
+    Matcher for the collection. Collections that can hold attributes (like
+    PrefixIndex) keep theirs, so it's reused on the next key press.
+    :param collection: iterable of strings
+    :return: FuzzyMatcher
+    """
+    matcher = getattr(collection, 'fuzzy_matcher', None)
+    if matcher is None:
+        matcher = FuzzyMatcher(collection)
+        try:
+            collection.fuzzy_matcher = matcher
+        except AttributeError:
+            pass
+    return matcher
+
+
+CACHE_SIZE = 64
+CACHE = OrderedDict()
+CACHE_LOCK = threading.Lock()
+
+
+def names_matcher(names):
+    """
+    Matcher for a set of names that is built again on every key press,
+    like the options that are still left to complete. Matchers of recent
+    sets are remembered, so the same set gets the same matcher back.
+    :param names: iterable of strings
+    :return: FuzzyMatcher
+    """
+    key = frozenset(names)
+    with CACHE_LOCK:
+        matcher = CACHE.get(key)
+        if matcher is not None:
+            CACHE.move_to_end(key)
+            return matcher
+        matcher = CACHE[key] = FuzzyMatcher(sorted(key))
+        while len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+    return matcher
+
+
+def merge_fuzzy_matches(word, collections, limit=None):
+    """
+    Yield names from all collections that fuzzy-match word, best first and
+    without duplicates.
+    :param word: string user typed
+    :param collections: list of iterables of strings
+    :param limit: int: only this many best matches from every collection
+    :return: iterable
+    """
+    scored = [fuzzy_matcher(c).scored(word, limit)
+              for c in collections if c]
+    seen = set()
+    for _, _, name in merge(*scored):
+        if name not in seen:
+            seen.add(name)
+            yield name
@@ -1,6 +1,12 @@
 # -*- coding: utf-8
 import os
+import re
 import math
+import time
+import threading
+
+from collections import OrderedDict
+from datetime import datetime
 
 
 def parse_kv_as_dict(filters, convert_boolean=False):
@@ -131,6 +137,48 @@ def filesize(size):
     return '0 B'
 
 
+def read_image_list(path):
+    """
+    Read image names from a file, one per line. Blank lines and lines
+    starting with # are skipped.
+    :param path: string
+    :return: list
+    """
+    with open(os.path.expanduser(path)) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def parse_image_name(repo_tag, image_id):
+    """
+    Return the repository part of "repo:tag" for the image completer.
+    Untagged images are referred to by the short image ID.
+    :param repo_tag: string
+    :param image_id: string
+    :return: string
+    """
+    if ':' in repo_tag:
+        result = repo_tag.split(':', 2)[0]
+    else:
+        result = repo_tag
+    if result == '<none>':
+        result = image_id[:11]
+    return result
+
+
+def format_tagged(repo_tag, image_id):
+    """
+    Return "repo:tag" for the tagged image completer.
+    Untagged images are referred to by the short image ID.
+    :param repo_tag: string
+    :param image_id: string
+    :return: string
+    """
+    if repo_tag == '<none>:<none>':
+        return image_id[:11]
+    return repo_tag
+
+
 def complete_path(curr_dir, last_dir):
     """
     Return the path to complete that matches the last entered component.
@@ -160,29 +208,117 @@ def parse_path(root_dir):
     return base_dir, last_dir, position
 
 
+class DirectoryCache(object):
+    """
+    Recently used directory listings for path completion. A listing is
+    reused while the directory's mtime stays the same (creating, removing
+    or renaming entries changes it), so typing deeper into a directory
+    costs one stat per key press instead of one per entry.
+    """
+
+    def __init__(self, size=128):
+        """
+        :param size: int: how many directories to remember
+        """
+        self.size = size
+        self.listings = OrderedDict()
+        self.lock = threading.Lock()
+
+    def entries(self, path):
+        """
+        List directory, from cache if it didn't change.
+        :param path: string: directory
+        :return: sorted list of (name, is directory) tuples
+        :raises OSError: if path is not a readable directory
+        """
+        key = os.path.abspath(path)
+        mtime = os.stat(key).st_mtime_ns
+        with self.lock:
+            cached = self.listings.get(key)
+            if cached is not None and cached[0] == mtime:
+                self.listings.move_to_end(key)
+                return cached[1]
+
+        entries = []
+        with os.scandir(key) as it:
+            for entry in it:
+                # Uses d_type, without stat, unless entry is a symlink.
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+        entries.sort()
+
+        with self.lock:
+            self.listings[key] = (mtime, entries)
+            self.listings.move_to_end(key)
+            while len(self.listings) > self.size:
+                self.listings.popitem(last=False)
+        return entries
+
+    def clear(self):
+        with self.lock:
+            self.listings.clear()
+
+
+DIRECTORY_CACHE = DirectoryCache()
+
+
 def list_dir(root_dir, dirs_only=False, include_special=False):
     """
-    List directory.
+    List directory. If root_dir is not a directory, list the one it is in.
     :param root_dir: string: directory to list
     :param dirs_only: boolean
     :param include_special: boolean
-    :return: list
+    :return: list, sorted
     """
     root_dir = '.' if not root_dir else root_dir
-    res = []
 
     if '~' in root_dir:
         root_dir = os.path.expanduser(root_dir)
 
-    if not os.path.exists(root_dir):
+    try:
+        entries = DIRECTORY_CACHE.entries(root_dir)
+    except OSError:
         root_dir, _ = os.path.split(root_dir)
+        try:
+            entries = DIRECTORY_CACHE.entries(root_dir or '.')
+        except OSError:
+            return []
+
+    return [name for name, is_dir in entries
+            if include_special or not name.startswith('.')
+            if is_dir or not dirs_only]
+
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(h|ms|m|s)')
+DURATION_UNITS = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+
+
+def parse_timestamp(value, now=None):
+    """
+    Parse time the way "docker logs --since" does: Unix timestamp,
+    RFC 3339 date ("2013-01-02T13:23:37Z"), or duration relative to now
+    ("42m", "1h30m"). Dates without time zone are local.
+    :param value: string
+    :param now: float: current time, for relative values
+    :return: float: Unix timestamp
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = DURATION_PART.findall(value)
+    if parts and ''.join(n + u for n, u in parts) == value:
+        seconds = sum(float(n) * DURATION_UNITS[u] for n, u in parts)
+        return (time.time() if now is None else now) - seconds
 
-    if os.path.exists(root_dir):
-        for name in os.listdir(root_dir):
-            path = os.path.join(root_dir, name)
-            if not include_special and name.startswith('.'):
-                continue
-            if dirs_only and not os.path.isdir(path):
-                continue
-            res.append(name)
-    return res
+    try:
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError('Invalid time: {0}.'.format(value))
@@ -1,22 +1,58 @@
 # -*- coding: utf-8
-from pygments.lexer import RegexLexer
-from pygments.lexer import words
-from pygments.token import Operator, Keyword, Text
+from prompt_toolkit.lexers import Lexer
 
 from .options import COMMAND_NAMES, all_option_names
+from .tokenizer import tokenize
 
+COMMAND_STYLE = 'class:pygments.operator.word'
+OPTION_STYLE = 'class:pygments.keyword'
 
-class CommandLexer(RegexLexer):
-    name = 'Command Line'
-    aliases = ['cli']
-    filenames = []
-
-    tokens = {
-        'root': [
-            (words(tuple(COMMAND_NAMES), prefix=r'^', suffix=r'\b'),
-             Operator.Word),
-            (words(tuple(all_option_names()), prefix=r'', suffix=r'\b'),
-             Keyword),
-            (r'.*\n', Text),
-        ]
-    }
+
+class CommandLexer(Lexer):
+    """
+    Highlight command and option names. Uses the same tokens as the
+    completer, so a line is tokenized once per key press.
+    """
+
+    def __init__(self):
+        self.commands = frozenset(COMMAND_NAMES)
+        self.options = frozenset(all_option_names())
+
+    def lex_document(self, document):
+        lines = document.lines
+
+        def get_line(lineno):
+            return self.lex_line(lines[lineno], lineno == 0)
+
+        return get_line
+
+    def lex_line(self, text, is_first=True):
+        """
+        Split line into styled fragments.
+        :param text: string: line
+        :param is_first: boolean: if the line starts with a command
+        :return: list of (style, text) tuples
+        """
+        tokens = tokenize(text)
+
+        command_length = 0
+        if is_first and tokens.command in self.commands:
+            command_length = len(tokens.command.split(' '))
+
+        fragments = []
+        position = 0
+        for i, (start, end) in enumerate(tokens.spans):
+            if i < command_length:
+                style = COMMAND_STYLE
+            else:
+                name = text[start:end].split('=', 1)[0]
+                if name not in self.options:
+                    continue
+                style, end = OPTION_STYLE, start + len(name)
+            if start > position:
+                fragments.append(('', text[position:start]))
+            fragments.append((style, text[start:end]))
+            position = end
+        if position < len(text):
+            fragments.append(('', text[position:]))
+        return fragments
@@ -1,28 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8
 import os
+import sys
+import time
 import click
+import threading
 import traceback
 
 from types import GeneratorType
 from prompt_toolkit import PromptSession
+from prompt_toolkit.application import run_in_terminal
 from prompt_toolkit.history import FileHistory
-from prompt_toolkit.lexers import PygmentsLexer
 
 from .client import DockerClient
 from .client import DockerPermissionException
 from .client import DockerTimeoutException
 from .client import DockerSslException
 from .completer import DockerCompleter
+from .background import BackgroundCompleter
+from .events import EventWatcher
 from .lexer import CommandLexer
 from .formatter import format_data
 from .formatter import output_stream
+from .serializers import write_serialized, SERIALIZED_COMMANDS
 from .config import write_default_config, read_config
 from .style import style_factory
 from .keys import get_key_bindings
+from .helpers import parse_image_name, format_tagged
+from .records import Container, Image, Volume
 from .toolbar import create_toolbar_handler
-from .options import OptionError
+from .options import OptionError, OUTPUT_FORMATS
 from .logger import create_logger
+from .parallel import execute_parallel
 from .__init__ import __version__
 
 
@@ -34,16 +43,25 @@ class WharfeeCli(object):
     session = None
     keyword_completer = None
     handler = None
+    event_watcher = None
+    first_prompt_shown = False
     saved_less_opts = None
     config = None
     config_template = 'wharfeerc'
     config_name = '~/.wharfeerc'
 
-    def __init__(self, no_completion=False):
+    def __init__(self, no_completion=False, startup_timing=False,
+                 output_format=None):
         """
         Initialize class members.
         Should read the config here at some point.
+        :param no_completion: boolean
+        :param startup_timing: boolean: report time to first prompt
+        :param output_format: string: one of OUTPUT_FORMATS, for the whole
+        session. Default is "output_format" in the config.
         """
+        self.started = time.perf_counter()
+        self.startup_timing = startup_timing
 
         self.config = self.read_configuration()
         self.theme = self.config['main']['theme']
@@ -52,19 +70,52 @@ class WharfeeCli(object):
         log_level = self.config['main']['log_level']
         self.logger = create_logger(__name__, log_file, log_level)
 
+        self.output_format = output_format or \
+            self.config['main'].get('output_format', 'table')
+        if self.output_format not in OUTPUT_FORMATS:
+            self.logger.warning('Unknown output_format: %r.',
+                                self.output_format)
+            self.output_format = 'table'
+
+        hosts = dict(self.config['hosts']) if 'hosts' in self.config else {}
+
         # set_completer_options refreshes all by default
         self.handler = DockerClient(
             self.config['main'].as_int('client_timeout'),
             self.clear,
             self.refresh_completions_force,
-            self.logger)
+            self.logger,
+            self.config['main'].as_int('parallel'),
+            hosts,
+            self.config['main'].as_int('host_timeout'))
 
         self.completer = DockerCompleter(
             long_option_names=self.get_long_options(),
             fuzzy=self.get_fuzzy_match())
-        self.set_completer_options()
         self.completer.set_enabled(not no_completion)
+
+        # Do not wait for Docker to show the prompt: container, image and
+        # volume names are loaded in the background.
+        if not no_completion:
+            self.completer.set_loading(True)
+            # Events only come from the default daemon, so with several
+            # hosts completions are re-read after commands.
+            if self.config['main'].as_bool('refresh_from_events') \
+                    and not hosts:
+                # Watcher does the initial load after it subscribes.
+                self.event_watcher = EventWatcher(
+                    self.handler,
+                    self.completer,
+                    self.load_completions,
+                    self.logger)
+                self.event_watcher.start()
+            else:
+                threading.Thread(target=self.load_completions,
+                                 name='completions',
+                                 daemon=True).start()
+
         self.saved_less_opts = self.set_less_opts()
+        self.batch_local = threading.local()
 
     def read_configuration(self):
         """
@@ -134,45 +185,94 @@ class WharfeeCli(object):
 
         if cons:
             cs = self.handler.containers(all=True)
-            if cs and len(cs) > 0 and isinstance(cs[0], dict):
-                containers = [name for c in cs for name in c['Names']]
+            if cs and isinstance(cs[0], Container):
+                containers = [name for c in cs for name in c.names]
                 self.completer.set_containers(containers)
+                self.completer.set_name_hosts(
+                    'containers', ((n, c.host) for c in cs for n in c.names))
 
         if runs:
             cs = self.handler.containers()
-            if cs and len(cs) > 0 and isinstance(cs[0], dict):
-                running = [name for c in cs for name in c['Names']]
+            if cs and isinstance(cs[0], Container):
+                running = [name for c in cs for name in c.names]
                 self.completer.set_running(running)
 
         if imgs:
-            def format_tagged(tagname, img_id):
-                if tagname == '<none>:<none>':
-                    return img_id[:11]
-                return tagname
-
-            def parse_image_name(tag, img_id):
-                if ':' in tag:
-                    result = tag.split(':', 2)[0]
-                else:
-                    result = tag
-                if result == '<none>':
-                    result = img_id[:11]
-                return result
-
             ims = self.handler.images()
-            if ims and len(ims) > 0 and isinstance(ims[0], dict):
+            if ims and isinstance(ims[0], Image):
                 images = set([])
                 tagged = set([])
+                hosts = []
                 for im in ims:
-                    repo_tag = '{0}:{1}'.format(im['Repository'], im['Tag'])
-                    images.add(parse_image_name(repo_tag, im['Id']))
-                    tagged.add(format_tagged(repo_tag, im['Id']))
+                    image = parse_image_name(im.repo_tag, im.id)
+                    images.add(image)
+                    tagged.add(format_tagged(im.repo_tag, im.id))
+                    hosts.append((image, im.host))
                 self.completer.set_images(images)
                 self.completer.set_tagged(tagged)
+                self.completer.set_name_hosts('images', hosts)
 
         if vols:
-            vs = self.handler.volume_ls(quiet=True)
-            self.completer.set_volumes(vs)
+            vs = self.handler.volume_ls() or []
+            vs = [v for v in vs if isinstance(v, Volume)]
+            self.completer.set_volumes([v.name for v in vs])
+            self.completer.set_name_hosts(
+                'volumes', ((v.name, v.host) for v in vs))
+
+    def load_completions(self):
+        """
+        Read all completions, showing "loading" in the toolbar meanwhile.
+        Runs in a background thread.
+        """
+        self.completer.set_loading(True)
+        self.invalidate()
+        try:
+            self.set_completer_options()
+        except Exception as ex:
+            self.logger.debug('Error loading completions: %r.', ex)
+            self.logger.error("traceback: %r", traceback.format_exc())
+        finally:
+            self.completer.set_loading(False)
+            self.invalidate()
+
+        if self.startup_timing:
+            self.startup_timing = False
+            self.report_timing('Completions loaded in {0:.0f} ms.'.format(
+                (time.perf_counter() - self.started) * 1000))
+
+    def invalidate(self):
+        """
+        Redraw the prompt (toolbar) from any thread.
+        """
+        if self.session and self.session.app.is_running:
+            self.session.app.invalidate()
+
+    def report_timing(self, message):
+        """
+        Print out a timing message without breaking the prompt.
+        :param message: string
+        """
+        app = self.session.app if self.session else None
+        if app and app.is_running:
+            app.loop.call_soon_threadsafe(
+                run_in_terminal, lambda: click.echo(message))
+        else:
+            click.echo(message)
+
+    def on_first_prompt(self):
+        """
+        Called every time the prompt is about to be shown, reports
+        the first time only.
+        """
+        if self.first_prompt_shown:
+            return
+        self.first_prompt_shown = True
+
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.logger.debug('Time to first prompt: %.0f ms.', elapsed)
+        if self.startup_timing:
+            self.report_timing(
+                'Time to first prompt: {0:.0f} ms.'.format(elapsed))
 
     def set_fuzzy_match(self, is_fuzzy):
         """
@@ -214,11 +314,149 @@ class WharfeeCli(object):
         After processing the command, refresh the lists of
         containers and images as needed
         """
+        if self.event_watcher and self.event_watcher.is_synced:
+            # Events stream keeps the completer up to date.
+            return
+
         self.set_completer_options(self.handler.is_refresh_containers,
                                    self.handler.is_refresh_running,
                                    self.handler.is_refresh_images,
                                    self.handler.is_refresh_volumes)
 
+    def write_output(self, command, output, log=None, pager=True,
+                     stream=None, output_format=None):
+        """
+        Write out the command output.
+        :param command: string
+        :param output: generator, list or dict
+        :param log: callable: fallback output for empty streams
+        :param pager: boolean: send tables and structures to the pager
+        :param stream: boolean: output is a stream, default is to check if
+        it is a generator
+        :param output_format: string: format asked for by the command,
+        default is the session's
+        """
+        if stream is None:
+            stream = isinstance(output, GeneratorType)
+
+        output_format = output_format or self.output_format
+        if output_format != 'table' and command in SERIALIZED_COMMANDS \
+                and output is not None:
+            # Straight to stdout, no pager.
+            write_serialized(output, output_format)
+
+        elif stream:
+            output_stream(command, output, log)
+
+        elif output is not None:
+            lines = format_data(command, output)
+            if pager:
+                # Lines go to the pager as they are formatted.
+                click.echo_via_pager(line + '\n' for line in lines)
+            else:
+                for line in lines:
+                    click.echo(line)
+
+    def run_batch(self, lines, concurrent=1, stats=False):
+        """
+        Run commands one per line, without prompt, completions or pager.
+        Empty lines and lines starting with # are skipped.
+        :param lines: iterable of strings
+        :param concurrent: int: run up to this many commands at once, the
+        output still comes in the order of commands
+        :param stats: boolean: report commands per second at the end
+        :return: int: number of commands that failed
+        """
+        commands = (line.strip() for line in lines)
+        commands = (c for c in commands if c and not c.startswith('#'))
+
+        started = time.perf_counter()
+        count = 0
+        failed = 0
+
+        if concurrent > 1:
+            results = execute_parallel(self.run_batch_command,
+                                       list(commands), concurrent,
+                                       ordered=True)
+        else:
+            results = ((c, None, None) for c in commands)
+
+        for text, result, ex in results:
+            count += 1
+            try:
+                if ex is not None:
+                    raise ex
+                if result is None:
+                    self.handler.handle_input(text)
+                    result = (self.handler.command, self.handler.output,
+                              self.handler.log, None, self.handler.after,
+                              self.handler.output_format)
+                command, output, log, is_stream, after, output_format = \
+                    result
+                self.write_output(command, output, log, pager=False,
+                                  stream=is_stream,
+                                  output_format=output_format)
+                if after:
+                    for line in after():
+                        click.echo(line)
+            except OptionError as ex:
+                failed += 1
+                click.secho('{0}: {1}'.format(text, ex.msg), fg='red',
+                            err=True)
+            except Exception as ex:
+                failed += 1
+                self.logger.debug('Exception: %r.', ex)
+                self.logger.error("traceback: %r", traceback.format_exc())
+                click.secho('{0}: {1}'.format(text, ex), fg='red', err=True)
+
+        if stats:
+            elapsed = time.perf_counter() - started
+            click.echo('{0} commands in {1:.2f} s ({2:.1f} commands/s), '
+                       '{3} failed.'.format(count, elapsed,
+                                            count / elapsed if elapsed else 0,
+                                            failed),
+                       err=True)
+        return failed
+
+    def run_batch_command(self, text):
+        """
+        Run one command on a worker thread, with its own DockerClient that
+        shares the API connection. Streamed output is read here, so that it
+        can be written out in order later.
+        :param text: string
+        :return: tuple (command, output, log, is_stream, after,
+        output_format)
+        """
+        handler = getattr(self.batch_local, 'handler', None)
+        if handler is None:
+            handler = DockerClient(
+                self.config['main'].as_int('client_timeout'),
+                lambda: None,
+                lambda: None,
+                self.logger,
+                self.config['main'].as_int('parallel'),
+                self.handler.hosts,
+                self.handler.host_timeout,
+                instance=self.handler.instance)
+            self.batch_local.handler = handler
+
+        handler.handle_input(text)
+
+        output = handler.output
+        is_stream = isinstance(output, GeneratorType)
+        if is_stream:
+            output = list(output)
+
+        after = None
+        if handler.after:
+            after_lines = list(handler.after())
+
+            def after():
+                return after_lines
+
+        return handler.command, output, handler.log, is_stream, after, \
+            handler.output_format
+
     def run_cli(self):
         """
         Run the main loop
@@ -227,7 +465,9 @@ class WharfeeCli(object):
         print('Home: http://wharfee.com')
 
         history = FileHistory(os.path.expanduser('~/.wharfee-history'))
-        toolbar_handler = create_toolbar_handler(self.get_long_options, self.get_fuzzy_match)
+        toolbar_handler = create_toolbar_handler(self.get_long_options,
+                                                 self.get_fuzzy_match,
+                                                 self.completer.is_loading)
 
         key_bindings = get_key_bindings(
             self.set_long_options,
@@ -235,12 +475,17 @@ class WharfeeCli(object):
             self.set_fuzzy_match,
             self.get_fuzzy_match)
 
+        # Completions are found in a background thread. Whatever is found
+        # within the budget is shown, the rest is dropped.
+        budget = self.config['main'].as_int('completion_budget_ms')
+        completer = BackgroundCompleter(self.completer, budget / 1000.0)
+
         self.session = PromptSession(
             message='wharfee> ',
             history=history,
-            completer=self.completer,
+            completer=completer,
             complete_while_typing=True,
-            lexer=PygmentsLexer(CommandLexer),
+            lexer=CommandLexer(),
             style=style_factory(self.theme),
             key_bindings=key_bindings,
             bottom_toolbar=toolbar_handler,
@@ -248,19 +493,13 @@ class WharfeeCli(object):
 
         while True:
             try:
-                text = self.session.prompt()
+                text = self.session.prompt(pre_run=self.on_first_prompt)
                 self.handler.handle_input(text)
 
-                if isinstance(self.handler.output, GeneratorType):
-                    output_stream(self.handler.command,
+                self.write_output(self.handler.command,
                                   self.handler.output,
-                                  self.handler.log)
-
-                elif self.handler.output is not None:
-                    lines = format_data(
-                        self.handler.command,
-                        self.handler.output)
-                    click.echo_via_pager('\n'.join(lines))
+                                  self.handler.log,
+                                  output_format=self.handler.output_format)
 
                 if self.handler.after:
                     for line in self.handler.after():
@@ -302,6 +541,9 @@ class WharfeeCli(object):
                 self.logger.error("traceback: %r", traceback.format_exc())
                 click.secho(str(ex), fg='red')
 
+        if self.event_watcher:
+            self.event_watcher.stop()
+
         self.revert_less_opts()
         self.write_config_file()
         print('Goodbye!')
@@ -309,12 +551,46 @@ class WharfeeCli(object):
 
 @click.command()
 @click.option('--no-completion', is_flag=True, default=False, help='Disable autocompletion.')
-def cli(no_completion):
+@click.option('--startup-timing', is_flag=True, default=False,
+              help='Report time to first prompt and to completions loaded.')
+@click.option('--profile-imports', is_flag=True, default=False,
+              help='Report how long it takes to import each module and exit.')
+@click.option('-f', '--file', 'batch_file', type=click.File('r'), default=None,
+              help=('Run commands from file, one per line, and exit. '
+                    'Commands are also read from stdin if it is not a '
+                    'terminal.'))
+@click.option('--concurrent', type=int, default=1, metavar='N',
+              help='With -f or stdin, run up to N commands at once.')
+@click.option('--stats', is_flag=True, default=False,
+              help='With -f or stdin, report commands per second.')
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS),
+              default=None,
+              help=('Output format of ps, images, volume ls, inspect, top '
+                    'and stats. Default is "output_format" in '
+                    '~/.wharfeerc.'))
+def cli(no_completion, startup_timing, profile_imports, batch_file,
+        concurrent, stats, output_format):
     """
     Create and call the CLI
     """
+    if profile_imports:
+        from .profiling import profile_imports as profile, \
+            format_import_profile
+        for line in format_import_profile(profile()):
+            click.echo(line)
+        return
+
+    if batch_file is None and not sys.stdin.isatty():
+        batch_file = sys.stdin
+
     try:
-        dcli = WharfeeCli(no_completion)
+        if batch_file is not None:
+            dcli = WharfeeCli(no_completion=True, output_format=output_format)
+            failed = dcli.run_batch(batch_file, concurrent, stats)
+            dcli.revert_less_opts()
+            sys.exit(1 if failed else 0)
+
+        dcli = WharfeeCli(no_completion, startup_timing, output_format)
         dcli.run_cli()
     except DockerTimeoutException as ex:
         click.secho(ex.message, fg='red')
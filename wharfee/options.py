@@ -1,4 +1,7 @@
 # -*- coding: utf-8
+import threading
+
+from collections import OrderedDict
 from optparse import OptionParser, OptionError, OptionGroup
 from .option import CommandOption
 
@@ -29,6 +32,7 @@ COMMAND_NAMES = [
     'search',
     'shell',
     'start',
+    'stats',
     'stop',
     'tag',
     'top',
@@ -41,7 +45,66 @@ COMMAND_NAMES = [
 ]
 
 
-COMMAND_LENGTH = dict((k, len(k.split(' '))) for k in COMMAND_NAMES if ' ' in k)
+class CommandTrie(object):
+    """
+    Command names, word by word. Multi-word commands ("volume ls") are
+    found by walking the tokens, without joining them back into a string.
+    """
+
+    __slots__ = ('children', 'command')
+
+    def __init__(self, names=()):
+        """
+        :param names: iterable of command names
+        """
+        self.children = {}
+        self.command = None
+        for name in names:
+            node = self
+            for word in name.split(' '):
+                node = node.children.setdefault(word, CommandTrie())
+            node.command = name
+
+    def find(self, tokens):
+        """
+        Node for tokens, if they all are words of some command name.
+        :param tokens: list of strings
+        :return: CommandTrie or None
+        """
+        node = self
+        for token in tokens:
+            node = node.children.get(token)
+            if node is None:
+                return None
+        return node
+
+    def match_length(self, tokens):
+        """
+        How many tokens the longest command at the start of tokens takes.
+        :param tokens: list of strings
+        :return: int, 0 if there is no such command
+        """
+        node, length = self, 0
+        for i, token in enumerate(tokens):
+            node = node.children.get(token)
+            if node is None:
+                break
+            if node.command:
+                length = i + 1
+        return length
+
+    def subcommands(self, tokens):
+        """
+        Words that can follow tokens in a command name ("ls", "rm" after
+        "volume").
+        :param tokens: list of strings
+        :return: sorted list of strings
+        """
+        node = self.find(tokens) if tokens else None
+        return sorted(node.children) if node else []
+
+
+COMMAND_TRIE = CommandTrie(COMMAND_NAMES)
 
 
 OPTION_HELP = CommandOption(
@@ -252,6 +315,38 @@ OPTION_PORTS = CommandOption(
     dest='ports',
     nargs='*')
 
+OPTION_PARALLEL = CommandOption(
+    CommandOption.TYPE_NUMERIC, None, '--parallel',
+    action='store',
+    type='int',
+    dest='parallel',
+    metavar='N',
+    help=('Number of targets to process concurrently (default is '
+          '"parallel" setting in ~/.wharfeerc).'),
+    api_match=False,
+    cli_match=False)
+
+OPTION_ORDERED = CommandOption(
+    CommandOption.TYPE_BOOLEAN, None, '--ordered',
+    action='store_true',
+    dest='ordered',
+    help=('With --parallel, output results in the order targets were '
+          'given, rather than as they complete.'),
+    api_match=False,
+    cli_match=False)
+
+OUTPUT_FORMATS = ['table', 'json', 'ndjson', 'csv', 'tsv']
+
+OPTION_FORMAT = CommandOption(
+    CommandOption.TYPE_CHOICE, None, '--format',
+    action='store',
+    dest='format',
+    choices=OUTPUT_FORMATS,
+    help=('Output format: table, json, ndjson, csv or tsv (default is '
+          '"output_format" setting in ~/.wharfeerc).'),
+    api_match=False,
+    cli_match=False)
+
 
 COMMAND_OPTIONS = {
     'attach': [
@@ -345,6 +440,7 @@ COMMAND_OPTIONS = {
                       action='store',
                       help='Container to inspect.',
                       nargs='*'),
+        OPTION_FORMAT,
     ],
     'kill': [
         CommandOption(CommandOption.TYPE_CHOICE, '-s', '--signal',
@@ -359,6 +455,8 @@ COMMAND_OPTIONS = {
                                'TTOU', 'URG', 'USR1', 'USR2', 'VTALRM',
                                'WINCH', 'XCPU', 'XFSZ']),
         OPTION_CONTAINER_RUNNING,
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
     'login': [
         CommandOption(CommandOption.TYPE_STRING, '-e', '--email',
@@ -374,8 +472,30 @@ COMMAND_OPTIONS = {
     'logs': [
         CommandOption(CommandOption.TYPE_BOOLEAN, '-f', '--follow',
                       action='store_true',
-                      dest='stream',
+                      dest='follow',
                       help='Follow log output.'),
+        CommandOption(CommandOption.TYPE_STRING, None, '--since',
+                      action='store',
+                      dest='since',
+                      help=('Show logs since timestamp (e.g. '
+                            '2013-01-02T13:23:37Z) or relative (e.g. 42m '
+                            'for 42 minutes).')),
+        CommandOption(CommandOption.TYPE_STRING, None, '--until',
+                      action='store',
+                      dest='until',
+                      help=('Show logs before timestamp (e.g. '
+                            '2013-01-02T13:23:37Z) or relative (e.g. 42m '
+                            'for 42 minutes).')),
+        CommandOption(CommandOption.TYPE_STRING, '-n', '--tail',
+                      action='store',
+                      dest='tail',
+                      default='all',
+                      help=('Number of lines to show from the end of the '
+                            'logs (default "all").')),
+        CommandOption(CommandOption.TYPE_BOOLEAN, '-t', '--timestamps',
+                      action='store_true',
+                      dest='timestamps',
+                      help='Show timestamps.'),
         OPTION_CONTAINER,
     ],
     'pause': [
@@ -425,12 +545,37 @@ COMMAND_OPTIONS = {
                       action='store',
                       dest='since',
                       help='Show only containers created since Id or Name, ' +
-                           'include non-running ones.')
+                           'include non-running ones.'),
+        CommandOption(CommandOption.TYPE_BOOLEAN, '-w', '--watch',
+                      action='store_true',
+                      dest='watch',
+                      help='Keep the list on screen and update it as '
+                           'containers change.',
+                      api_match=False,
+                      cli_match=False),
+        CommandOption(CommandOption.TYPE_NUMERIC, None, '--interval',
+                      action='store',
+                      type='float',
+                      dest='interval',
+                      metavar='SECONDS',
+                      help='Seconds between updates with --watch, when '
+                           'there are no events to go by (default 2).',
+                      api_match=False,
+                      cli_match=False),
+        OPTION_FORMAT,
     ],
     'pull': [
         CommandOption(CommandOption.TYPE_IMAGE, 'image',
                       action='store',
-                      help='Image name to pull.'),
+                      help='Image name to pull.',
+                      nargs='*'),
+        CommandOption(CommandOption.TYPE_FILEPATH, '-f', '--file',
+                      action='store',
+                      dest='file',
+                      help='Also pull images listed in a file, one per line.',
+                      api_match=False,
+                      cli_match=False),
+        OPTION_PARALLEL,
     ],
     'push': [
         CommandOption(CommandOption.TYPE_IMAGE_TAGGED, 'name',
@@ -450,7 +595,8 @@ COMMAND_OPTIONS = {
         CommandOption(CommandOption.TYPE_BOOLEAN, '-q', '--quiet',
                       action='store_true',
                       dest='quiet',
-                      help='Only show numeric IDs.')
+                      help='Only show numeric IDs.'),
+        OPTION_FORMAT,
     ],
     'refresh': [],
     'rename': [
@@ -521,6 +667,8 @@ COMMAND_OPTIONS = {
                       action='store',
                       help='Container ID or name to use.',
                       nargs='+'),
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
     'rm': [
         CommandOption(CommandOption.TYPE_CONTAINER, 'container',
@@ -543,6 +691,8 @@ COMMAND_OPTIONS = {
                       action='store_true',
                       dest='force',
                       help='Force the removal of a running container (uses SIGKILL).'),
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
     'rmi': [
         CommandOption(CommandOption.TYPE_IMAGE_TAGGED, 'image',
@@ -561,6 +711,8 @@ COMMAND_OPTIONS = {
                       help='Shortcut to remove all images.',
                       api_match=False,
                       cli_match=False),
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
     'search': [
         CommandOption(CommandOption.TYPE_IMAGE, 'term',
@@ -575,6 +727,8 @@ COMMAND_OPTIONS = {
                       help=('Seconds to wait for stop before killing it '
                             '(default 10).')),
         OPTION_CONTAINER_RUNNING,
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
     'tag': [
         CommandOption(CommandOption.TYPE_BOOLEAN, '-f', '--force',
@@ -589,8 +743,45 @@ COMMAND_OPTIONS = {
                       help=('The tag name (format: "[registryhost/]'
                             '[username/]name[:tag]").')),
     ],
+    'stats': [
+        CommandOption(CommandOption.TYPE_CONTAINER_RUN, 'container',
+                      action='store',
+                      help='Container ID or name to use. All running '
+                           'containers by default.',
+                      nargs='*'),
+        CommandOption(CommandOption.TYPE_BOOLEAN, '-a', '--all',
+                      action='store_true',
+                      dest='all',
+                      help='Show all containers. '
+                           'Only running containers are shown by default.'),
+        CommandOption(CommandOption.TYPE_BOOLEAN, None, '--no-stream',
+                      action='store_true',
+                      dest='no_stream',
+                      help='Show a single snapshot of all containers and '
+                           'exit.'),
+        OPTION_FORMAT,
+    ],
     'top': [
-        OPTION_CONTAINER_RUNNING,
+        CommandOption(CommandOption.TYPE_CONTAINER_RUN, 'container',
+                      action='store',
+                      help='Container ID or name to use.',
+                      nargs='+'),
+        CommandOption(CommandOption.TYPE_BOOLEAN, '-w', '--watch',
+                      action='store_true',
+                      dest='watch',
+                      help='Keep looking at the processes and show the ones '
+                           'that start, exit or change.',
+                      api_match=False,
+                      cli_match=False),
+        CommandOption(CommandOption.TYPE_NUMERIC, None, '--interval',
+                      action='store',
+                      type='float',
+                      dest='interval',
+                      metavar='SECONDS',
+                      help='Seconds between looks with --watch (default 2).',
+                      api_match=False,
+                      cli_match=False),
+        OPTION_FORMAT,
     ],
     'unpause': [
         OPTION_CONTAINER_RUNNING,
@@ -608,10 +799,13 @@ COMMAND_OPTIONS = {
                       action='store_true',
                       dest='quiet',
                       help='Only display volume names.'),
-        OPTION_FILTERS
+        OPTION_FILTERS,
+        OPTION_FORMAT,
     ],
     'volume rm': [
-        OPTION_VOLUME_NAME_POS
+        OPTION_VOLUME_NAME_POS,
+        OPTION_PARALLEL,
+        OPTION_ORDERED,
     ],
 }
 
@@ -659,14 +853,7 @@ def find_option(command, name):
     :param name: string
     :return: CommandOption
     """
-    # TODO: use all_options
-    if command in COMMAND_OPTIONS:
-        if name == 'help':
-            return OPTION_HELP
-        for opt in COMMAND_OPTIONS[command]:
-            if name in [opt.short_name, opt.long_name]:
-                return opt
-    return None
+    return compiled_command(command).by_name.get(name)
 
 
 def allowed_args(command_name, **kwargs):
@@ -677,7 +864,7 @@ def allowed_args(command_name, **kwargs):
     :return: dict
     """
     matches = {}
-    available = all_supported(command_name)
+    available = compiled_command(command_name).supported
     if available:
         for k in kwargs:
             if k in available:
@@ -725,23 +912,7 @@ def parse_command_options(cmd, params):
     :param params: list: all tokens after command name
     :return: parser, args, opts
     """
-    parser = OptParser(
-        prog=cmd, add_help_option=False, conflict_handler='resolve')
-    parser.disable_interspersed_args()
-    for opt in all_options(cmd, include_hidden=True):
-        if opt.name.startswith('-'):
-            parser.add_option(*opt.args, **opt.kwargs)
-    popts, pargs = parser.parse_args(params)
-    parser.assert_option_format()
-    popts = vars(popts)
-
-    # Add hidden defaults
-    if cmd in HIDDEN_OPTIONS:
-        for opt in HIDDEN_OPTIONS[cmd]:
-            if opt.default is not None:
-                popts[opt.dest] = opt.default
-
-    return parser, popts, pargs
+    return compiled_command(cmd).parse(params)
 
 
 def format_command_line(cmd, is_long, args, kwargs):
@@ -797,13 +968,9 @@ def split_command_and_args(tokens):
     """
     command, args = None, None
     if tokens:
-        length = 1
-        for cmd_name in COMMAND_LENGTH:
-            if ' '.join(tokens).startswith(cmd_name):
-                length = COMMAND_LENGTH[cmd_name]
-                break
+        length = COMMAND_TRIE.match_length(tokens) or 1
         command = ' '.join(tokens[:length])
-        args = tokens[length:] if len(tokens) >= length else None
+        args = tokens[length:]
     return command, args
 
 
@@ -813,6 +980,15 @@ def format_command_help(cmd):
     :param cmd: string: command name
     :return: string
     """
+    return compiled_command(cmd).help
+
+
+def build_command_help(cmd):
+    """
+    Render help string for the command.
+    :param cmd: string: command name
+    :return: string
+    """
     usage = [cmd, '[options]']
     alls = all_options(cmd)
 
@@ -842,6 +1018,118 @@ def format_command_help(cmd):
     return parser.format_help()
 
 
+class CompiledCommand(object):
+    """
+    Options of one command, prepared once: the parser, options by name,
+    option suggestions in the order they are shown, and the help text.
+    """
+
+    def __init__(self, cmd):
+        """
+        :param cmd: string: command name
+        """
+        self.cmd = cmd
+        self.options = all_options(cmd)
+
+        # First option with the name wins, same as looking through the list.
+        self.by_name = {}
+        if cmd in COMMAND_OPTIONS:
+            self.by_name['help'] = OPTION_HELP
+            for opt in COMMAND_OPTIONS[cmd]:
+                for name in opt.names:
+                    self.by_name.setdefault(name, opt)
+
+        named = [x for x in self.options if x.name.startswith('-')]
+        self.named_long = sorted(named, key=lambda x: x.get_name(True))
+        self.named_short = sorted(named, key=lambda x: x.get_name(False))
+        self.positional = [x for x in self.options
+                           if not x.name.startswith('-')]
+
+        self.supported = all_supported(cmd)
+        self.hidden_defaults = [(x.dest, x.default)
+                                for x in HIDDEN_OPTIONS.get(cmd, [])
+                                if x.default is not None]
+
+        self.parser = OptParser(
+            prog=cmd, add_help_option=False, conflict_handler='resolve')
+        self.parser.disable_interspersed_args()
+        for opt in all_options(cmd, include_hidden=True):
+            if opt.name.startswith('-'):
+                self.parser.add_option(*opt.args, **opt.kwargs)
+        # Parser keeps state while parsing, commands can run concurrently.
+        self.lock = threading.Lock()
+
+        self._help = None
+
+    def named_options(self, is_long):
+        """
+        Named options, sorted by the name that is suggested.
+        :param is_long: boolean
+        :return: list of CommandOption
+        """
+        return self.named_long if is_long else self.named_short
+
+    def parse(self, params):
+        """
+        Parse command parameters.
+        :param params: list: all tokens after command name
+        :return: parser, args, opts
+        """
+        with self.lock:
+            popts, pargs = self.parser.parse_args(params)
+            self.parser.assert_option_format()
+        popts = vars(popts)
+        popts.update(self.hidden_defaults)
+        return self.parser, popts, pargs
+
+    @property
+    def help(self):
+        """
+        Help text, rendered on first use.
+        :return: string
+        """
+        if self._help is None:
+            self._help = build_command_help(self.cmd)
+        return self._help
+
+
+COMPILED_COMMANDS = {}
+
+# Anything can be typed as a command, so other names are only remembered
+# while they are recent.
+UNKNOWN_CACHE_SIZE = 64
+UNKNOWN_COMMANDS = OrderedDict()
+UNKNOWN_LOCK = threading.Lock()
+
+
+def compiled_command(cmd):
+    """
+    Compiled options of the command. Known commands are compiled once,
+    other names (partly typed commands, commands without options) when
+    they weren't used recently.
+    :param cmd: string: command name
+    :return: CompiledCommand
+    """
+    compiled = COMPILED_COMMANDS.get(cmd)
+    if compiled is not None:
+        return compiled
+    if cmd in COMMAND_OPTIONS:
+        compiled = COMPILED_COMMANDS[cmd] = CompiledCommand(cmd)
+        return compiled
+
+    with UNKNOWN_LOCK:
+        compiled = UNKNOWN_COMMANDS.get(cmd)
+        if compiled is not None:
+            UNKNOWN_COMMANDS.move_to_end(cmd)
+            return compiled
+    compiled = CompiledCommand(cmd)
+    with UNKNOWN_LOCK:
+        UNKNOWN_COMMANDS[cmd] = compiled
+        while len(UNKNOWN_COMMANDS) > UNKNOWN_CACHE_SIZE:
+            UNKNOWN_COMMANDS.popitem(last=False)
+    return compiled
+
+
 class OptParser(OptionParser):
 
     # TODO: Bad bad bad. There should be a better way to do this.
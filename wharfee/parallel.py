@@ -0,0 +1,64 @@
+# -*- coding: utf-8
+"""
+Run blocking Docker API calls for many targets at once.
+"""
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+
+def execute_parallel(func, targets, workers=1, ordered=False, timeout=None):
+    """
+    Call func(target) for every target on a pool of worker threads and
+    yield the outcomes as they become available.
+    :param func: callable taking a single target
+    :param targets: list
+    :param workers: int: maximum number of concurrent calls
+    :param ordered: boolean: yield in the order of targets, rather than
+    in the order of completion
+    :param timeout: seconds to wait for all the calls, targets that did not
+    finish in time come with concurrent.futures.TimeoutError (not the
+    builtin one before Python 3.11). Calls are made on the pool for this,
+    even if there's only one.
+    :return: iterable of (target, result, exception) tuples
+    """
+    targets = list(targets)
+    workers = min(workers or 1, len(targets))
+
+    if workers <= 1 and not timeout:
+        for target in targets:
+            try:
+                yield target, func(target), None
+            except Exception as ex:
+                yield target, None, ex
+        return
+
+    deadline = time.monotonic() + timeout if timeout else None
+
+    def remaining():
+        if deadline is None:
+            return None
+        return max(0, deadline - time.monotonic())
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = dict((pool.submit(func, t), t) for t in targets)
+        pending = set(futures)
+        try:
+            done = list(futures) if ordered else as_completed(
+                futures, timeout=remaining())
+            for future in done:
+                pending.discard(future)
+                try:
+                    yield futures[future], \
+                        future.result(timeout=remaining()), None
+                except Exception as ex:
+                    yield futures[future], None, ex
+        except TimeoutError as ex:
+            for future in futures:
+                if future in pending:
+                    yield futures[future], None, ex
+    finally:
+        # If the consumer stopped early (Ctrl+C), or some calls are taking
+        # too long, don't wait for them.
+        pool.shutdown(wait=False, cancel_futures=True)
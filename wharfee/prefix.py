@@ -0,0 +1,75 @@
+# -*- coding: utf-8
+"""
+Sorted set of names for fast prefix lookups in completion.
+"""
+from bisect import bisect_left
+from heapq import merge
+
+
+class PrefixIndex(frozenset):
+    """
+    Immutable set of names that also keeps them sorted, so that names
+    starting with a prefix are found with a binary search instead of
+    sorting and scanning all of them on every keystroke.
+    """
+
+    def __new__(cls, names=(), ordered=None):
+        """
+        :param names: iterable of strings
+        :param ordered: sorted list of the same names, if already known
+        """
+        index = frozenset.__new__(cls, names)
+        index.ordered = ordered if ordered is not None else sorted(index)
+        return index
+
+    def added(self, names):
+        """
+        Index with names added, merged in linear time.
+        :param names: iterable of strings
+        :return: PrefixIndex
+        """
+        new = set(names) - self
+        if not new:
+            return self
+        return PrefixIndex(self | new, list(merge(self.ordered, sorted(new))))
+
+    def removed(self, names):
+        """
+        Index with names removed.
+        :param names: iterable of strings
+        :return: PrefixIndex
+        """
+        gone = self & set(names)
+        if not gone:
+            return self
+        return PrefixIndex(self - gone,
+                           [n for n in self.ordered if n not in gone])
+
+    def starting_with(self, prefix):
+        """
+        Yield names that start with prefix, in sorted order.
+        :param prefix: string
+        :return: iterable
+        """
+        ordered = self.ordered
+        i = bisect_left(ordered, prefix)
+        while i < len(ordered) and ordered[i].startswith(prefix):
+            yield ordered[i]
+            i += 1
+
+
+def merge_prefix_matches(prefix, collections):
+    """
+    Yield names from all collections that start with prefix, in sorted
+    order and without duplicates.
+    :param prefix: string
+    :param collections: list of PrefixIndex or other iterables of strings
+    :return: iterable
+    """
+    indexes = [c if isinstance(c, PrefixIndex) else PrefixIndex(c)
+               for c in collections if c]
+    previous = None
+    for name in merge(*(index.starting_with(prefix) for index in indexes)):
+        if name != previous:
+            yield name
+        previous = name
@@ -0,0 +1,88 @@
+# -*- coding: utf-8
+"""
+Measure how long it takes to import wharfee and its dependencies.
+"""
+import sys
+import subprocess
+
+
+def parse_importtime(lines):
+    """
+    Parse output of "python -X importtime".
+
+    Lines look like this:
+        import time: self [us] | cumulative | imported package
+        import time:       892 |       1534 |   wharfee.options
+
+    :param lines: iterable of strings
+    :return: list of (module, self_us, cumulative_us, depth) tuples
+    """
+    result = []
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        try:
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            # This is the header.
+            continue
+        # One space after the bar, then two per nesting level.
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        result.append((name.strip(), self_us, cumulative_us, depth))
+    return result
+
+
+def profile_imports(module='wharfee.main'):
+    """
+    Import the module in a fresh interpreter and collect import times.
+    :param module: string
+    :return: list of (module, self_us, cumulative_us, depth) tuples
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+    return parse_importtime(process.stderr.splitlines())
+
+
+def format_import_profile(timings, module='wharfee.main', limit=25):
+    """
+    Format the most expensive imports as table rows.
+    :param timings: list of (module, self_us, cumulative_us, depth) tuples
+    :param module: string: module that was profiled
+    :param limit: int: number of modules to show
+    :return: list of strings
+    """
+    from tabulate import tabulate
+
+    # Children are reported before their parent: the module's subtree is
+    # everything above its line, up to the previous top-level import.
+    end = next((i for i, t in enumerate(timings)
+                if t[0] == module and t[3] == 0), None)
+    if end is None:
+        return ['Could not import {0}.'.format(module)]
+    start = end
+    while start > 0 and timings[start - 1][3] > 0:
+        start -= 1
+    total = timings[end][2]
+
+    # Direct dependencies (and wharfee modules) are what we can act upon,
+    # their cumulative time includes everything they pulled in.
+    rows = [t for t in timings[start:end + 1]
+            if t[3] <= 1 or t[0].startswith('wharfee')]
+    rows = sorted(rows, key=lambda t: t[2], reverse=True)[:limit]
+    rows = [(name, '{0:.1f}'.format(own / 1000.0),
+             '{0:.1f}'.format(cumulative / 1000.0))
+            for name, own, cumulative, _ in rows]
+
+    lines = tabulate(rows, headers=['Module', 'Self, ms', 'Cumulative, ms'])
+    lines = lines.split('\n')
+    lines.append('')
+    lines.append('Total import time of {0}: {1:.1f} ms.'.format(
+        module, total / 1000.0))
+    return lines
@@ -0,0 +1,273 @@
+# -*- coding: utf-8
+"""
+Progress of image layers for pull and build: one line per layer and a
+total, redrawn in place a limited number of times per second.
+"""
+import sys
+import time
+import shutil
+
+from collections import OrderedDict, deque
+
+from .helpers import filesize
+
+# Cursor movement and erasing, see "ANSI escape codes".
+CURSOR_UP = '\x1b[{0}A'
+ERASE_LINE = '\x1b[K'
+ERASE_DOWN = '\x1b[J'
+
+# Layer is done downloading in any of these.
+DOWNLOADED = ('Verifying Checksum', 'Download complete', 'Extracting',
+              'Pull complete', 'Already exists')
+
+# Order of layer statuses. When several images share a layer, each of them
+# reports it; a message from behind ("Waiting" while another image is
+# already downloading it) doesn't set the status back.
+STAGES = {
+    'Pulling fs layer': 0,
+    'Waiting': 0,
+    'Downloading': 1,
+    'Verifying Checksum': 2,
+    'Download complete': 2,
+    'Extracting': 3,
+    'Pull complete': 4,
+    'Already exists': 4,
+}
+
+# How far back to look when calculating download rate, in seconds.
+RATE_WINDOW = 3.0
+
+
+class Layer(object):
+    """
+    Latest status of one layer.
+    """
+
+    __slots__ = ('id', 'status', 'progress', 'current', 'total', 'stage')
+
+    def __init__(self, id):
+        self.id = id
+        self.status = ''
+        self.progress = ''
+        self.current = 0
+        self.total = 0
+        self.stage = 0
+
+    def update(self, data):
+        """
+        Take the status from a progress message.
+        :param data: dict
+        """
+        stage = STAGES.get(data.get('status'), self.stage)
+        if stage < self.stage:
+            return
+        self.stage = stage
+        self.status = data.get('status', self.status)
+        self.progress = data.get('progress') or ''
+        detail = data.get('progressDetail') or {}
+        if self.status == 'Downloading':
+            self.current = detail.get('current', self.current)
+            self.total = detail.get('total', self.total)
+        elif self.status in DOWNLOADED and self.total:
+            self.current = self.total
+
+    def line(self):
+        """
+        :return: string
+        """
+        return '{0}: {1} {2}'.format(self.id, self.status,
+                                     self.progress).rstrip()
+
+
+def redraw(lines, previous):
+    """
+    Text that writes lines over the ones drawn before: the cursor goes
+    back up, only lines that changed are written again and lines left
+    over are erased.
+    :param lines: list of strings
+    :param previous: list of strings: lines drawn before, as returned
+    :return: tuple of (string, list of strings): text to write and the
+    lines as drawn
+    """
+    # Lines that wrap would throw off the count of lines to go back.
+    width = max(shutil.get_terminal_size().columns - 1, 10)
+    lines = [line[:width] for line in lines]
+
+    text = CURSOR_UP.format(len(previous)) if previous else ''
+    for i, line in enumerate(lines):
+        if i < len(previous) and previous[i] == line:
+            text += '\n'
+        else:
+            text += line + ERASE_LINE + '\n'
+    if len(lines) < len(previous):
+        text += ERASE_DOWN
+    return text, lines
+
+
+def format_eta(seconds):
+    """
+    Time left, such as "42s" or "3m05s".
+    :param seconds: float
+    :return: string
+    """
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return '{0}s'.format(seconds)
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return '{0}m{1:02}s'.format(minutes, seconds)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}h{1:02}m'.format(hours, minutes)
+
+
+class LayerProgress(object):
+    """
+    Keeps status of all layers and shows it. On a terminal, layers and
+    the total are redrawn in place, at most fps times a second, and other
+    messages are written above them. Otherwise layers are not shown, only
+    the other messages and a summary at the end.
+    """
+
+    def __init__(self, out=None, tty=None, fps=10, clock=time.monotonic):
+        """
+        :param out: file to write to, stdout by default
+        :param tty: boolean: redraw in place. By default, if out is a
+                    terminal.
+        :param fps: int: most redraws per second
+        :param clock: function that returns current time in seconds
+        """
+        self.out = out or sys.stdout
+        self.tty = self.out.isatty() if tty is None else tty
+        self.interval = 1.0 / fps
+        self.clock = clock
+        self.layers = OrderedDict()
+        self.started = clock()
+        self.last_draw = None
+        self.lines = []
+        self.samples = deque()
+
+    def update(self, data):
+        """
+        Take a message from the stream.
+        :param data: dict: parsed JSON message
+        :return: boolean: if it was about a layer
+        """
+        layer_id = data.get('id')
+        if not layer_id or 'progressDetail' not in data:
+            return False
+        layer = self.layers.get(layer_id)
+        if layer is None:
+            layer = self.layers[layer_id] = Layer(layer_id)
+        layer.update(data)
+        if self.tty:
+            self.draw()
+        return True
+
+    def write(self, line):
+        """
+        Write a message that's not about a layer, above the layers.
+        :param line: string
+        """
+        if self.tty and self.lines:
+            self.out.write(CURSOR_UP.format(len(self.lines)) + ERASE_DOWN)
+            self.lines = []
+            self.last_draw = None
+        self.out.write(line + '\n')
+        if self.tty and self.layers:
+            self.draw(force=True)
+
+    def totals(self):
+        """
+        Bytes downloaded, bytes to download (known so far), bytes per
+        second lately and seconds left, if it can be estimated.
+        :return: tuple of (int, int, float, float or None)
+        """
+        now = self.clock()
+        current = sum(x.current for x in self.layers.values())
+        total = sum(x.total for x in self.layers.values())
+
+        samples = self.samples
+        samples.append((now, current))
+        while len(samples) > 2 and now - samples[1][0] > RATE_WINDOW:
+            samples.popleft()
+        then, before = samples[0]
+        rate = (current - before) / (now - then) if now > then else 0.0
+
+        eta = (total - current) / rate if rate > 0 else None
+        return current, total, rate, eta
+
+    def summary(self):
+        """
+        Total line: layers done, bytes, rate and time left.
+        :return: string
+        """
+        current, total, rate, eta = self.totals()
+        done = sum(1 for x in self.layers.values() if x.status in DOWNLOADED)
+        parts = ['{0}/{1} layers'.format(done, len(self.layers))]
+        if total:
+            parts.append('{0}/{1}'.format(filesize(current), filesize(total)))
+        if done == len(self.layers):
+            parts.append('in {0:.1f} s'.format(self.clock() - self.started))
+        else:
+            if rate:
+                parts.append('{0}/s'.format(filesize(rate)))
+            if eta is not None and current < total:
+                parts.append('ETA {0}'.format(format_eta(eta)))
+        return '  '.join(parts)
+
+    def layer_lines(self, rows):
+        """
+        A line per layer, if they fit with the total in this many rows.
+        Otherwise, the cursor can't go back up to the first of them, so
+        only layers that are still in progress are shown, as many as fit,
+        and a line for the rest.
+        :param rows: int
+        :return: list of strings
+        """
+        layers = list(self.layers.values())
+        if len(layers) + 1 <= rows:
+            return [x.line() for x in layers]
+
+        room = max(rows - 2, 1)
+        shown = set(x.id for x in sorted(
+            layers, key=lambda x: x.stage == STAGES['Pull complete'])[:room])
+        lines = [x.line() for x in layers if x.id in shown]
+        lines.append('... {0} more layers'.format(len(layers) - len(shown)))
+        return lines
+
+    def draw(self, force=False):
+        """
+        Redraw layers and the total, unless it was done very recently.
+        :param force: boolean: redraw anyway
+        """
+        now = self.clock()
+        if not force and self.last_draw is not None \
+                and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+
+        lines = self.layer_lines(shutil.get_terminal_size().lines - 1)
+        lines.append(self.summary())
+
+        text, self.lines = redraw(lines, self.lines)
+        self.out.write(text)
+        self.out.flush()
+
+    def finish(self):
+        """
+        Show the final state: redraw on a terminal, otherwise write the
+        summary.
+        """
+        if not self.layers:
+            return
+        if self.tty:
+            self.draw(force=True)
+            return
+        current, total, _, _ = self.totals()
+        elapsed = self.clock() - self.started
+        line = '{0} layers, {1} in {2:.1f} s'.format(
+            len(self.layers), filesize(current), elapsed)
+        if elapsed > 0 and current:
+            line += ' ({0}/s)'.format(filesize(current / elapsed))
+        self.out.write(line + '\n')
+        self.out.flush()
@@ -0,0 +1,369 @@
+# -*- coding: utf-8
+"""
+Records for container, image and volume listings, container stats and
+processes. They are created once, from what the Docker API returns, and
+read as they are by the formatter, the completer and the resolver.
+"""
+import pretty
+
+from .helpers import filesize
+
+
+class Record(object):
+    """
+    Base class for listing records.
+
+    HEADERS are table columns, in order, and values() of every record type
+    returns the matching cells. KEYS map Docker API keys to attributes, for
+    as_dict() and for code that still treats records as dicts. When working
+    with several Docker hosts, host is the name of the one the record came
+    from.
+    """
+
+    __slots__ = ('host',)
+
+    HEADERS = ()
+    KEYS = {}
+
+    def headers(self):
+        """
+        Table columns, with the host if there is one.
+        :return: tuple
+        """
+        return ('Host',) + self.HEADERS if self.host else self.HEADERS
+
+    def row(self):
+        """
+        Table cells, matching headers().
+        :return: tuple
+        """
+        return (self.host,) + self.values() if self.host else self.values()
+
+    def as_dict(self):
+        """
+        Record as a dict with Docker API keys and raw values.
+        :return: dict
+        """
+        result = {k: getattr(self, a) for k, a in self.KEYS.items()}
+        if self.host:
+            result['Host'] = self.host
+        return result
+
+    def __getitem__(self, key):
+        if key == 'Host':
+            return self.host
+        try:
+            return getattr(self, self.KEYS[key])
+        except KeyError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == 'Host':
+            return self.host
+        attr = self.KEYS.get(key)
+        return getattr(self, attr) if attr else default
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, self.as_dict())
+
+
+class Container(Record):
+    """
+    Container, as listed by "ps".
+    """
+
+    __slots__ = ('id', 'names', 'image', 'command', 'created_at', 'ports',
+                 'state', 'status', '_created')
+
+    HEADERS = ('Id', 'Names', 'Image', 'Command', 'Created', 'Ports',
+               'Status')
+    KEYS = {
+        'Id': 'id',
+        'Names': 'names',
+        'Image': 'image',
+        'Command': 'command',
+        'Created': 'created_at',
+        'Ports': 'ports',
+        'State': 'state',
+        'Status': 'status',
+    }
+
+    def __init__(self, id, names, image=None, command=None, created_at=None,
+                 ports=None, state=None, status=None, host=None):
+        self.host = host
+        self.id = id
+        self.names = names
+        self.image = image
+        self.command = command
+        self.created_at = created_at
+        self.ports = ports
+        self.state = state
+        self.status = status
+        self._created = None
+
+    @classmethod
+    def from_api(cls, data, host=None):
+        """
+        Create a record from API dict. Container names start with /,
+        let's strip this for readability.
+        :param data: dict
+        :param host: string: name of the Docker host
+        :return: Container
+        """
+        names = data.get('Names') or []
+        names = [n.lstrip('/') if isinstance(n, str) else n for n in names]
+        return cls(data['Id'], names, data.get('Image'), data.get('Command'),
+                   data.get('Created'), data.get('Ports'), data.get('State'),
+                   data.get('Status'), host)
+
+    @property
+    def created(self):
+        """
+        Creation date, relative to now ("2 days ago").
+        :return: string
+        """
+        if self._created is None and self.created_at:
+            self._created = pretty.date(self.created_at)
+        return self._created
+
+    def values(self):
+        return (self.id, self.names, self.image, self.command, self.created,
+                self.ports, self.status)
+
+
+class Image(Record):
+    """
+    Image, as listed by "images". Image with several tags is listed once
+    per tag.
+    """
+
+    __slots__ = ('id', 'repository', 'tag', 'created_at', 'size_bytes',
+                 '_created', '_size')
+
+    HEADERS = ('Repository', 'Tag', 'Id', 'Created', 'Size')
+    KEYS = {
+        'Repository': 'repository',
+        'Tag': 'tag',
+        'Id': 'id',
+        'Created': 'created_at',
+        'Size': 'size_bytes',
+    }
+
+    def __init__(self, id, repository='<none>', tag='<none>',
+                 created_at=None, size_bytes=None, host=None):
+        self.host = host
+        self.id = id
+        self.repository = repository
+        self.tag = tag
+        self.created_at = created_at
+        self.size_bytes = size_bytes
+        self._created = None
+        self._size = None
+
+    @classmethod
+    def from_api(cls, data, host=None):
+        """
+        Create records from API dict, one per repo tag.
+        :param data: dict
+        :param host: string: name of the Docker host
+        :return: generator of Image
+        """
+        size = data.get('Size', data.get('VirtualSize'))
+        for repo_tag in data.get('RepoTags') or ['<none>:<none>']:
+            repo, tag = repo_tag.rsplit(':', 1)
+            yield cls(data['Id'], repo, tag, data.get('Created'), size, host)
+
+    @property
+    def repo_tag(self):
+        """
+        :return: string: "repository:tag"
+        """
+        return '{0}:{1}'.format(self.repository, self.tag)
+
+    @property
+    def short_id(self):
+        """
+        :return: string: image ID without the "sha256:" prefix
+        """
+        return self.id[7:] if self.id.startswith('sha256:') else self.id
+
+    @property
+    def created(self):
+        """
+        Creation date, relative to now ("2 days ago").
+        :return: string
+        """
+        if self._created is None and self.created_at:
+            self._created = pretty.date(self.created_at)
+        return self._created
+
+    @property
+    def size(self):
+        """
+        Human-readable size ("1.2 MB").
+        :return: string
+        """
+        if self._size is None and self.size_bytes is not None:
+            self._size = filesize(self.size_bytes)
+        return self._size
+
+    def values(self):
+        return (self.repository, self.tag, self.short_id, self.created,
+                self.size)
+
+
+class Volume(Record):
+    """
+    Volume, as listed by "volume ls".
+    """
+
+    __slots__ = ('name', 'driver', 'mountpoint')
+
+    HEADERS = ('Driver', 'Name')
+    KEYS = {
+        'Driver': 'driver',
+        'Name': 'name',
+        'Mountpoint': 'mountpoint',
+    }
+
+    def __init__(self, name, driver=None, mountpoint=None, host=None):
+        self.host = host
+        self.name = name
+        self.driver = driver
+        self.mountpoint = mountpoint
+
+    @classmethod
+    def from_api(cls, data, host=None):
+        """
+        Create a record from API dict.
+        :param data: dict
+        :param host: string: name of the Docker host
+        :return: Volume
+        """
+        return cls(data['Name'], data.get('Driver'), data.get('Mountpoint'),
+                   host)
+
+    def values(self):
+        return (self.driver, self.name)
+
+
+class Stats(Record):
+    """
+    Resource usage of a container, as listed by "stats". Sizes are in
+    bytes, CPU in percent of one CPU. Average CPU is over the samples that
+    are kept.
+    """
+
+    __slots__ = ('id', 'name', 'cpu', 'mem', 'mem_limit', 'net_rx',
+                 'net_tx', 'blk_read', 'blk_write', 'pids', 'cpu_avg')
+
+    HEADERS = ('Container', 'Name', 'CPU %', 'Avg CPU %', 'Mem Usage / Limit',
+               'Mem %', 'Net I/O', 'Block I/O', 'PIDs')
+    KEYS = {
+        'Id': 'id',
+        'Name': 'name',
+        'CPUPerc': 'cpu',
+        'CPUAvgPerc': 'cpu_avg',
+        'MemUsage': 'mem',
+        'MemLimit': 'mem_limit',
+        'MemPerc': 'mem_percent',
+        'NetInput': 'net_rx',
+        'NetOutput': 'net_tx',
+        'BlockInput': 'blk_read',
+        'BlockOutput': 'blk_write',
+        'PIDs': 'pids',
+    }
+
+    def __init__(self, id, name, cpu=0.0, mem=0.0, mem_limit=0.0,
+                 net_rx=0.0, net_tx=0.0, blk_read=0.0, blk_write=0.0,
+                 pids=0.0, host=None, cpu_avg=None):
+        self.host = host
+        self.id = id
+        self.name = name
+        self.cpu = cpu
+        self.mem = mem
+        self.mem_limit = mem_limit
+        self.net_rx = net_rx
+        self.net_tx = net_tx
+        self.blk_read = blk_read
+        self.blk_write = blk_write
+        self.pids = int(pids)
+        self.cpu_avg = cpu if cpu_avg is None else cpu_avg
+
+    @property
+    def mem_percent(self):
+        """
+        :return: float
+        """
+        return self.mem / self.mem_limit * 100.0 if self.mem_limit else 0.0
+
+    def values(self):
+        return (self.id[:12], self.name, '{0:.2f}%'.format(self.cpu),
+                '{0:.2f}%'.format(self.cpu_avg),
+                '{0} / {1}'.format(filesize(self.mem),
+                                   filesize(self.mem_limit)),
+                '{0:.2f}%'.format(self.mem_percent),
+                '{0} / {1}'.format(filesize(self.net_rx),
+                                   filesize(self.net_tx)),
+                '{0} / {1}'.format(filesize(self.blk_read),
+                                   filesize(self.blk_write)),
+                self.pids)
+
+
+class Process(Record):
+    """
+    Process in a container, as listed by "top". Columns are the ones ps
+    gives in the container, so they are kept with every process.
+    """
+
+    __slots__ = ('container', 'titles', 'fields')
+
+    def __init__(self, container, titles, fields, host=None):
+        """
+        :param container: string: name or ID it was asked for by
+        :param titles: tuple of strings: ps columns
+        :param fields: tuple of strings: matching titles
+        :param host: string: name of the Docker host
+        """
+        self.host = host
+        self.container = container
+        self.titles = titles
+        self.fields = fields
+
+    @property
+    def pid(self):
+        """
+        :return: string, or None if ps wasn't asked for it
+        """
+        try:
+            return self.fields[self.titles.index('PID')]
+        except ValueError:
+            return None
+
+    @property
+    def key(self):
+        """
+        What identifies the process from one "top" to the next.
+        :return: tuple
+        """
+        return (self.host, self.container, self.pid or self.fields)
+
+    def values(self):
+        return (self.container,) + self.fields
+
+    def headers(self):
+        headers = ('Container',) + self.titles
+        return ('Host',) + headers if self.host else headers
+
+    def as_dict(self):
+        result = dict(zip(self.titles, self.fields))
+        result['Container'] = self.container
+        if self.host:
+            result['Host'] = self.host
+        return result
+
+    def __getitem__(self, key):
+        return self.as_dict()[key]
+
+    def get(self, key, default=None):
+        return self.as_dict().get(key, default)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8
+"""
+Figure out if a name or ID refers to a container or an image.
+"""
+import time
+import threading
+
+from bisect import bisect_left
+from docker.errors import NotFound
+
+
+CONTAINER = 'container'
+IMAGE = 'image'
+
+
+def strip_id(name):
+    """
+    Image IDs come as "sha256:<hex>", container IDs as "<hex>".
+    :param name: string
+    :return: string
+    """
+    return name[7:] if name.startswith('sha256:') else name
+
+
+class ObjectResolver(object):
+    """
+    Index of container and image names and IDs, used to send "inspect"
+    straight to the right endpoint. Names that turned out to be neither
+    a container nor an image are remembered for a short while.
+    """
+
+    def __init__(self, negative_ttl=10):
+        """
+        Initialize the index.
+        :param negative_ttl: seconds to remember unknown names for
+        """
+        self.negative_ttl = negative_ttl
+        self.names = {}
+        self.ids = []
+        self.id_kinds = {}
+        self.missing = {}
+        self.lock = threading.Lock()
+
+    def remember(self, kind, names=None, ids=None):
+        """
+        Add names and IDs of the given kind to the index.
+        :param kind: CONTAINER or IMAGE
+        :param names: iterable
+        :param ids: iterable
+        """
+        with self.lock:
+            for name in names or []:
+                self.names[name] = kind
+                self.missing.pop(name, None)
+            added = False
+            for oid in ids or []:
+                oid = strip_id(oid)
+                if oid not in self.id_kinds:
+                    added = True
+                self.id_kinds[oid] = kind
+            if added:
+                self.ids = sorted(self.id_kinds)
+
+    def forget_missing(self):
+        """
+        Something was created, names we could not find may exist now.
+        """
+        with self.lock:
+            self.missing = {}
+
+    def is_missing(self, name):
+        """
+        If we recently failed to find this name.
+        :param name: string
+        :return: boolean
+        """
+        expires = self.missing.get(name)
+        return expires is not None and expires > time.time()
+
+    def kind_of(self, name):
+        """
+        Look up name, full ID or unique ID prefix in the index.
+        :param name: string
+        :return: CONTAINER, IMAGE or None
+        """
+        kind = self.names.get(name)
+        if kind:
+            return kind
+
+        prefix = strip_id(name)
+        ids = self.ids
+        i = bisect_left(ids, prefix)
+        kinds = set()
+        while i < len(ids) and ids[i].startswith(prefix):
+            kinds.add(self.id_kinds[ids[i]])
+            i += 1
+        if len(kinds) == 1:
+            return kinds.pop()
+        return None
+
+    def inspect(self, name, api):
+        """
+        Inspect a container or an image, trying the most likely endpoint
+        first.
+        :param name: string
+        :param api: docker-py API client
+        :return: dict or None if not found
+        """
+        kind = self.kind_of(name)
+        if kind is None and self.is_missing(name):
+            return None
+
+        order = (IMAGE, CONTAINER) if kind == IMAGE else (CONTAINER, IMAGE)
+        for k in order:
+            try:
+                if k == CONTAINER:
+                    info = api.inspect_container(name)
+                else:
+                    info = api.inspect_image(name)
+            except NotFound:
+                continue
+            self.remember(k, [name], [info['Id']] if 'Id' in info else [])
+            return info
+
+        with self.lock:
+            self.names.pop(name, None)
+            self.missing[name] = time.time() + self.negative_ttl
+        return None
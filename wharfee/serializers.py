@@ -0,0 +1,173 @@
+# -*- coding: utf-8
+"""
+Machine-readable output: JSON, newline-delimited JSON, CSV and TSV. Rows
+are written as they come from the API, with values in full, without going
+through the table formatter or the pager.
+"""
+import sys
+import csv
+import json
+
+from .records import Record
+
+# Commands whose output can be written in these formats.
+SERIALIZED_COMMANDS = ('ps', 'images', 'volume ls', 'inspect', 'top',
+                       'stats')
+
+
+def iter_rows(output):
+    """
+    Rows of the command output, as dicts. Records become dicts with Docker
+    API keys, "top" output becomes a dict per process, and lists in a
+    stream ("ps --watch", "stats") are taken apart. Strings are messages
+    and are passed on as they are.
+    :param output: list, dict or generator
+    :return: generator of dicts and strings
+    """
+    if isinstance(output, dict):
+        output = [output]
+    for item in output:
+        if isinstance(item, list):
+            for row in iter_rows(item):
+                yield row
+        elif isinstance(item, Record):
+            yield item.as_dict()
+        elif isinstance(item, dict) and 'Titles' in item \
+                and 'Processes' in item:
+            titles = item['Titles'] or []
+            for fields in item['Processes'] or []:
+                yield dict(zip(titles, fields))
+        else:
+            yield item
+
+
+def json_default(value):
+    """
+    Values json doesn't know about are written as strings.
+    """
+    return str(value)
+
+
+class RowWriter(object):
+    """
+    Writes rows one at a time.
+    """
+
+    def __init__(self, out):
+        """
+        :param out: file to write to
+        """
+        self.out = out
+        self.count = 0
+
+    def write(self, row):
+        """
+        :param row: dict
+        """
+        self.count += 1
+
+    def close(self):
+        """
+        Finish the output after the last row.
+        """
+        pass
+
+
+class JsonRowWriter(RowWriter):
+    """
+    A JSON array, one row per line, written as rows come.
+    """
+
+    def write(self, row):
+        self.out.write('[\n' if not self.count else ',\n')
+        self.out.write(json.dumps(row, default=json_default))
+        RowWriter.write(self, row)
+
+    def close(self):
+        self.out.write('\n]\n' if self.count else '[]\n')
+
+
+class NdjsonRowWriter(RowWriter):
+    """
+    A JSON object per line.
+    """
+
+    def write(self, row):
+        self.out.write(json.dumps(row, default=json_default) + '\n')
+        RowWriter.write(self, row)
+
+
+class CsvRowWriter(RowWriter):
+    """
+    Header line with the keys of the first row, then a line per row.
+    Lists and dicts are written as JSON.
+    """
+
+    delimiter = ','
+
+    def __init__(self, out):
+        RowWriter.__init__(self, out)
+        self.writer = csv.writer(out, delimiter=self.delimiter,
+                                 lineterminator='\n')
+        self.columns = None
+
+    def write(self, row):
+        if self.columns is None:
+            self.columns = list(row)
+            self.writer.writerow(self.columns)
+        self.writer.writerow([self.format_value(row.get(c))
+                              for c in self.columns])
+        RowWriter.write(self, row)
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, default=json_default)
+        return value
+
+
+class TsvRowWriter(CsvRowWriter):
+
+    delimiter = '\t'
+
+
+ROW_WRITERS = {
+    'json': JsonRowWriter,
+    'ndjson': NdjsonRowWriter,
+    'csv': CsvRowWriter,
+    'tsv': TsvRowWriter,
+}
+
+
+def write_serialized(output, output_format, out=None, err=None):
+    """
+    Write command output in a machine-readable format. Rows go to out,
+    messages (such as "There are no containers to list.") go to err.
+    Streamed output is flushed after every item, so that whatever reads
+    it gets the rows as they come. The output is finished even if the
+    stream is stopped (Ctrl+C), so a JSON array is still valid.
+    :param output: list, dict or generator
+    :param output_format: string: one of ROW_WRITERS
+    :param out: file, stdout by default
+    :param err: file, stderr by default
+    :return: int: number of rows
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    flush = not isinstance(output, (list, dict))
+
+    writer = ROW_WRITERS[output_format](out)
+    try:
+        for row in iter_rows(output):
+            if isinstance(row, dict):
+                writer.write(row)
+            else:
+                err.write('{0}\n'.format(row))
+            if flush:
+                out.flush()
+    finally:
+        writer.close()
+        out.flush()
+    return writer.count
@@ -0,0 +1,178 @@
+# -*- coding: utf-8
+"""
+Samples from container stats streams, for "stats". Only the numbers that
+are shown are kept, in a fixed-size array per container, instead of the
+JSON document every sample comes in.
+"""
+from array import array
+
+from .records import Stats
+
+# Numbers taken from every sample, in this order.
+FIELDS = ('cpu', 'mem', 'mem_limit', 'net_rx', 'net_tx', 'blk_read',
+          'blk_write', 'pids')
+
+# Samples to keep per container, for the average CPU. The daemon sends
+# one a second.
+HISTORY_SIZE = 60
+
+
+def cpu_percent(data):
+    """
+    CPU use since the previous sample, in percent of one CPU, the way
+    docker stats calculates it.
+    :param data: dict: stats sample
+    :return: float
+    """
+    cpu = data.get('cpu_stats') or {}
+    precpu = data.get('precpu_stats') or {}
+    usage = cpu.get('cpu_usage') or {}
+    cpu_delta = usage.get('total_usage', 0) - \
+        (precpu.get('cpu_usage') or {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - \
+        precpu.get('system_cpu_usage', 0)
+    online = cpu.get('online_cpus') or len(usage.get('percpu_usage') or ())
+    if cpu_delta > 0 and system_delta > 0:
+        return cpu_delta / system_delta * (online or 1) * 100.0
+    return 0.0
+
+
+def memory_usage(data):
+    """
+    Memory in use, without the page cache that can be reclaimed, and the
+    limit.
+    :param data: dict: stats sample
+    :return: tuple of (float, float)
+    """
+    memory = data.get('memory_stats') or {}
+    usage = memory.get('usage', 0)
+    detail = memory.get('stats') or {}
+    # cgroup v1 and v2 call it differently.
+    for key in ('total_inactive_file', 'inactive_file'):
+        if key in detail and detail[key] < usage:
+            usage -= detail[key]
+            break
+    return float(usage), float(memory.get('limit', 0))
+
+
+def parse_sample(data):
+    """
+    Take the numbers out of a stats sample.
+    :param data: dict: stats sample
+    :return: tuple of floats, matching FIELDS
+    """
+    mem, mem_limit = memory_usage(data)
+
+    net_rx = net_tx = 0
+    for network in (data.get('networks') or {}).values():
+        net_rx += network.get('rx_bytes', 0)
+        net_tx += network.get('tx_bytes', 0)
+
+    blk_read = blk_write = 0
+    blkio = data.get('blkio_stats') or {}
+    for entry in blkio.get('io_service_bytes_recursive') or ():
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            blk_read += entry.get('value', 0)
+        elif op == 'write':
+            blk_write += entry.get('value', 0)
+
+    pids = (data.get('pids_stats') or {}).get('current', 0)
+
+    return (cpu_percent(data), mem, mem_limit, float(net_rx), float(net_tx),
+            float(blk_read), float(blk_write), float(pids))
+
+
+class SampleRing(object):
+    """
+    Last "size" samples of "width" numbers each, in one flat array of
+    doubles that is written over in a circle.
+    """
+
+    __slots__ = ('size', 'width', 'data', 'count', 'next')
+
+    def __init__(self, size=HISTORY_SIZE, width=len(FIELDS)):
+        self.size = size
+        self.width = width
+        self.data = array('d', bytes(8 * size * width))
+        self.count = 0
+        self.next = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values):
+        """
+        Add a sample, writing over the oldest one if full.
+        :param values: sequence of numbers, width of them
+        """
+        start = self.next * self.width
+        self.data[start:start + self.width] = array('d', values)
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def last(self):
+        """
+        :return: tuple: latest sample, or None
+        """
+        if not self.count:
+            return None
+        start = (self.next - 1) % self.size * self.width
+        return tuple(self.data[start:start + self.width])
+
+    def column(self, index):
+        """
+        One of the numbers from all samples, oldest first.
+        :param index: int: position in a sample
+        :return: list of floats
+        """
+        first = (self.next - self.count) % self.size
+        return [self.data[(first + i) % self.size * self.width + index]
+                for i in range(self.count)]
+
+
+class ContainerStats(object):
+    """
+    Samples of one container.
+    """
+
+    def __init__(self, container, size=HISTORY_SIZE, host=None):
+        """
+        :param container: string: ID or name it was asked for by
+        :param size: int: samples to keep
+        :param host: string: name of the Docker host
+        """
+        self.id = container
+        self.name = container
+        self.host = host
+        self.samples = SampleRing(size)
+
+    def add(self, data):
+        """
+        Take a sample from the stream.
+        :param data: dict
+        """
+        if 'id' in data:
+            self.id = data['id']
+        if 'name' in data:
+            self.name = data['name'].lstrip('/')
+        self.samples.append(parse_sample(data))
+
+    def history(self, field):
+        """
+        :param field: string: one of FIELDS
+        :return: list of floats, oldest first
+        """
+        return self.samples.column(FIELDS.index(field))
+
+    def record(self):
+        """
+        Latest sample, for the table.
+        :return: Stats or None
+        """
+        last = self.samples.last()
+        if last is None:
+            return None
+        cpu = self.history('cpu')
+        return Stats(self.id, self.name, *last, host=self.host,
+                     cpu_avg=sum(cpu) / len(cpu))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8
+"""
+Read and decode output streams of containers (logs, attach, exec).
+
+Unless the container has a TTY, Docker multiplexes stdout and stderr into
+one stream of frames. Every frame has an 8-byte header: stream type (1 for
+stdout, 2 for stderr), three zero bytes and payload length (big-endian).
+"""
+import codecs
+import struct
+
+
+STDOUT = 1
+STDERR = 2
+
+HEADER_SIZE = 8
+CHUNK_SIZE = 4096
+
+
+def read_frames(read, tty=False, chunk_size=CHUNK_SIZE):
+    """
+    Read (stream, data) pairs until the end of the stream.
+    :param read: callable: read(n) returns up to n bytes, b'' at the end
+    :param tty: boolean: raw stream, everything goes to stdout
+    :param chunk_size: int: how much to read at once from raw stream
+    :return: generator of (int, bytes)
+    """
+    if tty:
+        while True:
+            data = read(chunk_size)
+            if not data:
+                return
+            yield STDOUT, data
+
+    while True:
+        header = read_exactly(read, HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return
+        stream, length = struct.unpack('>BxxxL', header)
+        if not length:
+            continue
+        data = read_exactly(read, length)
+        if not data:
+            return
+        # stdin (0) is echoed when attached with a TTY, show it as stdout.
+        yield (STDERR if stream == STDERR else STDOUT), data
+
+
+def from_demux(pairs):
+    """
+    Turn (stdout, stderr) pairs, as docker-py returns them with demux=True,
+    into (stream, data) frames.
+    :param pairs: iterable of (bytes or None, bytes or None)
+    :return: generator of (int, bytes)
+    """
+    for out, err in pairs:
+        if out:
+            yield STDOUT, out
+        if err:
+            yield STDERR, err
+
+
+def from_chunks(stream):
+    """
+    Turn chunks of a stream that has no stream types into stdout frames.
+    The stream is closed when the generator is done or closed.
+    :param stream: iterable of bytes with close()
+    :return: generator of (int, bytes)
+    """
+    try:
+        for data in stream:
+            if data:
+                yield STDOUT, data
+    finally:
+        stream.close()
+
+
+def read_exactly(read, n):
+    """
+    Read n bytes, or less if the stream ends.
+    :param read: callable
+    :param n: int
+    :return: bytes
+    """
+    data = read(n)
+    if len(data) == n or not data:
+        return data
+    parts = [data]
+    n -= len(data)
+    while n > 0:
+        data = read(n)
+        if not data:
+            break
+        parts.append(data)
+        n -= len(data)
+    return b''.join(parts)
+
+
+def read_response(response, tty=False, chunk_size=CHUNK_SIZE):
+    """
+    Read (stream, data) pairs from a streamed HTTP response. The response
+    is closed when the generator is done or closed.
+    :param response: requests.Response with stream=True
+    :param tty: boolean
+    :param chunk_size: int
+    :return: generator of (int, bytes)
+    """
+    raw = response.raw
+    # read1() returns whatever has arrived, instead of waiting for the whole
+    # chunk. Matters for "logs --follow" of a TTY container.
+    read = getattr(raw, 'read1', raw.read) if tty else raw.read
+    try:
+        for frame in read_frames(read, tty, chunk_size):
+            yield frame
+    finally:
+        response.close()
+
+
+class StreamDecoder(object):
+    """
+    Decode stdout and stderr incrementally, so that multibyte characters
+    split between frames come out whole.
+    """
+
+    def __init__(self, encoding='utf-8', errors='replace'):
+        """
+        :param encoding: string
+        :param errors: string: how to handle invalid input
+        """
+        factory = codecs.getincrementaldecoder(encoding)
+        self.decoders = {
+            STDOUT: factory(errors=errors),
+            STDERR: factory(errors=errors),
+        }
+
+    def decode(self, stream, data):
+        """
+        Decode the next piece of the stream.
+        :param stream: STDOUT or STDERR
+        :param data: bytes
+        :return: string: decoded text, may be empty
+        """
+        return self.decoders[stream].decode(data)
+
+    def flush(self):
+        """
+        Decode whatever is left at the end of the streams.
+        :return: list of (stream, string) for non-empty leftovers
+        """
+        result = []
+        for stream, decoder in self.decoders.items():
+            text = decoder.decode(b'', final=True)
+            if text:
+                result.append((stream, text))
+        return result
@@ -27,6 +27,7 @@ def style_factory(name):
         'bottom-toolbar': 'bg:#222222 #cccccc',
         'bottom-toolbar.off': 'bg:#222222 #004444',
         'bottom-toolbar.on': 'bg:#222222 #ffffff',
+        'bottom-toolbar.loading': 'bg:#222222 #aaaa00',
         'search': 'noinherit bold',
         'search.text': 'nobold',
         'system': 'noinherit bold',
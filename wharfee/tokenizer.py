@@ -0,0 +1,204 @@
+# -*- coding: utf-8
+"""
+Command line tokenizer shared by the completer, the lexer and the client.
+Splits the same way as shlex.split, but in a single pass that also records
+where tokens are and whether a quote is left open, and that can resume
+where the previous text left off: while typing, every key press only adds
+a character or two to the text tokenized before.
+"""
+import threading
+
+from collections import OrderedDict
+
+from .options import split_command_and_args
+
+WHITESPACE = ' \t\r\n'
+QUOTES = '\'"'
+ESCAPE = '\\'
+
+
+class Tokens(object):
+    """
+    Tokenized command line.
+    """
+
+    __slots__ = ('text', 'words', 'spans', 'quote', 'error', 'command',
+                 'args')
+
+    def __init__(self, text, words, spans, quote=None, error=None):
+        """
+        :param text: string: command line
+        :param words: list of strings: tokens, unquoted and unescaped
+        :param spans: list of (start, end) for each token in text
+        :param quote: string: quote that is left open, or None
+        :param error: string: why shlex.split would fail, or None
+        """
+        self.text = text
+        self.words = words
+        self.spans = spans
+        self.quote = quote
+        self.error = error
+        self.command, self.args = split_command_and_args(words)
+
+    @property
+    def word_before_cursor(self):
+        """
+        Last token as typed, if text ends with it (no whitespace after).
+        :return: string
+        """
+        if self.spans and self.spans[-1][1] == len(self.text):
+            return self.text[self.spans[-1][0]:]
+        return ''
+
+    @property
+    def previous_word(self):
+        """
+        Token before the one being typed.
+        :return: string
+        """
+        index = -2 if self.word_before_cursor else -1
+        if len(self.words) >= -index:
+            return self.words[index]
+        return ''
+
+    def split(self):
+        """
+        Tokens, the way shlex.split returns them.
+        :return: list of strings
+        :raises ValueError: same as shlex.split
+        """
+        if self.error:
+            raise ValueError(self.error)
+        return self.words
+
+
+class Tokenizer(object):
+    """
+    Tokenizer state that can be fed more text. Follows shlex in POSIX mode
+    with whitespace_split and no comments.
+    """
+
+    __slots__ = ('words', 'spans', 'token', 'start', 'state', 'escaped')
+
+    def __init__(self):
+        self.words = []
+        self.spans = []
+        self.token = None
+        self.start = 0
+        self.state = ' '
+        self.escaped = None
+
+    def copy(self):
+        """
+        :return: Tokenizer
+        """
+        other = Tokenizer()
+        other.words = list(self.words)
+        other.spans = list(self.spans)
+        other.token = self.token
+        other.start = self.start
+        other.state = self.state
+        other.escaped = self.escaped
+        return other
+
+    def feed(self, text, position=0):
+        """
+        Tokenize text, starting at position.
+        :param text: string
+        :param position: int
+        """
+        state, token = self.state, self.token
+        for i in range(position, len(text)):
+            c = text[i]
+            if state == ' ':
+                if c in WHITESPACE:
+                    continue
+                self.start, token = i, ''
+                if c == ESCAPE:
+                    state, self.escaped = ESCAPE, 'a'
+                elif c in QUOTES:
+                    state = c
+                else:
+                    state, token = 'a', c
+            elif state == 'a':
+                if c in WHITESPACE:
+                    self.words.append(token)
+                    self.spans.append((self.start, i))
+                    state, token = ' ', None
+                elif c in QUOTES:
+                    state = c
+                elif c == ESCAPE:
+                    state, self.escaped = ESCAPE, 'a'
+                else:
+                    token += c
+            elif state == ESCAPE:
+                # In double quotes, backslash only escapes itself and ".
+                if self.escaped == '"' and c not in (ESCAPE, '"'):
+                    token += ESCAPE
+                token += c
+                state = self.escaped
+            elif c == state:
+                state = 'a'
+            elif state == '"' and c == ESCAPE:
+                state, self.escaped = ESCAPE, '"'
+            else:
+                token += c
+        self.state, self.token = state, token
+
+    def result(self, text):
+        """
+        Tokens of the text fed so far.
+        :param text: string: all text fed
+        :return: Tokens
+        """
+        words, spans = list(self.words), list(self.spans)
+        quote = error = None
+        if self.token is not None:
+            words.append(self.token)
+            spans.append((self.start, len(text)))
+        if self.state in QUOTES:
+            quote = self.state
+            error = 'No closing quotation'
+        elif self.state == ESCAPE:
+            quote = self.escaped if self.escaped in QUOTES else None
+            error = 'No escaped character'
+        return Tokens(text, words, spans, quote, error)
+
+
+CACHE_SIZE = 64
+CACHE = OrderedDict()
+CACHE_LOCK = threading.Lock()
+
+# Text tokenized last and the state at its end, to resume from.
+LAST = ['', Tokenizer()]
+
+
+def tokenize(text):
+    """
+    Tokenize command line. Results for recent lines are remembered, and a
+    line that extends the last one continues from where it ended.
+    :param text: string
+    :return: Tokens
+    """
+    text = text or ''
+    with CACHE_LOCK:
+        tokens = CACHE.get(text)
+        if tokens is not None:
+            CACHE.move_to_end(text)
+            return tokens
+        last_text, last_state = LAST
+
+    if text.startswith(last_text):
+        tokenizer = last_state.copy()
+        tokenizer.feed(text, len(last_text))
+    else:
+        tokenizer = Tokenizer()
+        tokenizer.feed(text)
+    tokens = tokenizer.result(text)
+
+    with CACHE_LOCK:
+        CACHE[text] = tokens
+        while len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+        LAST[:] = [text, tokenizer]
+    return tokens
@@ -5,16 +5,18 @@ Bottom toolbar for the CLI.
 from prompt_toolkit.formatted_text import FormattedText
 
 
-def create_toolbar_handler(is_long_option, is_fuzzy):
+def create_toolbar_handler(is_long_option, is_fuzzy, is_loading=None):
     """
     Create a toolbar handler function.
     :param is_long_option: callable
     :param is_fuzzy: callable
+    :param is_loading: callable: if completions are being loaded
     :return: callable
     """
 
     assert callable(is_long_option)
     assert callable(is_fuzzy)
+    assert is_loading is None or callable(is_loading)
 
     def get_toolbar_items():
         """
@@ -36,11 +38,16 @@ def create_toolbar_handler(is_long_option, is_fuzzy):
             fuzzy_class = 'class:bottom-toolbar.off'
             fuzzy = 'OFF'
 
-        return FormattedText([
+        items = [
             ('class:bottom-toolbar', ' [F2] Help '),
             (option_mode_class, f' [F3] Options: {option_mode} '),
             (fuzzy_class, f' [F4] Fuzzy: {fuzzy} '),
             ('class:bottom-toolbar', ' [F10] Exit ')
-        ])
+        ]
+
+        if is_loading and is_loading():
+            items.append(('class:bottom-toolbar.loading', ' Loading... '))
+
+        return FormattedText(items)
 
     return get_toolbar_items
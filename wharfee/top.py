@@ -0,0 +1,99 @@
+# -*- coding: utf-8
+"""
+Processes of containers for "top", and what changed between two looks at
+them, for "top --watch".
+"""
+from collections import OrderedDict
+
+from .records import Process
+
+
+def processes_from_api(container, data, host=None):
+    """
+    Processes from what the top API returns.
+    :param container: string: name or ID it was asked for by
+    :param data: dict with Titles and Processes
+    :param host: string: name of the Docker host
+    :return: list of Process
+    """
+    titles = tuple(data.get('Titles') or ())
+    return [Process(container, titles, tuple(fields), host)
+            for fields in data.get('Processes') or ()]
+
+
+def by_key(processes):
+    """
+    :param processes: iterable of Process
+    :return: OrderedDict: key -> Process
+    """
+    return OrderedDict((p.key, p) for p in processes)
+
+
+def diff_processes(before, after):
+    """
+    Processes that started, exited and changed, by PID.
+    :param before: OrderedDict: key -> Process
+    :param after: OrderedDict: key -> Process
+    :return: tuple of lists: (started, exited, changed), where changed
+    holds (Process, [(title, old value, new value)])
+    """
+    started = [p for k, p in after.items() if k not in before]
+    exited = [p for k, p in before.items() if k not in after]
+    changed = []
+    for key, process in after.items():
+        old = before.get(key)
+        if old is None or old.fields == process.fields:
+            continue
+        fields = [(title, a, b) for title, a, b in
+                  zip(process.titles, old.fields, process.fields) if a != b]
+        changed.append((process, fields))
+    return started, exited, changed
+
+
+def change_rows(started, exited, changed):
+    """
+    A row per change, with the process: "Change" is "+" for started, "-"
+    for exited and "~" for changed processes. Changed ones also have
+    "Changed": {title: [old value, new value]}.
+    :return: list of dicts
+    """
+    def row(change, process):
+        result = {'Change': change}
+        result.update(process.as_dict())
+        return result
+
+    rows = [row('-', process) for process in exited]
+    rows.extend(row('+', process) for process in started)
+    for process, fields in changed:
+        rows.append(row('~', process))
+        rows[-1]['Changed'] = dict((title, [a, b]) for title, a, b in fields)
+    return rows
+
+
+def format_changes(rows):
+    """
+    One line per change, from change_rows.
+    :param rows: list of dicts
+    :return: list of strings
+    """
+    def name(row):
+        parts = [row['Container'], row.get('PID') or '']
+        if row.get('Host'):
+            parts.insert(0, row['Host'])
+        return ' '.join(parts).rstrip()
+
+    def fields(row):
+        return [v for k, v in row.items()
+                if k not in ('Change', 'Changed', 'Container', 'Host')]
+
+    lines = []
+    for row in rows:
+        if row['Change'] == '-':
+            text = (fields(row) or [''])[-1]
+        elif row['Change'] == '+':
+            text = '  '.join(fields(row))
+        else:
+            text = ', '.join('{0}: {1} -> {2}'.format(title, a, b)
+                             for title, (a, b) in row['Changed'].items())
+        lines.append('{0} {1}  {2}'.format(row['Change'], name(row), text))
+    return lines